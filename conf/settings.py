@@ -102,6 +102,11 @@ INCOMING_EMAIL_USER = env("INCOMING_EMAIL_USER", default="")
 INCOMING_EMAIL_POP3_PORT = env("INCOMING_EMAIL_POP3_PORT", default=None)
 INCOMING_EMAIL_CHECK_LIMIT = env.int("INCOMING_EMAIL_CHECK_LIMIT", default=100)
 
+# Send batches of pop3 TOP/RETR commands without waiting for each response,
+# if the server supports it, when reading the incoming mailboxes.
+POP3_PIPELINING_ENABLED = env.bool("POP3_PIPELINING_ENABLED", default=True)
+POP3_PIPELINE_BATCH_SIZE = env.int("POP3_PIPELINE_BATCH_SIZE", default=20)
+
 HMRC_TO_DIT_EMAIL_PASSWORD = env("HMRC_TO_DIT_EMAIL_PASSWORD", default="")
 HMRC_TO_DIT_EMAIL_HOSTNAME = env("HMRC_TO_DIT_EMAIL_HOSTNAME", default="")
 HMRC_TO_DIT_EMAIL_USER = env("HMRC_TO_DIT_EMAIL_USER", default="")
@@ -49,7 +49,9 @@ class PendingMailHealthCheck(BaseHealthCheckBackend):
 
     def check_status(self):
         dt = timezone.now() - datetime.timedelta(seconds=settings.EMAIL_AWAITING_REPLY_TIME)
-        pending_mails = Mail.objects.exclude(status=ReceptionStatusEnum.REPLY_SENT).filter(sent_at__lte=dt)
+        pending_mails = (
+            Mail.objects.without_payloads().exclude(status=ReceptionStatusEnum.REPLY_SENT).filter(sent_at__lte=dt)
+        )
 
         for pending_mail in pending_mails:
             error_message = f"The following Mail has been pending for over {settings.EMAIL_AWAITING_REPLY_TIME} seconds: {pending_mail}"
@@ -2,7 +2,8 @@ import json
 
 from datetime import datetime
 
-from mail.libraries.chiefprotocol import format_line
+from mail.fields import compress, decompress
+from mail.libraries.chiefprotocol import FIELD_SEP, format_line, tokenise
 from mail.libraries.chieftypes import LicenceDataLine, ForeignTrader, Trader
 
 # Methods to anonymise fields specified in model config yaml file
@@ -13,8 +14,18 @@ def today():
     return datetime.strftime(datetime.today().date(), "%d %B %Y")
 
 
-def sanitize_trader(line):
-    tokens = line.split("\\")
+def from_bytea(value):
+    # The payloads are dumped as the hex of their compressed bytes
+    if value and value.startswith("\\x"):
+        return decompress(bytes.fromhex(value[2:]))
+    return value
+
+
+def to_bytea(value):
+    return "\\x" + compress(value).hex()
+
+
+def sanitize_trader(tokens):
     trader = Trader(*tokens)
     trader.turn = ""
     trader.rpa_trader_id = "GB123456789000"
@@ -31,8 +42,7 @@ def sanitize_trader(line):
     return format_line(trader)
 
 
-def sanitize_foreign_trader(line):
-    tokens = line.split("\\")
+def sanitize_foreign_trader(tokens):
     foreign_trader = ForeignTrader(*tokens)
     foreign_trader.name = "End-user name"
     foreign_trader.address1 = "address line1"
@@ -46,8 +56,7 @@ def sanitize_foreign_trader(line):
     return format_line(foreign_trader)
 
 
-def sanitize_product_line(line):
-    tokens = line.split("\\")
+def sanitize_product_line(tokens):
     line_item = LicenceDataLine(*tokens)
     line_item.goods_description = "PRODUCT NAME"
 
@@ -61,7 +70,11 @@ edi_data_sanitizer = {
 }
 
 
-def sanitize_edi_data(lines):
+def sanitize_edi_data(value):
+    return to_bytea(_sanitize_edi_data(from_bytea(value)))
+
+
+def _sanitize_edi_data(lines):
 
     if not lines:
         return f"{today()}: empty edi data"
@@ -70,13 +83,11 @@ def sanitize_edi_data(lines):
         return f"{today()}: invalid edi data"
 
     output_lines = []
-    for line in lines.split("\n"):
-        tokens = line.split("\\")
-        # skip empty or invalid lines
-        if len(tokens) < 2:
+    for line in tokenise(lines):
+        # skip invalid lines
+        if len(line.fields) < 2:
             continue
-        line_type = tokens[1]
-        output_line = edi_data_sanitizer.get(line_type, lambda x: x)(line)
+        output_line = edi_data_sanitizer.get(line.record_type, FIELD_SEP.join)(line.fields)
 
         output_lines.append(output_line)
 
@@ -84,11 +95,11 @@ def sanitize_edi_data(lines):
 
 
 def sanitize_raw_data(value):
-    return f"{today()}: raw_data contents anonymised"
+    return to_bytea(f"{today()}: raw_data contents anonymised")
 
 
 def sanitize_sent_data(value):
-    return f"{today()}: sent_data contents anonymised"
+    return to_bytea(f"{today()}: sent_data contents anonymised")
 
 
 def sanitize_payload_data(value):
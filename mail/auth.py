@@ -3,10 +3,15 @@ import logging
 import poplib
 
 import msal
+from django.core.cache import cache
 from typing_extensions import Protocol
 
 logger = logging.getLogger(__name__)
 
+# Access tokens are shared between processes using the Django cache and are
+# refreshed this many seconds before they expire.
+ACCESS_TOKEN_EXPIRY_MARGIN = 5 * 60
+
 
 class AuthenticationError(Exception):
     pass
@@ -40,8 +45,13 @@ class ModernAuthentication:
     connection.
 
     https://docs.microsoft.com/en-us/exchange/client-developer/legacy-protocols/how-to-authenticate-an-imap-pop-smtp-application-by-using-oauth
+
+    Access tokens are kept in the Django cache so that every connection in every process
+    can reuse them until shortly before they expire.
     """
 
+    scopes = ["https://outlook.office.com/.default"]
+
     def __init__(
         self,
         user: str,
@@ -53,27 +63,46 @@ class ModernAuthentication:
         self.client_id = client_id
         self.client_secret = client_secret
         self.tenant_id = tenant_id
+        self._app = None
 
-        authority = f"https://login.microsoftonline.com/{tenant_id}"
-        self.app = msal.ConfidentialClientApplication(
-            client_id,
-            authority=authority,
-            client_credential=client_secret,
-        )
+    @property
+    def app(self) -> msal.ConfidentialClientApplication:
+        # Creating the application makes a tenant discovery request so only do it when a token is needed
+        if self._app is None:
+            authority = f"https://login.microsoftonline.com/{self.tenant_id}"
+            self._app = msal.ConfidentialClientApplication(
+                self.client_id,
+                authority=authority,
+                client_credential=self.client_secret,
+            )
+
+        return self._app
+
+    def _get_access_token_cache_key(self):
+        return f"modern-authentication-access-token:{self.tenant_id}:{self.client_id}:{' '.join(self.scopes)}"
 
     def _get_access_token(self):
-        scopes = ["https://outlook.office.com/.default"]
+        cache_key = self._get_access_token_cache_key()
+        access_token = cache.get(cache_key)
+        if access_token:
+            logger.info("Access token found in shared cache")
+            return access_token
 
         logger.info("Attempting to acquire access token silently")
-        result = self.app.acquire_token_silent(scopes, account=None)  # This attempts to get the token from the cache
+        # This attempts to get the token from the msal cache
+        result = self.app.acquire_token_silent(self.scopes, account=None)
         if not result:  # If we don't find the token in the cache then we go off and retrieve it from the provider
             logger.info("Token not found in cache")
-            result = self.app.acquire_token_for_client(scopes=scopes)
+            result = self.app.acquire_token_for_client(scopes=self.scopes)
 
         if "access_token" not in result:
             logger.info(result)
             raise AuthenticationError("No access token found")
 
+        timeout = int(result.get("expires_in", 0)) - ACCESS_TOKEN_EXPIRY_MARGIN
+        if timeout > 0:
+            cache.set(cache_key, result["access_token"], timeout=timeout)
+
         return result["access_token"]
 
     def _encode_access_string(self, username, access_token):
@@ -86,8 +115,14 @@ class ModernAuthentication:
             self.user,
             access_token,
         )
-        connection._shortcmd("AUTH XOAUTH2")
-        connection._shortcmd(access_string)
+        try:
+            connection._shortcmd("AUTH XOAUTH2")
+            connection._shortcmd(access_string)
+        except poplib.error_proto:
+            # Don't let other processes keep using a token the server has rejected
+            logger.info("Access token rejected, removing it from the shared cache")
+            cache.delete(self._get_access_token_cache_key())
+            raise
 
     def __eq__(self, other: Authenticator):
         return (
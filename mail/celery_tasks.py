@@ -1,9 +1,13 @@
+import threading
 import urllib.parse
+from contextlib import contextmanager
+from email.mime.multipart import MIMEMultipart
 from smtplib import SMTPException
-from typing import List, MutableMapping, Tuple
+from typing import List, MutableMapping, Optional, Tuple
 
-from celery import Task, shared_task
+from celery import Signature, Task, shared_task
 from celery.utils.log import get_task_logger
+from celery.utils.time import get_exponential_backoff_interval
 from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
@@ -17,9 +21,13 @@ from mail.libraries.data_processors import build_request_mail_message_dto
 from mail.libraries.email_message_dto import EmailMessageDto
 from mail.libraries.lite_to_edifact_converter import EdifactValidationError
 from mail.libraries.routing_controller import check_and_route_emails, update_mail
-from mail.libraries.usage_data_decomposition import build_json_payload_from_data_blocks, split_edi_data_by_id
+from mail.libraries.usage_data_decomposition import (
+    build_json_payload_from_data_blocks,
+    create_transaction_mappings,
+    get_parsed_usage_file,
+)
 from mail.models import LicenceIdMapping, LicencePayload, Mail, UsageData
-from mail.servers import smtp_send
+from mail.servers import smtp_send, smtp_session
 
 logger = get_task_logger(__name__)
 
@@ -78,6 +86,8 @@ def _log_error(message, lite_usage_data_id):
 MAX_RETRIES = 3
 RETRY_BACKOFF = 180
 LOCK_EXPIRE = 60 * 10  # secs (10 min)
+RETRY_BACKOFF_MAX = 60 * 10  # secs (10 min), the celery default for autoretry tasks
+GLOBAL_SEND_EMAIL_LOCK_ID = "global_send_email_lock"
 CELERY_SEND_LICENCE_UPDATES_TASK_NAME = "mail.celery_tasks.send_licence_details_to_hmrc"
 CELERY_MANAGE_INBOX_TASK_NAME = "mail.celery_tasks.manage_inbox"
 
@@ -122,9 +132,7 @@ def send_email_task(message):
       - If all retries fail then manual intervention may be required (unlikely)
     """
 
-    global_lock_id = "global_send_email_lock"
-
-    with cache.lock(global_lock_id, timeout=LOCK_EXPIRE):
+    with cache.lock(GLOBAL_SEND_EMAIL_LOCK_ID, timeout=LOCK_EXPIRE):
         logger.info("Lock acquired, proceeding to send email from %s to %s", message["From"], message["To"])
 
         try:
@@ -136,6 +144,77 @@ def send_email_task(message):
         logger.info("Email sent successfully to %s", message["To"])
 
 
+@shared_task(
+    bind=True,
+    max_retries=MAX_RETRIES,
+    base=SendEmailBaseTask,
+    serializer="pickle",
+)
+def send_email_batch_task(self, messages: List[Tuple[MIMEMultipart, Optional[Signature]]]):
+    """
+    Sends a batch of emails under a single acquisition of the lock used by send_email_task.
+
+    Each message is paired with an optional callback signature, which is run as soon as that
+    message has been sent, just like the link of a send_email_task. If a message can't be sent
+    the task is retried with only the messages that haven't been sent yet.
+
+    The messages are sent over one SMTP connection, so the TLS and LOGIN handshake is only done
+    once for the batch. The connection is closed before the lock is released.
+    """
+
+    with cache.lock(GLOBAL_SEND_EMAIL_LOCK_ID, timeout=LOCK_EXPIRE), smtp_session():
+        logger.info("Lock acquired, proceeding to send %s emails", len(messages))
+
+        for index, (message, callback) in enumerate(messages):
+            try:
+                smtp_send(message)
+            except (SMTPException, ConnectionResetError) as exc:
+                logger.exception("An unexpected error occurred when sending email")
+                countdown = get_exponential_backoff_interval(
+                    factor=RETRY_BACKOFF, retries=self.request.retries, maximum=RETRY_BACKOFF_MAX, full_jitter=True
+                )
+                raise self.retry(args=(messages[index:],), exc=exc, countdown=countdown)
+
+            logger.info("Email sent successfully to %s", message["To"])
+
+            if callback:
+                callback.apply_async()
+
+
+_outbox = threading.local()
+
+
+@contextmanager
+def batch_send_emails():
+    """
+    Collects the emails queued with queue_email_for_sending inside this block and sends them
+    together in a single send_email_batch_task when the block exits.
+    """
+
+    if getattr(_outbox, "messages", None) is not None:
+        # Already batching, the outermost block sends the emails
+        yield
+        return
+
+    _outbox.messages = []
+    try:
+        yield
+    finally:
+        messages, _outbox.messages = _outbox.messages, None
+        if messages:
+            send_email_batch_task.apply_async(args=(messages,))
+
+
+def queue_email_for_sending(message: MIMEMultipart, callback: Optional[Signature] = None):
+    """Sends the email with send_email_task, or adds it to the current batch if there is one"""
+
+    messages = getattr(_outbox, "messages", None)
+    if messages is None:
+        send_email_task.apply_async(args=(message,), link=callback)
+    else:
+        messages.append((message, callback))
+
+
 # Notify Users of Rejected Mail
 def notify_users_of_rejected_licences(mail_id, mail_response_subject):
     """If a reply is received with rejected licences this task notifies users of the rejection"""
@@ -154,7 +233,7 @@ def notify_users_of_rejected_licences(mail_id, mail_response_subject):
     )
     message = build_licence_rejected_email_message(message_dto)
 
-    send_email_task.apply_async(args=(message,))
+    queue_email_for_sending(message)
 
     logger.info("Successfully notified users of rejected licences found in mail with subject %s", mail_response_subject)
 
@@ -178,7 +257,7 @@ def finalise_sending_spire_licence_details(mail_id, message_dto):
     """Subtask that performs follow-up tasks after completing the primary purpose
     of sending an email"""
 
-    mail = Mail.objects.get(id=mail_id)
+    mail = Mail.objects.without_payloads().get(id=mail_id)
     message_dto = EmailMessageDto(*message_dto)
 
     update_mail(mail, message_dto)
@@ -189,7 +268,7 @@ def finalise_sending_lite_licence_details(mail_id, message_dto, licence_payload_
     """Subtask that performs follow-up tasks after completing the primary purpose
     of sending an email"""
 
-    mail = Mail.objects.get(id=mail_id)
+    mail = Mail.objects.without_payloads().get(id=mail_id)
     message_dto = EmailMessageDto(*message_dto)
 
     update_mail(mail, message_dto)
@@ -291,7 +370,8 @@ def send_licence_usage_figures_to_lite_api(lite_usage_data_id):
         raise
 
     # Extract usage details of Licences issued from LITE
-    _, data = split_edi_data_by_id(lite_usage_data.mail.edi_data, lite_usage_data)
+    data = get_parsed_usage_file(lite_usage_data).lite_blocks
+    create_transaction_mappings(lite_usage_data, data)
     payload = build_json_payload_from_data_blocks(data)
 
     # We only process usage data for active licences so below error is unlikely
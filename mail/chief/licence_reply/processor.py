@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional, Union
 
 from mail.enums import ExtractTypeEnum, ReceptionStatusEnum
 from mail.libraries import chiefprotocol
@@ -36,8 +36,15 @@ class LicenceReplyProcessor:
         FileTrailer.record_type: FileTrailer,
     }
 
-    def __init__(self, data: str) -> None:
+    def __init__(self, data: str, lazy: bool = False) -> None:
+        """Load the licence reply data.
+
+        With `lazy` the data isn't parsed up front, the transactions are parsed
+        one at a time by iterating over `iter_transactions()` instead.
+        """
         self._valid = False
+        self._data = data
+        self._lazy = lazy
 
         # File attributes
         self.file_header: Optional[FileHeader] = None
@@ -48,13 +55,18 @@ class LicenceReplyProcessor:
         self._accepted: List[AcceptedTransaction] = []
         self._rejected: List[RejectedTransaction] = []
 
+        # Running counts of transactions, used to check the file trailer
+        self.accepted_count = 0
+        self.rejected_count = 0
+
         # Used when iterating over rejected applications
         self._current_rejected = None
 
-        self._load_licence_reply_data(data)
+        if not lazy:
+            self._load_licence_reply_data()
 
     @classmethod
-    def load_from_mail(cls, mail: Mail) -> "LicenceReplyProcessor":
+    def load_from_mail(cls, mail: Mail, lazy: bool = False) -> "LicenceReplyProcessor":
         if mail.extract_type != ExtractTypeEnum.LICENCE_DATA:
             raise ValueError(
                 f"Error with Mail ({mail.id} - {mail.response_subject}): Invalid extract type {mail.extract_type}"
@@ -63,7 +75,7 @@ class LicenceReplyProcessor:
         if mail.status != ReceptionStatusEnum.REPLY_RECEIVED:
             raise ValueError(f"Error with Mail ({mail.id} - {mail.response_subject}): Invalid status {mail.status}")
 
-        return cls(mail.response_data)
+        return cls(mail.response_data, lazy=lazy)
 
     @property
     def accepted_licences(self) -> List[AcceptedTransaction]:
@@ -77,19 +89,50 @@ class LicenceReplyProcessor:
 
         return self._rejected
 
-    def _load_licence_reply_data(self, reply_data: str) -> None:
+    def iter_transactions(
+        self, stop_on_file_error: bool = False
+    ) -> Iterator[Union[AcceptedTransaction, RejectedTransaction]]:
+        """Parse the reply data a line at a time, yielding each transaction once it is complete.
+
+        The file header, file errors and file trailer are kept as they are parsed,
+        along with the counts of accepted and rejected transactions, so the file
+        can be validated once the iteration has finished. With `stop_on_file_error`
+        parsing stops at the first file error, as the file is invalid anyway.
+        """
+        self.file_header = None
+        self.file_errors = []
+        self.file_trailer = None
+        self.accepted_count = 0
+        self.rejected_count = 0
+        self._current_rejected = None
+
+        for line in chiefprotocol.tokenise(self._data):
+            transaction = self._process_line(line)
+
+            if transaction is not None:
+                yield transaction
+
+            if stop_on_file_error and self.file_errors:
+                return
+
+    def _load_licence_reply_data(self) -> None:
         """Load the licence reply data."""
 
-        for line in filter(None, reply_data.split(chiefprotocol.LINE_SEP)):
-            self._process_line(line)
+        for transaction in self.iter_transactions():
+            if isinstance(transaction, AcceptedTransaction):
+                self._accepted.append(transaction)
+            else:
+                self._rejected.append(transaction)
 
-    def _process_line(self, line: str) -> None:
-        """Process the reply data line into the correct chief type."""
+    def _process_line(self, line: chiefprotocol.Line) -> Union[AcceptedTransaction, RejectedTransaction, None]:
+        """Process the reply data line into the correct chief type.
 
-        line_no: int
-        field_type: str
-        record_args: List[Any]
-        line_no, field_type, *record_args = line.split(chiefprotocol.FIELD_SEP)
+        Returns the transaction the line completes, if any.
+        """
+
+        line_no: str = line.fields[0]
+        field_type: str = line.record_type
+        record_args: List[Any] = line.fields[2:]
 
         try:
             record = self.LINE_MAP[field_type](*record_args)
@@ -103,7 +146,9 @@ class LicenceReplyProcessor:
             self.file_errors.append(record)
 
         elif field_type == AcceptedTransaction.record_type:
-            self._accepted.append(record)
+            self.accepted_count += 1
+
+            return record
 
         elif field_type == RejectedTransactionHeader.record_type:
             # Create a new current rejected value (rejected transaction spans multiple lines)
@@ -119,27 +164,37 @@ class LicenceReplyProcessor:
                 raise ValueError(f"Unable to process file: rejected record is out of sequence on line {line_no}")
 
             self._current_rejected.end = record
-
-            # Add the complete current rejected to the list of rejected transactions
-            self._rejected.append(self._current_rejected)
+            rejected = self._current_rejected
+            self.rejected_count += 1
 
             # Reset current rejected
             self._current_rejected = None
 
+            return rejected
+
         elif field_type == FileTrailer.record_type:  # pragma: no cover
             self.file_trailer = record
 
+        return None
+
     def file_valid(self) -> bool:
         self._valid = not self.file_errors and self.file_trailer_valid()
 
         return self._valid
 
     def file_trailer_valid(self) -> bool:
-        accepted_match = len(self._accepted) == int(self.file_trailer.accepted_count)
-        rejected_match = len(self._rejected) == int(self.file_trailer.rejected_count)
+        # The trailer is missing when the file is incomplete, or parsing stopped at a file error
+        if not self.file_trailer:
+            return False
+
+        accepted_match = self.accepted_count == int(self.file_trailer.accepted_count)
+        rejected_match = self.rejected_count == int(self.file_trailer.rejected_count)
 
         return accepted_match and rejected_match
 
     def _check_is_valid(self, action) -> None:
+        if self._lazy:
+            raise ValueError(f"Unable to get {action} when the file is loaded lazily, use iter_transactions instead")
+
         if not self._valid:
             raise ValueError(f"Unable to get {action} when file hasn't been validated or is invalid")
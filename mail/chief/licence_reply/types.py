@@ -1,6 +1,7 @@
-from dataclasses import dataclass
 from typing import ClassVar
 
+from mail.libraries.chieftypes import record
+
 """
 ---------------------
 Generic Record Structure
@@ -60,7 +61,7 @@ Level       Record                          Presence        Notes
 """
 
 
-@dataclass
+@record
 class FileHeader:
     """The reply file header.
 
@@ -81,7 +82,7 @@ class FileHeader:
     run_num: int
 
 
-@dataclass
+@record
 class FileError:
     """The file error record identifies an error in the overall structure of the input file or a run sequence error.
 
@@ -99,7 +100,7 @@ class FileError:
     position: str
 
 
-@dataclass
+@record
 class AcceptedTransaction:
     """The accepted transaction record is returned when the input transaction is accepted and has been full processed.
 
@@ -112,7 +113,7 @@ class AcceptedTransaction:
     transaction_ref: str
 
 
-@dataclass
+@record
 class RejectedTransactionHeader:
     """The rejected transaction structure is used when the input transaction is rejected.
 
@@ -127,7 +128,7 @@ class RejectedTransactionHeader:
     transaction_ref: str
 
 
-@dataclass
+@record
 class RejectedTransactionError:
     """A transaction error record identifies an error in the transaction data.
 
@@ -143,7 +144,7 @@ class RejectedTransactionError:
     text: str
 
 
-@dataclass
+@record
 class RejectedTransactionTrailer:
     """Trailer record for rejected transaction.
 
@@ -159,7 +160,7 @@ class RejectedTransactionTrailer:
     record_count: int
 
 
-@dataclass
+@record
 class FileTrailer:
     """Signifies end of the file.
 
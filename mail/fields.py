@@ -0,0 +1,45 @@
+import gzip
+
+from django.db import models
+
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+
+
+def compress(value: str) -> bytes:
+    # The modification time is left out of the header so the same text is always compressed to the same bytes,
+    # which lets exact lookups compare the compressed values
+    return gzip.compress(value.encode("utf-8"), mtime=0)
+
+
+def decompress(value: bytes) -> str:
+    value = bytes(value)
+    if is_compressed(value):
+        value = gzip.decompress(value)
+    # Values that aren't compressed, such as text written to the column by hand, are plain UTF-8
+    return value.decode("utf-8")
+
+
+def is_compressed(value: bytes) -> bool:
+    return bytes(value[:2]) == GZIP_MAGIC_NUMBER
+
+
+class CompressedTextField(models.TextField):
+    """Text that is compressed with gzip and stored in a bytea column.
+
+    It is used like a TextField, but only exact, in and isnull lookups work on it
+    as the database only has the compressed bytes to compare.
+    """
+
+    def db_type(self, connection):
+        return "bytea"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return value
+        return connection.Database.Binary(compress(value))
@@ -3,7 +3,7 @@
 import email
 import logging
 from email.headerregistry import Address, UniqueAddressHeader
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Tuple, Union
 from urllib import parse
 
 import requests
@@ -14,6 +14,8 @@ from django.utils import timezone
 from mail import requests as mail_requests
 from mail.auth import Authenticator, BasicAuthentication
 from mail.chief.licence_reply import LicenceReplyProcessor
+from mail.chief.licence_reply.processor import RejectedTransaction
+from mail.chief.licence_reply.types import AcceptedTransaction
 from mail.enums import ExtractTypeEnum, ReceptionStatusEnum
 from mail.models import LicenceData, Mail
 from mail.utils import pop3
@@ -82,7 +84,10 @@ def send_licence_data_to_icms():
 
     mail = licence_reply_mail_qs.select_for_update().first()
 
-    processor = LicenceReplyProcessor.load_from_mail(mail)
+    processor = LicenceReplyProcessor.load_from_mail(mail, lazy=True)
+
+    # Stream the transactions, as the file is rejected without them at the first file error
+    accepted, rejected = _get_licence_reply_transactions(processor.iter_transactions(stop_on_file_error=True))
 
     if not processor.file_valid():
         error_msg = f"Unable to process mail (id: {mail.id}, filename: {mail.response_filename}) as it has file errors."
@@ -96,12 +101,12 @@ def send_licence_data_to_icms():
                 file_error.text,
             )
 
-        if not processor.file_trailer_valid():
+        if processor.file_trailer and not processor.file_trailer_valid():
             logger.warning("File trailer count is different from processor count of accepted and rejected")
 
         raise ValueError(error_msg)
 
-    licence_reply_data = _get_licence_reply_data(processor)
+    licence_reply_data = _get_licence_reply_data(processor, accepted, rejected)
 
     url = parse.urljoin(settings.ICMS_API_URL, "chief/license-data-callback")
     response: requests.Response = mail_requests.post(
@@ -124,7 +129,9 @@ def send_licence_data_to_icms():
     logger.info(f"Successfully sent mail (id: {mail.id}, filename: {mail.response_filename}) to ICMS for processing")
 
 
-def _get_licence_reply_data(processor: LicenceReplyProcessor) -> Dict[str, Any]:
+def _get_licence_reply_data(
+    processor: LicenceReplyProcessor, accepted: List[str], rejected: List[Tuple[str, List[Dict[str, str]]]]
+) -> Dict[str, Any]:
     # Load all LicencePayload records linked to the current LicenceData record
     ld: LicenceData = LicenceData.objects.get(hmrc_run_number=processor.file_header.run_num)
     current_licences = ld.licence_payloads.all().values_list("lite_id", "reference", named=True)
@@ -134,19 +141,31 @@ def _get_licence_reply_data(processor: LicenceReplyProcessor) -> Dict[str, Any]:
 
     licence_reply_data = {
         "run_number": processor.file_header.run_num,
-        "accepted": [{"id": id_map[at.transaction_ref]} for at in processor.accepted_licences],
-        "rejected": [
-            {
-                "id": id_map[rt.header.transaction_ref],
-                "errors": [{"error_code": error.code, "error_msg": error.text} for error in rt.errors],
-            }
-            for rt in processor.rejected_licences
-        ],
+        "accepted": [{"id": id_map[transaction_ref]} for transaction_ref in accepted],
+        "rejected": [{"id": id_map[transaction_ref], "errors": errors} for transaction_ref, errors in rejected],
     }
 
     return licence_reply_data
 
 
+def _get_licence_reply_transactions(
+    transactions: Iterable[Union[AcceptedTransaction, RejectedTransaction]]
+) -> Tuple[List[str], List[Tuple[str, List[Dict[str, str]]]]]:
+    """Keep only what ICMS needs from each transaction: the accepted transaction
+    references, and the rejected transaction references with their errors."""
+    accepted = []
+    rejected = []
+
+    for licence_transaction in transactions:
+        if isinstance(licence_transaction, AcceptedTransaction):
+            accepted.append(licence_transaction.transaction_ref)
+        else:
+            errors = [{"error_code": error.code, "error_msg": error.text} for error in licence_transaction.errors]
+            rejected.append((licence_transaction.header.transaction_ref, errors))
+
+    return accepted, rejected
+
+
 #
 #
 # def send_usage_data_to_icms():
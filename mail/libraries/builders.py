@@ -1,5 +1,4 @@
 import datetime
-import json
 import logging
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
@@ -15,7 +14,7 @@ from mail.libraries.combine_usage_replies import combine_lite_and_spire_usage_re
 from mail.libraries.email_message_dto import EmailMessageDto
 from mail.libraries.helpers import convert_source_to_sender
 from mail.libraries.lite_to_edifact_converter import licences_to_edifact
-from mail.libraries.usage_data_decomposition import build_edifact_file_from_data_blocks, split_edi_data_by_id
+from mail.libraries.usage_data_decomposition import build_edifact_file_from_data_blocks, get_parsed_usage_file
 from mail.models import LicenceData, Mail, UsageData
 
 logger = logging.getLogger(__name__)
@@ -46,7 +45,7 @@ def build_request_mail_message_dto(mail: Mail) -> EmailMessageDto:
         receiver = settings.SPIRE_ADDRESS
         update = UsageData.objects.get(mail=mail)
         run_number = update.spire_run_number
-        spire_data, _ = split_edi_data_by_id(mail.edi_data)
+        spire_data = get_parsed_usage_file(update).spire_blocks
         if len(spire_data) > 2:  # if SPIRE blocks contain more than just a header & footer
             file = build_edifact_file_from_data_blocks(spire_data)
             attachment = [
@@ -97,7 +96,7 @@ def _build_request_mail_message_dto_internal(mail: Mail) -> EmailMessageDto:
         receiver = settings.SPIRE_ADDRESS
         update = UsageData.objects.get(mail=mail)
         run_number = update.spire_run_number
-        spire_data, _ = split_edi_data_by_id(mail.edi_data)
+        spire_data = get_parsed_usage_file(update).spire_blocks
         if len(spire_data) > 2:  # if SPIRE blocks contain more than just a header & footer
             file = build_edifact_file_from_data_blocks(spire_data)
             attachment = [
@@ -215,13 +214,14 @@ def build_licence_data_mail(licences: "QuerySet[LicencePayload]", source: Source
         raw_data="See Licence Payload",
     )
     logger.info("New Mail instance (%s) created for filename %s", mail.id, file_name)
-    licence_ids = json.dumps([licence.reference for licence in licences])
+    licence_ids = [licence.reference for licence in licences]
     licence_data = LicenceData.objects.create(
         hmrc_run_number=run_number, source=source, mail=mail, licence_ids=licence_ids
     )
 
     # Keep a reference of all licence_payloads linked to this LicenceData instance
     licence_data.licence_payloads.set(licences)
+    licence_data.create_licence_references()
 
     return mail
 
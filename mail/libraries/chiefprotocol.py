@@ -10,6 +10,9 @@
 
 
 import dataclasses
+import functools
+import io
+import operator
 import typing
 
 from . import chieftypes
@@ -18,47 +21,95 @@ FIELD_SEP = "\\"  # A single back-slash character.
 LINE_SEP = "\n"
 
 
-def resolve_line_numbers(lines: typing.Sequence[chieftypes._Record]) -> list:
-    """Add line numbers for a CHIEF message.
+class Line(typing.NamedTuple):
+    """A line of a CHIEF file, split into its fields.
+
+    `lineno` is the position of the line in the file, starting at 1, and
+    `fields` are all the fields of the line, starting with the line number as
+    it is written in the file.
+    """
+
+    lineno: int
+    record_type: str
+    fields: typing.List[str]
+
+
+def tokenise(data: str) -> typing.Iterator[Line]:
+    """Split a CHIEF file into lines, one line at a time.
+
+    Surrounding whitespace (such as the carriage return of a "\\r\\n" line
+    ending) is removed and blank lines are skipped.
+    """
+    for lineno, text in enumerate(io.StringIO(data, newline=LINE_SEP), start=1):
+        text = text.strip()
+        if not text:
+            continue
+
+        fields = text.split(FIELD_SEP)
+        yield Line(lineno, fields[1] if len(fields) > 1 else "", fields)
+
+
+def iter_line_numbers(lines: typing.Iterable[chieftypes._Record]) -> typing.Iterator[chieftypes._Record]:
+    """Add line numbers for a CHIEF message, one line at a time.
 
     For "end" lines, we keep track of the number of lines since the matching
-    opening line type, and add that number to the end of the line.
+    opening line type, and add that number to the end of the line. Only the
+    most recent line number for each line type is kept, so this works on a
+    stream of lines of any length.
     """
     starts = {}
-    result = []
 
     for lineno, line in enumerate(lines, start=1):
         # Track the most recent line number for each line type.
         starts[line.type_] = lineno
         line.lineno = lineno
 
-        if line.type_ == chieftypes.End.type_:
+        if line.type_ == chieftypes.End.record_type:
             # End lines are like ("end", <start-type>). Find the number of
             # lines since the <start-type> line, add that to the end line
             # like ("end", <start-type>, <distance>).
             line.record_count = (lineno - starts[line.start_record_type]) + 1
 
-        result.append(line)
+        yield line
 
-    return result
+
+def resolve_line_numbers(lines: typing.Sequence[chieftypes._Record]) -> list:
+    """Add line numbers for a CHIEF message."""
+    return list(iter_line_numbers(lines))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_field_getter(record_class: type) -> typing.Callable[[typing.Any], tuple]:
+    """Make the function that gets the values of the fields of a record type, in order."""
+    getter = operator.attrgetter(*(field.name for field in dataclasses.fields(record_class)))
+
+    if len(dataclasses.fields(record_class)) == 1:
+        # attrgetter returns the value itself rather than a tuple for a single field.
+        return lambda record: (getter(record),)
+
+    return getter
+
+
+def field_values(record: typing.Any) -> tuple:
+    """The values of the fields of a record, in order.
+
+    Unlike `dataclasses.astuple` the values aren't deep-copied.
+    """
+    return _get_field_getter(type(record))(record)
 
 
 def format_line(line: chieftypes._Record) -> str:
     """Format a line, with `None` values as the empty string."""
-    values = dataclasses.astuple(line)
-    return FIELD_SEP.join("" if v is None else str(v) for v in values)
+    return FIELD_SEP.join("" if v is None else str(v) for v in field_values(line))
 
 
 def format_lines(lines: typing.Sequence[chieftypes._Record]) -> str:
     """Format the sequence of line tuples as 1 complete string."""
-    lines = resolve_line_numbers(lines)
-    formatted_lines = [format_line(line) for line in lines]
-
-    return LINE_SEP.join(formatted_lines) + LINE_SEP
+    return LINE_SEP.join(format_line(line) for line in iter_line_numbers(lines)) + LINE_SEP
 
 
 def count_transactions(lines: typing.Sequence[chieftypes._Record]) -> int:
     """Count of licence transactions, for use on the `fileTrailer` line."""
     # A transaction is any line  with "licence" as the first field (ignoring
     # line numbers).
-    return sum(line.type_ == chieftypes.Licence.type_ for line in lines)
+    return sum(line.type_ == chieftypes.Licence.record_type for line in lines)
@@ -1,21 +1,49 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, fields
+from typing import ClassVar, Optional, Type, TypeVar
 
 # These types represent the structure of records in a CHIEF message. A message
 # is one of licenceData, licenceReply, usageData, or usageReply types.
 
+T = TypeVar("T")
+
+
+def record(cls: Type[T]) -> Type[T]:
+    """A dataclass with `__slots__` for its fields instead of a `__dict__`.
+
+    There is a record for every line of a message, so this keeps them small. It
+    does what `dataclass(slots=True)` does on Python 3.10 and later, the class
+    is recreated with the slots, as they can't be added to an existing class.
+    """
+    cls = dataclass(cls)
+    field_names = [field.name for field in fields(cls)]
+    inherited_slots = {name for base in cls.__mro__[1:] for name in getattr(base, "__slots__", ())}
+
+    # The field defaults are kept by the generated __init__, the class attributes would hide the slots.
+    cls_dict = {
+        name: value
+        for name, value in cls.__dict__.items()
+        if name not in field_names and name not in ("__dict__", "__weakref__")
+    }
+    cls_dict["__slots__"] = tuple(name for name in field_names if name not in inherited_slots)
+
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
 
 # Every line in a message starts with a line number, and then the record type.
-@dataclass
+@record
 class _Record:
+    # The record type of each class, the default of its type_ field.
+    record_type: ClassVar[Optional[str]] = None
+
     lineno: Optional[int] = None
-    type_: Optional[str] = None
+    type_: Optional[str] = record_type
 
 
 # Every message starts and ends with the file header.
-@dataclass
+@record
 class FileHeader(_Record):
-    type_: Optional[str] = "fileHeader"
+    record_type: ClassVar[str] = "fileHeader"
+    type_: Optional[str] = record_type
 
     # System that generates the input file. Required.
     source_system: Optional[str] = None
@@ -39,9 +67,10 @@ class FileHeader(_Record):
     reset_run_num: Optional[str] = None
 
 
-@dataclass
+@record
 class FileTrailer(_Record):
-    type_: Optional[str] = "fileTrailer"
+    record_type: ClassVar[str] = "fileTrailer"
+    type_: Optional[str] = record_type
     transaction_count: Optional[int] = None
     # The spec also allows a hash_total field, but this implementation
     # flags that as an error when validating.
@@ -49,17 +78,19 @@ class FileTrailer(_Record):
 
 
 # Several types have a matching "end" line.
-@dataclass
+@record
 class End(_Record):
-    type_: Optional[str] = "end"
+    record_type: ClassVar[str] = "end"
+    type_: Optional[str] = record_type
     start_record_type: Optional[str] = None
     record_count: Optional[int] = None
 
 
 # Licence data (request).
-@dataclass
+@record
 class Licence(_Record):
-    type_: Optional[str] = "licence"
+    record_type: ClassVar[str] = "licence"
+    type_: Optional[str] = record_type
 
     # Required for insert, replace, cancel.
     transaction_ref: Optional[str] = None
@@ -87,9 +118,10 @@ class Licence(_Record):
     end_date: Optional[str] = None
 
 
-@dataclass
+@record
 class Trader(_Record):
-    type_: Optional[str] = "trader"
+    record_type: ClassVar[str] = "trader"
+    type_: Optional[str] = record_type
 
     # Must be given if RPATraderId is null.  If given must be known to CHIEF.
     # If "PR" or "UNREG" then name and address must be supplied.
@@ -114,9 +146,10 @@ class Trader(_Record):
     postcode: Optional[str] = None
 
 
-@dataclass
+@record
 class Country(_Record):
-    type_: Optional[str] = "country"
+    record_type: ClassVar[str] = "country"
+    type_: Optional[str] = record_type
 
     # Null if group given.
     code: Optional[str] = None
@@ -133,9 +166,10 @@ class Country(_Record):
     use: Optional[str] = None
 
 
-@dataclass
+@record
 class ForeignTrader(_Record):
-    type_: Optional[str] = "foreignTrader"
+    record_type: ClassVar[str] = "foreignTrader"
+    type_: Optional[str] = record_type
 
     # Stored as up to 3 lines of 35 characters on CHIEF.
     name: Optional[str] = None
@@ -148,20 +182,22 @@ class ForeignTrader(_Record):
     country: Optional[str] = None
 
 
-@dataclass
+@record
 class Restrictions(_Record):
-    type_: Optional[str] = "restrictions"
+    record_type: ClassVar[str] = "restrictions"
+    type_: Optional[str] = record_type
     text: Optional[str] = None
 
 
-@dataclass
+@record
 class LicenceDataLine(_Record):
     """The `line` data in a licence data (request) message.
 
     This is not the same as the `line` record in a usage data message.
     """
 
-    type_: Optional[str] = "line"
+    record_type: ClassVar[str] = "line"
+    type_: Optional[str] = record_type
     line_num: Optional[int] = None
 
     # Must be null if commodityGroup is supplied.
@@ -222,9 +258,10 @@ class LicenceDataLine(_Record):
 
 
 # Licence usage message.
-@dataclass
+@record
 class LicenceUsage(_Record):
-    type_: Optional[str] = "usage"
+    record_type: ClassVar[str] = "usage"
+    type_: Optional[str] = record_type
 
     # Identifies the transaction uniquely as follows:
     # LU<run number>/<transaction sequence number>
@@ -246,11 +283,12 @@ class LicenceUsage(_Record):
     completion_date: Optional[str] = None
 
 
-@dataclass
+@record
 class LicenceUsageLine(_Record):
     """For use in a licence usage message (not a licence transaction)."""
 
-    type_: Optional[str] = "line"
+    record_type: ClassVar[str] = "line"
+    type_: Optional[str] = record_type
 
     # Line number from the Licence Line when originally notified to CHIEF.
     line_num: Optional[int] = None
@@ -265,9 +303,10 @@ class LicenceUsageLine(_Record):
     currency: Optional[str] = None
 
 
-@dataclass
+@record
 class Usage(_Record):
-    type_: Optional[str] = "usage"
+    record_type: ClassVar[str] = "usage"
+    type_: Optional[str] = record_type
     # Types are:
     # "A" Adjusted by Customs;
     # "C" Contra by Customs;
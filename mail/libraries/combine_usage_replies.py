@@ -1,17 +1,66 @@
 import logging
+import uuid
+from collections import defaultdict
 
 from django.utils import timezone
 
+from mail.libraries.usage_data_decomposition import get_parsed_usage_file
 from mail.models import GoodIdMapping, LicenceIdMapping, TransactionMapping, UsageData
 
 
+class UsageMappings:
+    """The mappings needed to reply to a usage file, loaded with one query per model.
+
+    Lookups raise the same exceptions as `.get()` on the model would, when there
+    is no mapping or more than one.
+    """
+
+    def __init__(self, usage_data: UsageData, licence_ids: set):
+        self.licence_references = defaultdict(list)
+        for lite_id, reference in LicenceIdMapping.objects.filter(lite_id__in=licence_ids).values_list(
+            "lite_id", "reference"
+        ):
+            self.licence_references[lite_id].append(reference)
+
+        self.good_line_numbers = defaultdict(list)
+        references = {reference for references in self.licence_references.values() for reference in references}
+        for reference, lite_id, line_number in GoodIdMapping.objects.filter(
+            licence_reference__in=references
+        ).values_list("licence_reference", "lite_id", "line_number"):
+            self.good_line_numbers[(reference, lite_id)].append(line_number)
+
+        self.usage_transactions = defaultdict(list)
+        for reference, line_number, usage_transaction in TransactionMapping.objects.filter(
+            usage_data=usage_data
+        ).values_list("licence_reference", "line_number", "usage_transaction"):
+            self.usage_transactions[(reference, line_number)].append(usage_transaction)
+
+    @staticmethod
+    def _get(index, model, key):
+        values = index.get(key, [])
+        if not values:
+            raise model.DoesNotExist(f"{model.__name__} matching {key} does not exist.")
+        if len(values) > 1:
+            raise model.MultipleObjectsReturned(f"More than one {model.__name__} matching {key}.")
+        return values[0]
+
+    def get_licence_reference(self, licence_id: str) -> str:
+        return self._get(self.licence_references, LicenceIdMapping, uuid.UUID(licence_id))
+
+    def get_good_line_number(self, licence_reference: str, good_id: str) -> int:
+        return self._get(self.good_line_numbers, GoodIdMapping, (licence_reference, uuid.UUID(good_id)))
+
+    def get_usage_transaction(self, licence_reference: str, line_number: int = None) -> str:
+        return self._get(self.usage_transactions, TransactionMapping, (licence_reference, line_number))
+
+
 def combine_lite_and_spire_usage_responses(mail) -> str:  # noqa
     usage_data = UsageData.objects.get(mail=mail)
     lite_response = usage_data.lite_response
     spire_response = mail.response_data
-    edi_lines = mail.edi_data.split("\n")
 
-    edifact_file = ""
+    edifact_lines = []
+    counts = defaultdict(int)
     i = 1
 
     if spire_response:
@@ -20,90 +69,69 @@ def combine_lite_and_spire_usage_responses(mail) -> str:  # noqa
         for line in spire_lines:
             if "fileTrailer" in line:
                 break
-            edifact_file += line + "\n"
+            edifact_lines.append(line)
+            tokens = line.split("\\")
+            if len(tokens) > 1:
+                counts[tokens[1]] += 1
             i += 1
     else:
         now = timezone.now()
         time_stamp = "{:04d}{:02d}{:02d}{:02d}{:02d}".format(now.year, now.month, now.day, now.hour, now.minute)
         mail.response_filename = "SPIRE_live_CHIEF_usageReply_<run-number>_{}".format(time_stamp)
         mail.save()
-        edifact_file = "1\\fileHeader\\SPIRE\\CHIEF\\usageReply\\{}\\<run-number>\n".format(time_stamp)
+        edifact_lines.append("1\\fileHeader\\SPIRE\\CHIEF\\usageReply\\{}\\<run-number>".format(time_stamp))
 
     if lite_response:
-        if lite_response.get("licences").get("accepted"):
-            for licence in lite_response.get("licences").get("accepted"):
-                logging.debug("Found accepted licences in response with goods %s", licence.get("goods"))
-                if licence.get("goods"):
-                    for good in licence.get("goods"):
-                        licence_reference = LicenceIdMapping.objects.get(lite_id=licence["id"]).reference
-                        good_mapping = GoodIdMapping.objects.get(
-                            licence_reference=licence_reference, lite_id=good["id"]
-                        )
-                        logging.debug(
-                            "Trying to find transaction mapping with %s, %s, %s",
-                            licence_reference,
-                            good_mapping.line_number,
-                            usage_data,
-                        )
-                        transaction_id = TransactionMapping.objects.get(
-                            licence_reference=licence_reference,
-                            line_number=good_mapping.line_number,
-                            usage_data=usage_data,
-                        ).usage_transaction
-                        edifact_file += "{}\\accepted\\{}\n".format(i, transaction_id)
-                        i += 1
-                        break
-                else:
-                    licence_reference = LicenceIdMapping.objects.get(lite_id=licence["id"]).reference
-                    transaction_id = TransactionMapping.objects.get(
-                        licence_reference=licence_reference,
-                        line_number=None,
-                        usage_data=usage_data,
-                    ).usage_transaction
-                    edifact_file += "{}\\accepted\\{}\n".format(i, transaction_id)
-                    i += 1
-
-        if lite_response.get("licences").get("rejected"):
-            for licence in lite_response.get("licences").get("rejected"):
-                for good in licence.get("goods").get("rejected"):
-                    licence_reference = LicenceIdMapping.objects.get(lite_id=licence["id"]).reference
-                    good_mapping = GoodIdMapping.objects.get(licence_reference=licence_reference, lite_id=good["id"])
-                    transaction = TransactionMapping.objects.get(
-                        licence_reference=licence_reference,
-                        line_number=good_mapping.line_number,
-                        usage_data=usage_data,
-                    )
-                    transaction_id = transaction.usage_transaction
-                    start_line = i - 1
-                    edifact_file += "{}\\rejected\\{}\n".format(i, transaction_id)
-                    i += 1
-                    error_text = good["errors"]["id"][0] + " in line "
-                    j = 0
-                    correct_transaction = False
-                    error_line = ""
-                    for line in edi_lines:
-                        j += 1
-                        if "licenceUsage" in line:
-                            if transaction_id in line:
-                                correct_transaction = True
-                            else:
-                                correct_transaction = False
-
-                        if "line" in line and correct_transaction:
-                            if line.split("\\")[2] == str(transaction.line_number):
-                                error_line = str(j)
-
-                    edifact_file += "{}\\error\\{}\\{}\n".format(i, i, error_text + error_line)
-                    i += 1
-                    edifact_file += "{}\\end\\rejected\\{}\n".format(i, i - start_line)
-                    i += 1
-                    break
+        accepted_licences = lite_response.get("licences").get("accepted") or []
+        rejected_licences = lite_response.get("licences").get("rejected") or []
+        mappings = UsageMappings(
+            usage_data, {uuid.UUID(licence["id"]) for licence in accepted_licences + rejected_licences}
+        )
+
+        for licence in accepted_licences:
+            logging.debug("Found accepted licences in response with goods %s", licence.get("goods"))
+            licence_reference = mappings.get_licence_reference(licence["id"])
+            if licence.get("goods"):
+                # Only the first good is needed to find the transaction
+                good = licence["goods"][0]
+                line_number = mappings.get_good_line_number(licence_reference, good["id"])
+                logging.debug(
+                    "Trying to find transaction mapping with %s, %s, %s",
+                    licence_reference,
+                    line_number,
+                    usage_data,
+                )
+                transaction_id = mappings.get_usage_transaction(licence_reference, line_number)
+            else:
+                transaction_id = mappings.get_usage_transaction(licence_reference)
+
+            edifact_lines.append("{}\\accepted\\{}".format(i, transaction_id))
+            counts["accepted"] += 1
+            i += 1
+
+        usage_line_numbers = get_parsed_usage_file(usage_data).line_numbers if rejected_licences else {}
+        for licence in rejected_licences:
+            for good in licence.get("goods").get("rejected"):
+                licence_reference = mappings.get_licence_reference(licence["id"])
+                line_number = mappings.get_good_line_number(licence_reference, good["id"])
+                transaction_id = mappings.get_usage_transaction(licence_reference, line_number)
+                start_line = i - 1
+                edifact_lines.append("{}\\rejected\\{}".format(i, transaction_id))
+                counts["rejected"] += 1
+                i += 1
+                error_text = good["errors"]["id"][0] + " in line "
+                error_line = str(usage_line_numbers.get(transaction_id, {}).get(str(line_number), ""))
+                edifact_lines.append("{}\\error\\{}\\{}".format(i, i, error_text + error_line))
+                i += 1
+                edifact_lines.append("{}\\end\\rejected\\{}".format(i, i - start_line))
+                i += 1
+                break
 
     file_trailer = "{}\\fileTrailer\\{}\\{}\\{}".format(
         i,
-        edifact_file.count("accepted"),
-        int(edifact_file.count("rejected") // 2),
-        int(edifact_file.count("fileError") // 2),
+        counts["accepted"],
+        counts["rejected"],
+        counts["fileError"],
     )
-    edifact_file += file_trailer
-    return edifact_file
+    edifact_lines.append(file_trailer)
+    return "\n".join(edifact_lines)
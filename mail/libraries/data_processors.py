@@ -149,7 +149,7 @@ def lock_db_for_sending_transaction(mail: Mail) -> bool:
         or (timezone.now() - mail.currently_processing_at).total_seconds() > LOCK_INTERVAL
     ):
         with transaction.atomic():
-            _mail = Mail.objects.select_for_update().get(id=mail.id)
+            _mail = Mail.objects.without_payloads().select_for_update().get(id=mail.id)
             if _mail.currently_processed_by != previous_locking_process_id:
                 return False
             _mail.currently_processed_by = str(SYSTEM_INSTANCE_UUID) + "-" + str(threading.currentThread().ident)
@@ -1,84 +1,120 @@
+import dataclasses
 import re
+from typing import Callable, Collection, Dict, Iterable, List, Optional, Sequence, Type
 
 from django.conf import settings
 
 from mail.enums import LITE_HMRC_LICENCE_TYPE_MAPPING, LicenceActionEnum
 
 from . import chieftypes
+from .chiefprotocol import FIELD_SEP, LINE_SEP, tokenise
 
-FILE_HEADER_FIELDS_LEN = 8
-LICENCE_TRANSACTION_HEADER_FIELDS_LEN = 9
-PERMITTED_TRADER_HEADER_FIELDS_LEN = 13
 PERMITTED_TRADER_NAME_MAX_LEN = 80
 PERMITTED_TRADER_ADDR_LINE_MAX_LEN = 35
-COUNTRY_FIELDS_LEN = 5
-FOREIGN_TRADER_FIELDS_LEN = 10
 FOREIGN_TRADER_NAME_MAX_LEN = 80
 FOREIGN_TRADER_NUM_ADDR_LINES = 5
 FOREIGN_TRADER_ADDR_LINE_MAX_LEN = 35
 FOREIGN_TRADER_POSTCODE_MAX_LEN = 8
 FOREIGN_TRADER_COUNTRY_MAX_LEN = 2
-LICENCE_LINE_FIELDS_LEN = 19
-FILE_TRAILER_FIELDS_LEN = 3
 
+VALID_DATA_IDENTIFIERS = ["licenceData", "licenceReply", "usageData", "usageReply"]
 VALID_ACTIONS_TO_HMRC = [choice[0] for choice in LicenceActionEnum.choices]
 VALID_LICENCE_TYPES = LITE_HMRC_LICENCE_TYPE_MAPPING.values()
 ALLOWED_COUNTRY_USE_VALUES = ["D", "E", "O", "P", "R", "S"]
 CONTROLLED_BY_VALUES = ["B", "O", "Q", "V"]
 
+# Postcode validator for UK based postcodes only
+# Reused from lite-api (validate_postcode() in api/addresses/serializers.py)
+POSTCODE_OUTCODE_PATTERN = "[A-PR-UWYZ]([0-9]{1,2}|([A-HIK-Y][0-9](|[0-9]|[ABEHMNPRVWXY]))|[0-9][A-HJKSTUW])"
+POSTCODE_INCODE_PATTERN = "[0-9][ABD-HJLNP-UW-Z]{2}"
+POSTCODE_REGEX = re.compile(r"^(GIR 0AA|%s %s)$" % (POSTCODE_OUTCODE_PATTERN, POSTCODE_INCODE_PATTERN))
+POSTCODE_SPACE_REGEX = re.compile(r" *(%s)$" % POSTCODE_INCODE_PATTERN)
 
-def validate_file_header(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
+SEPARATORS_REGEX = re.compile("[%s]" % re.escape(FIELD_SEP + LINE_SEP))
 
-    if len(tokens) != FILE_HEADER_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
+# A rule checks a record as a whole, for checks that depend on more than one
+# field or on settings, and yields an error message for each problem found.
+Rule = Callable[[chieftypes._Record, str], Iterable[str]]
 
-    if int(tokens[0]) != 1:
-        errors.append({record_type: f"{record_type} is not in the first line"})
 
-    if tokens[1] != "fileHeader":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
+@dataclasses.dataclass(frozen=True)
+class FieldSpec:
+    """Limits on the value of a single field, formatted as it is in the file.
 
-    if tokens[2] == tokens[3]:
-        errors.append({record_type: "Source and destination are the same"})
+    `error` is formatted with the `record_type` and `value` when the value
+    is too long or not one of the `choices`.
+    """
 
-    if tokens[4] not in ["licenceData", "licenceReply", "usageData", "usageReply"]:
-        errors.append({record_type: f"{record_type} contains invalid data identifier"})
+    error: str
+    max_length: Optional[int] = None
+    choices: Optional[Collection[str]] = None
 
-    if tokens[7] not in ["Y", "N"]:
-        errors.append({record_type: f"{record_type} contains invalid reset run number indicator"})
 
-    return errors
+class RecordSchema:
+    """The fields and rules of one record type, compiled into lookup tables.
+
+    The fields of the record come from the chieftypes class, so the field
+    count and the position of each field match what `format_line` writes.
+    """
 
+    def __init__(self, record_class: Type[chieftypes._Record], fields: Dict[str, FieldSpec], rules: List[Rule] = ()):
+        self.record_class = record_class
+        self.record_type = record_class.record_type
+        self.field_names = [field.name for field in dataclasses.fields(record_class)]
+        self.num_fields = len(self.field_names)
+
+        field_index = {name: index for index, name in enumerate(self.field_names)}
+        self.checks = [
+            (
+                field_index[name],
+                spec.max_length,
+                frozenset(spec.choices) if spec.choices is not None else None,
+                spec.error,
+            )
+            for name, spec in fields.items()
+        ]
+        self.rules = list(rules)
 
-def validate_licence_transaction_header(data_identifier, record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
-    action = tokens[3]
+    def validate(self, data_identifier: str, values: Sequence[str], record: chieftypes._Record) -> list:
+        record_type = values[1]
+        errors = []
+
+        if record_type != self.record_type:
+            errors.append({record_type: f"Invalid file header tag {record_type}"})
+
+        for index, max_length, choices, error in self.checks:
+            value = values[index]
+            if (max_length is not None and len(value) > max_length) or (choices is not None and value not in choices):
+                errors.append({record_type: error.format(record_type=record_type, value=value)})
+
+        for rule in self.rules:
+            errors.extend({record_type: message} for message in rule(record, data_identifier))
 
-    if len(tokens) != LICENCE_TRANSACTION_HEADER_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
         return errors
 
-    if tokens[1] != "licence":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
+    def validate_line(self, data_identifier: str, line: str) -> list:
+        """Validate a line of text, as in a file we receive"""
+        return self.validate_fields(data_identifier, line.split(FIELD_SEP))
 
-    if data_identifier in ["licenceData"] and action not in VALID_ACTIONS_TO_HMRC:
-        errors.append({record_type: f"Invalid action {action} for the data identifier {data_identifier}"})
+    def validate_fields(self, data_identifier: str, tokens: List[str]) -> list:
+        """Validate the fields of a line of text"""
+        if len(tokens) != self.num_fields:
+            record_type = tokens[1]
+            return [{record_type: f"{record_type} doesn't contain all necessary values"}]
 
-    if tokens[5] not in VALID_LICENCE_TYPES:
-        errors.append({record_type: f"Invalid licence type {tokens[5]} in the record"})
+        return self.validate(data_identifier, tokens, self.record_class(*tokens))
 
-    # Export check
-    if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
-        if tokens[6] != "E":
-            errors.append({record_type: "licence transaction header is not of Export type"})
+    def validate_record(self, data_identifier: str, record: chieftypes._Record) -> list:
+        """Validate a record, as it would be formatted in a file we generate"""
+        values = ["" if value is None else str(value) for value in (getattr(record, name) for name in self.field_names)]
+        errors = []
 
-    return errors
+        # Values containing a separator would change the fields of the formatted line.
+        for name, value in zip(self.field_names, values):
+            if SEPARATORS_REGEX.search(value):
+                errors.append({record.type_: f"{name} ({value}) contains a field or line separator"})
+
+        return errors + self.validate(data_identifier, values, record)
 
 
 def is_postcode_valid(value):
@@ -86,240 +122,244 @@ def is_postcode_valid(value):
     Postcode validator for UK based postcodes only
     Reused from lite-api (validate_postcode() in api/addresses/serializers.py)
     """
-    outcode_pattern = "[A-PR-UWYZ]([0-9]{1,2}|([A-HIK-Y][0-9](|[0-9]|[ABEHMNPRVWXY]))|[0-9][A-HJKSTUW])"
-    incode_pattern = "[0-9][ABD-HJLNP-UW-Z]{2}"
-    postcode_regex = re.compile(r"^(GIR 0AA|%s %s)$" % (outcode_pattern, incode_pattern))
-    space_regex = re.compile(r" *(%s)$" % incode_pattern)
-
     postcode = value.upper().strip()
     # Put a single space before the incode (second part).
-    postcode = space_regex.sub(r" \1", postcode)
+    postcode = POSTCODE_SPACE_REGEX.sub(r" \1", postcode)
 
-    if not postcode_regex.search(postcode):
+    if not POSTCODE_REGEX.search(postcode):
         return False
 
     return True
 
 
-def validate_permitted_trader(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
+def check_file_header(header, data_identifier):
+    if int(header.lineno) != 1:
+        yield f"{header.type_} is not in the first line"
 
-    if len(tokens) != PERMITTED_TRADER_HEADER_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
+    if header.source_system == header.destination_system:
+        yield "Source and destination are the same"
 
-    if tokens[1] != "trader":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
 
-    # Use chief type rather than indexing into tokens
-    tr = chieftypes.Trader(*tokens)
+def check_licence_transaction_header(licence, data_identifier):
+    if data_identifier in ["licenceData"] and licence.action not in VALID_ACTIONS_TO_HMRC:
+        yield f"Invalid action {licence.action} for the data identifier {data_identifier}"
+
+    # Export check
+    if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
+        if licence.usage != "E":
+            yield "licence transaction header is not of Export type"
 
-    if tr.turn == "" and tr.rpa_trader_id == "":
-        errors.append({record_type: "RPA Trader Id must not be empty when TURN is empty"})
+
+def check_permitted_trader(tr, data_identifier):
+    rpa_trader_id = tr.rpa_trader_id or ""
+    if not tr.turn and not rpa_trader_id:
+        yield "RPA Trader Id must not be empty when TURN is empty"
 
     # Export check - ICMS sets turn
     if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
-        if len(tr.rpa_trader_id) < 12 or len(tr.rpa_trader_id) > 15:
-            errors.append({record_type: "RPA Trader Id must be of atleast 12 chars and max 15 chars wide"})
+        if len(rpa_trader_id) < 12 or len(rpa_trader_id) > 15:
+            yield "RPA Trader Id must be of atleast 12 chars and max 15 chars wide"
 
     if tr.start_date and tr.end_date:
         if int(tr.end_date) < int(tr.start_date):
-            errors.append({record_type: "Invalid start and end dates for the licence"})
-
-    if len(tr.name) > PERMITTED_TRADER_NAME_MAX_LEN:
-        errors.append({record_type: f"Organisation name cannot exceed {PERMITTED_TRADER_NAME_MAX_LEN} chars"})
-
-    address_lines = [tr.address1, tr.address2, tr.address3, tr.address4, tr.address5]
-    for line in address_lines:
-        if len(line) > PERMITTED_TRADER_ADDR_LINE_MAX_LEN:
-            errors.append({record_type: f"Address line cannot exceed {PERMITTED_TRADER_ADDR_LINE_MAX_LEN} chars"})
+            yield "Invalid start and end dates for the licence"
 
-    if not is_postcode_valid(tr.postcode):
-        errors.append({record_type: f"Invalid postcode found {tr.postcode}"})
+    if not is_postcode_valid(tr.postcode or ""):
+        yield f"Invalid postcode found {tr.postcode}"
 
-    return errors
 
+def check_country(country, data_identifier):
+    if country.code and country.group:
+        yield "Both country code and group cannot be valid in the same record"
 
-def validate_country(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
 
-    if len(tokens) != COUNTRY_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
+def check_licence_product_line(ld, data_identifier):
+    if ld.controlled_by == "O":
+        # open licence goods, skip further checks
+        return
 
-    if tokens[1] != "country":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
+    if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
+        if not ld.goods_description:
+            yield "Product description cannot be empty"
+    else:
+        if not ld.goods_description and not ld.commodity:
+            yield "Product description or commodity code must be set"
 
-    if tokens[2] and tokens[3]:
-        errors.append({record_type: "Both country code and group cannot be valid in the same record"})
+    if ld.controlled_by not in CONTROLLED_BY_VALUES:
+        yield "Invalid controlled by value"
 
-    if tokens[4] not in ALLOWED_COUNTRY_USE_VALUES:
-        errors.append({record_type: f"Invalid country use value {tokens[4]}"})
+    # Export check
+    if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
+        if len(ld.quantity_unit or "") != 3:
+            yield "Quantity unit field should be of 3 characters wide"
+
+
+FILE_HEADER_SCHEMA = RecordSchema(
+    chieftypes.FileHeader,
+    {
+        "data_id": FieldSpec("{record_type} contains invalid data identifier", choices=VALID_DATA_IDENTIFIERS),
+        "reset_run_num": FieldSpec("{record_type} contains invalid reset run number indicator", choices=["Y", "N"]),
+    },
+    [check_file_header],
+)
+
+LICENCE_TRANSACTION_HEADER_SCHEMA = RecordSchema(
+    chieftypes.Licence,
+    {"licence_type": FieldSpec("Invalid licence type {value} in the record", choices=VALID_LICENCE_TYPES)},
+    [check_licence_transaction_header],
+)
+
+PERMITTED_TRADER_SCHEMA = RecordSchema(
+    chieftypes.Trader,
+    {
+        "name": FieldSpec(
+            f"Organisation name cannot exceed {PERMITTED_TRADER_NAME_MAX_LEN} chars",
+            max_length=PERMITTED_TRADER_NAME_MAX_LEN,
+        ),
+        **{
+            f"address{index}": FieldSpec(
+                f"Address line cannot exceed {PERMITTED_TRADER_ADDR_LINE_MAX_LEN} chars",
+                max_length=PERMITTED_TRADER_ADDR_LINE_MAX_LEN,
+            )
+            for index in range(1, 6)
+        },
+    },
+    [check_permitted_trader],
+)
+
+COUNTRY_SCHEMA = RecordSchema(
+    chieftypes.Country,
+    {"use": FieldSpec("Invalid country use value {value}", choices=ALLOWED_COUNTRY_USE_VALUES)},
+    [check_country],
+)
+
+FOREIGN_TRADER_SCHEMA = RecordSchema(
+    chieftypes.ForeignTrader,
+    {
+        "name": FieldSpec(
+            f"Foreign trader name ({{value}}) cannot exceed {FOREIGN_TRADER_NAME_MAX_LEN} chars",
+            max_length=FOREIGN_TRADER_NAME_MAX_LEN,
+        ),
+        **{
+            f"address{index}": FieldSpec(
+                f"Address line_{index} ({{value}}) trader exceeds {FOREIGN_TRADER_ADDR_LINE_MAX_LEN} chars",
+                max_length=FOREIGN_TRADER_ADDR_LINE_MAX_LEN,
+            )
+            for index in range(1, FOREIGN_TRADER_NUM_ADDR_LINES + 1)
+        },
+        "postcode": FieldSpec(
+            f"Foreign trader postcode ({{value}}) exceeds {FOREIGN_TRADER_POSTCODE_MAX_LEN} chars",
+            max_length=FOREIGN_TRADER_POSTCODE_MAX_LEN,
+        ),
+        "country": FieldSpec(
+            f"Foreign trader country code ({{value}}) exceeds {FOREIGN_TRADER_COUNTRY_MAX_LEN} chars",
+            max_length=FOREIGN_TRADER_COUNTRY_MAX_LEN,
+        ),
+    },
+)
+
+RESTRICTIONS_SCHEMA = RecordSchema(chieftypes.Restrictions, {})
+
+LICENCE_PRODUCT_LINE_SCHEMA = RecordSchema(chieftypes.LicenceDataLine, {}, [check_licence_product_line])
+
+END_LINE_SCHEMA = RecordSchema(chieftypes.End, {})
+
+FILE_TRAILER_SCHEMA = RecordSchema(chieftypes.FileTrailer, {})
+
+# The records of a licenceData file, by record type.
+LICENCE_DATA_SCHEMAS = {
+    schema.record_type: schema
+    for schema in [
+        FILE_HEADER_SCHEMA,
+        LICENCE_TRANSACTION_HEADER_SCHEMA,
+        PERMITTED_TRADER_SCHEMA,
+        COUNTRY_SCHEMA,
+        FOREIGN_TRADER_SCHEMA,
+        RESTRICTIONS_SCHEMA,
+        LICENCE_PRODUCT_LINE_SCHEMA,
+        END_LINE_SCHEMA,
+        FILE_TRAILER_SCHEMA,
+    ]
+}
 
-    return errors
 
+def validate_file_header(record):
+    return FILE_HEADER_SCHEMA.validate_line("", record)
 
-def validate_foreign_trader(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
 
-    if len(tokens) != FOREIGN_TRADER_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
-
-    if tokens[1] != "foreignTrader":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
+def validate_licence_transaction_header(data_identifier, record):
+    return LICENCE_TRANSACTION_HEADER_SCHEMA.validate_line(data_identifier, record)
 
-    name = tokens[2]
-    if len(name) > FOREIGN_TRADER_NAME_MAX_LEN:
-        errors.append({record_type: f"Foreign trader name ({name}) cannot exceed {FOREIGN_TRADER_NAME_MAX_LEN} chars"})
 
-    for index, line in enumerate(tokens[3:8], start=1):
+def validate_permitted_trader(record):
+    return PERMITTED_TRADER_SCHEMA.validate_line("", record)
 
-        if len(line) > FOREIGN_TRADER_ADDR_LINE_MAX_LEN:
-            errors.append(
-                {record_type: f"Address line_{index} ({line}) trader exceeds {FOREIGN_TRADER_ADDR_LINE_MAX_LEN} chars"}
-            )
 
-    postcode = tokens[8]
-    country = tokens[9]
-    if len(postcode) > FOREIGN_TRADER_POSTCODE_MAX_LEN:
-        errors.append(
-            {record_type: f"Foreign trader postcode ({postcode}) exceeds {FOREIGN_TRADER_POSTCODE_MAX_LEN} chars"}
-        )
+def validate_country(record):
+    return COUNTRY_SCHEMA.validate_line("", record)
 
-    if len(country) > FOREIGN_TRADER_COUNTRY_MAX_LEN:
-        errors.append(
-            {record_type: f"Foreign trader country code ({country}) exceeds {FOREIGN_TRADER_COUNTRY_MAX_LEN} chars"}
-        )
 
-    return errors
+def validate_foreign_trader(record):
+    return FOREIGN_TRADER_SCHEMA.validate_line("", record)
 
 
 def validate_restrictions(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
-
-    if len(tokens) != 3:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
-
-    if tokens[1] != "restrictions":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
-
-    return errors
+    return RESTRICTIONS_SCHEMA.validate_line("", record)
 
 
 def validate_licence_product_line(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
-
-    if len(tokens) != LICENCE_LINE_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
-
-    if record_type != "line":
-        errors.append({record_type: f"Invalid file header tag {record_type}"})
-
-    # Use chief type rather than indexing into tokens
-    ld = chieftypes.LicenceDataLine(*tokens)
-
-    if ld.controlled_by == "O":
-        # open licence goods, skip further checks
-        return errors
-
-    if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
-        if not ld.goods_description:
-            errors.append({record_type: "Product description cannot be empty"})
-    else:
-        if not ld.goods_description and not ld.commodity:
-            errors.append({record_type: "Product description or commodity code must be set"})
-
-    if ld.controlled_by not in CONTROLLED_BY_VALUES:
-        errors.append({record_type: "Invalid controlled by value"})
+    return LICENCE_PRODUCT_LINE_SCHEMA.validate_line("", record)
 
-    # Export check
-    if settings.CHIEF_SOURCE_SYSTEM == "SPIRE":
-        if len(ld.quantity_unit) != 3:
-            errors.append({record_type: "Quantity unit field should be of 3 characters wide"})
 
-    return errors
+def validate_end_line(record):
+    return END_LINE_SCHEMA.validate_line("", record)
 
 
-def validate_end_line(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
+def validate_file_trailer(record):
+    return FILE_TRAILER_SCHEMA.validate_line("", record)
 
-    if len(tokens) != 4:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
 
-    if tokens[1] != "end":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
+def validate_edifact_record(data_identifier, record):
+    """Validate a single chieftypes record of a file with the given data identifier
 
-    return errors
+    The record must already have its line number.
+    """
+    schema = LICENCE_DATA_SCHEMAS.get(record.type_)
+    if not schema:
+        return [f"Invalid record type {record.type_}"]
 
+    return schema.validate_record(data_identifier, record)
 
-def validate_file_trailer(record):
-    errors = []
-    tokens = record.split("\\")
-    record_type = tokens[1]
 
-    if len(tokens) != FILE_TRAILER_FIELDS_LEN:
-        errors.append({record_type: f"{record_type} doesn't contain all necessary values"})
-        return errors
+def validate_edifact_line(data_identifier, line):
+    """Validate a single line of text of a file with the given data identifier"""
+    record_type = line.split(FIELD_SEP, 2)[1]
 
-    if tokens[1] != "fileTrailer":
-        errors.append({record_type: f"Invalid file header tag {tokens[1]}"})
+    schema = LICENCE_DATA_SCHEMAS.get(record_type)
+    if not schema:
+        return [f"Invalid record type {record_type}"]
 
-    return errors
+    return schema.validate_line(data_identifier, line)
 
 
 def validate_edifact_file(file_data):
     """
     Validates the content as per the DES236 specification
 
-    Validates each line and returns the list of discrepencies
+    Validates each line and returns the list of discrepencies. This is for files
+    we receive, files we generate are validated record by record as they are built.
     """
-    file_lines = [line for line in file_data.split("\n") if line]
-
     errors = []
     data_identifier = ""
-    for line in file_lines[:]:
-        line_errors = list()
-        tokens = line.split("\\")
-        record_type = tokens[1]
-
-        if record_type == "fileHeader":
-            data_identifier = tokens[4]
-            line_errors = validate_file_header(line)
-        elif record_type == "licence":
-            line_errors = validate_licence_transaction_header(data_identifier, line)
-        elif record_type == "trader":
-            line_errors = validate_permitted_trader(line)
-        elif record_type == "country":
-            line_errors = validate_country(line)
-        elif record_type == "foreignTrader":
-            line_errors = validate_foreign_trader(line)
-        elif record_type == "restrictions":
-            line = validate_restrictions(line)
-        elif record_type == "line":
-            line_errors = validate_licence_product_line(line)
-        elif record_type == "end":
-            line_errors = validate_end_line(line)
-        elif record_type == "fileTrailer":
-            line_errors = validate_file_trailer(line)
-        else:
-            line_errors.append(f"Invalid record type {record_type}")
-
-        errors.extend(line_errors)
+    for line in tokenise(file_data):
+        if line.record_type == FILE_HEADER_SCHEMA.record_type:
+            data_identifier = line.fields[4]
+
+        schema = LICENCE_DATA_SCHEMAS.get(line.record_type)
+        if not schema:
+            errors.append(f"Invalid record type {line.record_type}")
+            continue
+
+        errors.extend(schema.validate_fields(data_identifier, line.fields))
 
     return errors
@@ -4,6 +4,7 @@ import logging
 from email.message import Message
 from email.parser import Parser
 from json.decoder import JSONDecodeError
+from typing import Dict, Iterable, Optional, Tuple
 
 import sentry_sdk
 from dateutil.parser import parse
@@ -225,7 +226,7 @@ def decode(data, char_set: str):
 def select_email_for_sending() -> Mail or None:
     logger.info("Selecting email to send")
 
-    reply_received = Mail.objects.filter(status=ReceptionStatusEnum.REPLY_RECEIVED).first()
+    reply_received = Mail.objects.without_payloads().filter(status=ReceptionStatusEnum.REPLY_RECEIVED).first()
     if reply_received:
         if reply_received.extract_type == ExtractTypeEnum.USAGE_DATA:
             usage_data = UsageData.objects.get(mail=reply_received)
@@ -233,7 +234,7 @@ def select_email_for_sending() -> Mail or None:
                 return
         return reply_received
 
-    reply_pending = Mail.objects.filter(status=ReceptionStatusEnum.REPLY_PENDING).first()
+    reply_pending = Mail.objects.without_payloads().filter(status=ReceptionStatusEnum.REPLY_PENDING).first()
     if reply_pending:
         if reply_pending.extract_type == ExtractTypeEnum.USAGE_DATA:
             usage_data = UsageData.objects.get(mail=reply_pending)
@@ -242,7 +243,7 @@ def select_email_for_sending() -> Mail or None:
         logger.info("Email currently in flight")
         return
 
-    pending = Mail.objects.filter(status=ReceptionStatusEnum.PENDING).first()
+    pending = Mail.objects.without_payloads().filter(status=ReceptionStatusEnum.PENDING).first()
     if pending:
         return pending
 
@@ -276,14 +277,14 @@ def check_for_pending_messages():
     if ld_pending_count and ld_pending_count > 1:
         raise Exception("More than 1 licenceData pending mails found")
 
-    pending = Mail.objects.filter(status=ReceptionStatusEnum.PENDING).order_by("created_at").first()
+    pending = Mail.objects.without_payloads().filter(status=ReceptionStatusEnum.PENDING).order_by("created_at").first()
     if pending:
         # check if we are waiting for reply for any licenceData mail sent previously
         # if yes then don't send this pending mail as we have to send only after receiving reply
         # usageData mails can be sent to SPIRE without any issues
         reply_pending = Mail.objects.filter(
             extract_type=ExtractTypeEnum.LICENCE_DATA, status=ReceptionStatusEnum.REPLY_PENDING
-        )
+        ).exists()
         if reply_pending and pending.extract_type == ExtractTypeEnum.LICENCE_DATA:
             raise Exception("Received another licenceData mail while waiting for reply")
 
@@ -307,6 +308,29 @@ def get_licence_id(licence_reference) -> str or None:
         return
 
 
+def get_lite_licence_ids(licence_references: Iterable[str]) -> Dict[str, str]:
+    """
+    Returns the LITE API Licence IDs of the licence references in a single query,
+    references that are not LITE licences are left out
+    """
+    mappings = LicenceIdMapping.objects.filter(reference__in=set(licence_references))
+    return {reference: str(lite_id) for reference, lite_id in mappings.values_list("reference", "lite_id")}
+
+
+def get_lite_good_ids(licence_references: Iterable[str]) -> Dict[Tuple[str, int], Optional[str]]:
+    """
+    Returns the LITE API Good IDs of every line of the licence references in a single query,
+    keyed by (licence reference, line number). As with get_good_id, a line mapped more than once is None
+    """
+    good_ids = {}
+    mappings = GoodIdMapping.objects.filter(licence_reference__in=set(licence_references))
+    for licence_reference, line_number, lite_id in mappings.values_list("licence_reference", "line_number", "lite_id"):
+        key = (licence_reference, line_number)
+        good_ids[key] = None if key in good_ids else str(lite_id)
+
+    return good_ids
+
+
 def get_licence_status(reference) -> str:
     if reference == "O":
         return LicenceStatusEnum.OPEN
@@ -346,7 +370,8 @@ def log_to_sentry(message, extra=None, level="info"):
 
 def get_licence_data_status():
     mail = (
-        Mail.objects.filter(extract_type__in=[ExtractTypeEnum.LICENCE_DATA, ExtractTypeEnum.LICENCE_REPLY])
+        Mail.objects.without_payloads()
+        .filter(extract_type__in=[ExtractTypeEnum.LICENCE_DATA, ExtractTypeEnum.LICENCE_REPLY])
         .order_by("created_at")
         .last()
     )
@@ -368,7 +393,7 @@ def get_licence_data_status():
 
 
 def get_usage_data_status():
-    mail = Mail.objects.filter(extract_type=ExtractTypeEnum.USAGE_DATA).order_by("created_at").last()
+    mail = Mail.objects.without_payloads().filter(extract_type=ExtractTypeEnum.USAGE_DATA).order_by("created_at").last()
     usage_data_qs = UsageData.objects.filter(mail=mail)
     if not usage_data_qs:
         return {}
@@ -1,9 +1,15 @@
 import datetime
+import hashlib
+import io
+import json
 import logging
 import re
 import textwrap
-from typing import TYPE_CHECKING, Dict, Iterable, Optional
+from typing import Dict, Iterable, List, Optional, TextIO
 
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
 from django.utils import timezone
 from unidecode import unidecode
 
@@ -19,17 +25,18 @@ from mail.libraries import chiefprotocol, chieftypes
 from mail.libraries.edifact_validator import (
     FOREIGN_TRADER_ADDR_LINE_MAX_LEN,
     FOREIGN_TRADER_NUM_ADDR_LINES,
-    validate_edifact_file,
+    validate_edifact_record,
 )
 from mail.libraries.helpers import get_country_id
 from mail.models import GoodIdMapping, LicencePayload
 
-if TYPE_CHECKING:
-    from django.db.models import QuerySet  # noqa
-
-
 logger = logging.getLogger(__name__)
 
+# The lines of a licence are cached for long enough to cover the retries of a failed file,
+# the key includes a version to change when the lines generated for the same payload change.
+LICENCE_LINES_CACHE_VERSION = 1
+LICENCE_LINES_CACHE_TIMEOUT = 60 * 60
+
 
 class EdifactValidationError(Exception):
     pass
@@ -75,7 +82,7 @@ def generate_lines_for_licence(licence: LicencePayload) -> Iterable[chieftypes._
             start_date=old_payload.get("start_date").replace("-", ""),
             end_date=old_payload.get("end_date").replace("-", ""),
         )
-        yield chieftypes.End(start_record_type=chieftypes.Licence.type_)
+        yield chieftypes.End(start_record_type=chieftypes.Licence.record_type)
 
         yield chieftypes.Licence(
             transaction_ref=get_transaction_reference(licence.reference),
@@ -151,17 +158,6 @@ def generate_lines_for_licence(licence: LicencePayload) -> Iterable[chieftypes._
         logger.debug("Payload type is %s with %s", payload.get("type"), payload.get("goods"))
         if payload.get("goods") and payload.get("type") in LicenceTypeEnum.STANDARD_LICENCES:
             for g, commodity in enumerate(payload.get("goods"), start=1):
-                logger.debug(
-                    "Creating GoodIdMapping with lite_id=%s reference=%s line_number=%s",
-                    commodity["id"],
-                    licence.reference,
-                    g,
-                )
-                GoodIdMapping.objects.get_or_create(
-                    lite_id=commodity["id"],
-                    licence_reference=licence.reference,
-                    line_number=g,
-                )
                 controlled_by = "Q"  # usage is controlled by quantity only
                 quantity = commodity.get("quantity")
                 qunit = UnitMapping[commodity["unit"]]
@@ -185,21 +181,76 @@ def generate_lines_for_licence(licence: LicencePayload) -> Iterable[chieftypes._
                 controlled_by=controlled_by,
             )
 
-    yield chieftypes.End(start_record_type=chieftypes.Licence.type_)
+    yield chieftypes.End(start_record_type=chieftypes.Licence.record_type)
 
 
-def licences_to_edifact(
-    licences: "QuerySet[LicencePayload]", run_number: int, source: str, when: datetime.datetime = None
-) -> str:
-    # Build a list of lines, with each line a tuple. After we have all the
-    # lines, we format them ("\" as field separator) and insert the line
-    # numbers. Some lines reference previous line numbers, so we need to
-    # track those.
-    lines = []
+def get_good_id_mappings(licence: LicencePayload) -> List[GoodIdMapping]:
+    """The unsaved mappings of each good of a LITE licence to its line number in the licence.
 
-    if not when:
-        when = timezone.now()
+    This is kept apart from generating the lines, which can come from the cache,
+    as the mappings are rolled back along with a file that fails to be sent.
+    """
+    payload = licence.data
+    if licence.action == LicenceActionEnum.CANCEL or payload.get("type") not in LicenceTypeEnum.STANDARD_LICENCES:
+        return []
+
+    return [
+        GoodIdMapping(lite_id=commodity["id"], licence_reference=licence.reference, line_number=g)
+        for g, commodity in enumerate(payload.get("goods") or [], start=1)
+    ]
+
+
+def get_licence_lines_cache_key(licence: LicencePayload, source: str) -> str:
+    """The cache key for the lines of a licence, a hash of everything the lines are generated from."""
+    content = {
+        "source": source,
+        "action": licence.action,
+        "reference": licence.reference,
+        "old_reference": licence.old_reference,
+        "data": licence.data,
+    }
+    if source != ChiefSystemEnum.ICMS and licence.action == LicenceActionEnum.UPDATE:
+        # An update also cancels the previous licence, using the dates of its payload.
+        content["old_data"] = get_previous_licence_payload(licence.old_reference)
+
+    content_hash = hashlib.sha256(json.dumps(content, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+    return f"licence-lines:{LICENCE_LINES_CACHE_VERSION}:{content_hash}"
+
+
+def get_lines_for_licence(licence: LicencePayload, source: str) -> List[chieftypes._Record]:
+    """The lines for a single licence, without line numbers, to use in a CHIEF message.
+
+    The lines only depend on the payload, so they are cached by a hash of it.
+    Retrying or rebuilding a file then only numbers the lines again, rather than
+    generating them from the payload.
+    """
+    cache_key = get_licence_lines_cache_key(licence, source)
+    lines = cache.get(cache_key)
+
+    if lines is None:
+        if source == ChiefSystemEnum.ICMS:
+            lines = list(generate_lines_for_icms_licence(licence))
+        else:
+            lines = list(generate_lines_for_licence(licence))
+
+        cache.set(cache_key, lines, timeout=LICENCE_LINES_CACHE_TIMEOUT)
 
+    return lines
+
+
+def generate_lines_for_licences(
+    licences: Iterable[LicencePayload],
+    run_number: int,
+    source: str,
+    when: datetime.datetime,
+    good_id_mappings: Optional[List[GoodIdMapping]] = None,
+) -> Iterable[chieftypes._Record]:
+    """Yield every line of a licenceData file, from the file header to the file trailer.
+
+    The GoodIdMappings of the LITE licences are added to `good_id_mappings`, if
+    given, to be saved once the file is known to be valid.
+    """
     time_stamp = when.strftime("%Y%m%d%H%M")  # YYYYMMDDhhmm
 
     # Setting this to Y will override the hmrc run number with the run number in this file.
@@ -214,33 +265,70 @@ def licences_to_edifact(
         run_num=run_number,
         reset_run_num=reset_run_number_indicator,
     )
-    lines.append(file_header)
-
     logger.info("File header: %r", file_header)
-
-    if source == ChiefSystemEnum.ICMS:
-        get_licence_lines = generate_lines_for_icms_licence
-    else:
-        get_licence_lines = generate_lines_for_licence
-
-    for licence in licences:
-        lines.extend(get_licence_lines(licence))
+    yield file_header
 
     # File trailer includes the number of licences, but +1 for each "update"
     # because this code represents those as "cancel" followed by "insert".
-    num_transactions = chiefprotocol.count_transactions(lines)
-    file_trailer = chieftypes.FileTrailer(transaction_count=num_transactions)
-    lines.append(file_trailer)
+    num_transactions = 0
+    for licence in licences:
+        if good_id_mappings is not None and source != ChiefSystemEnum.ICMS:
+            good_id_mappings.extend(get_good_id_mappings(licence))
+
+        for line in get_lines_for_licence(licence, source):
+            num_transactions += line.type_ == chieftypes.Licence.record_type
+            yield line
+
+    yield chieftypes.FileTrailer(transaction_count=num_transactions)
+
+
+def write_licences_edifact(
+    licences: "QuerySet[LicencePayload]",
+    run_number: int,
+    source: str,
+    sink: TextIO,
+    when: datetime.datetime = None,
+) -> None:
+    """Write a licenceData file for the licences to `sink`, a file-like object.
+
+    Each line is numbered, validated and written as soon as it is generated, so
+    memory use does not grow with the number of licences. If any line is not as
+    per specification EdifactValidationError is raised once the whole file has
+    been written, and the content of `sink` should be discarded. Otherwise the
+    GoodIdMappings of the licences are saved, in a single query.
+    """
+    if not when:
+        when = timezone.now()
 
-    # Convert line tuples to the final string with line numbers, etc.
-    edifact_file = chiefprotocol.format_lines(lines)
+    if isinstance(licences, QuerySet):
+        licences = licences.iterator()
+
+    good_id_mappings = []
+    lines = generate_lines_for_licences(licences, run_number, source, when, good_id_mappings)
+
+    errors = []
+    for line in chiefprotocol.iter_line_numbers(lines):
+        errors.extend(validate_edifact_record("licenceData", line))
+        sink.write(chiefprotocol.format_line(line) + chiefprotocol.LINE_SEP)
 
-    logger.debug("Generated file content: %r", edifact_file)
-    errors = validate_edifact_file(edifact_file)
     if errors:
         logger.error("File content not as per specification, %r", errors)
         raise EdifactValidationError(repr(errors))
 
+    # Mappings that already exist, from a previous file with the same licence, are skipped.
+    logger.debug("Creating %d GoodIdMappings", len(good_id_mappings))
+    GoodIdMapping.objects.bulk_create(good_id_mappings, ignore_conflicts=True)
+
+
+def licences_to_edifact(
+    licences: "QuerySet[LicencePayload]", run_number: int, source: str, when: datetime.datetime = None
+) -> str:
+    sink = io.StringIO()
+    write_licences_edifact(licences, run_number, source, sink, when)
+    edifact_file = sink.getvalue()
+
+    logger.debug("Generated file content: %r", edifact_file)
+
     return edifact_file
 
 
@@ -361,7 +449,7 @@ def generate_lines_for_icms_licence(licence: LicencePayload) -> Iterable[chiefty
     for g in get_goods(icms_licence_type, payload.get("goods")):
         yield g
 
-    yield chieftypes.End(start_record_type=chieftypes.Licence.type_)
+    yield chieftypes.End(start_record_type=chieftypes.Licence.record_type)
 
 
 def get_date_field(obj, key, default="") -> str:
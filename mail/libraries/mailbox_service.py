@@ -2,7 +2,7 @@ import logging
 from email.parser import BytesHeaderParser
 from email.utils import parseaddr
 from poplib import POP3_SSL, error_proto
-from typing import Callable, Iterator, List, Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
 
 from django.conf import settings
 
@@ -10,6 +10,7 @@ from mail.enums import MailReadStatuses
 from mail.libraries.email_message_dto import EmailMessageDto
 from mail.libraries.helpers import to_mail_message_dto
 from mail.models import Mail, MailboxConfig, MailReadStatus
+from mail.servers import PipelinedPOP3_SSL, PipelineResponse
 
 
 def is_from_valid_sender(msg_header, valid_addresses):
@@ -40,18 +41,29 @@ def get_message_id(pop3_connection, listing_msg):
     # 0 indicates the number of lines of message to be retrieved after the header
     msg_header = pop3_connection.top(msg_num, 0)
 
-    if not is_from_valid_sender(msg_header[1], [settings.SPIRE_FROM_ADDRESS, settings.HMRC_TO_DIT_REPLY_ADDRESS]):
+    return parse_message_id(msg_num, msg_header[1])
+
+
+def parse_message_id(msg_num, header_lines):
+    """
+    Extracts the Message-ID from the header lines of a message.
+
+    :param msg_num: the message num the header lines were retrieved for
+    :param header_lines: the lines returned from the pop3.top command
+    :return: the message-id and message_num, the message-id is None if the message isn't from SPIRE or HMRC
+    """
+    if not is_from_valid_sender(header_lines, [settings.SPIRE_FROM_ADDRESS, settings.HMRC_TO_DIT_REPLY_ADDRESS]):
         logging.warning(
             "Found mail with message_num %s that is not from SPIRE (%s) or HMRC (%s), skipping ...",
             msg_num,
             settings.SPIRE_FROM_ADDRESS,
             settings.HMRC_TO_DIT_REPLY_ADDRESS,
         )
-        logging.debug("Mail was from %s", msg_header[1])
+        logging.debug("Mail was from %s", header_lines)
         return None, msg_num
 
     message_id = None
-    for index, item in enumerate(msg_header[1]):
+    for index, item in enumerate(header_lines):
         hdr_item_fields = item.decode("utf-8").split(" ")
         # message id is of the form b"Message-ID: <963d810e-c573-ef26-4ac0-151572b3524b@email-domail.co.uk>"
 
@@ -61,7 +73,7 @@ def get_message_id(pop3_connection, listing_msg):
                 message_id = value.split("@")[0]
         elif len(hdr_item_fields) == 1:
             if hdr_item_fields[0].lower() == "message-id:":
-                value = msg_header[1][index + 1].decode("utf-8")
+                value = header_lines[index + 1].decode("utf-8")
                 value = value.replace("<", "").replace(">", "").strip(" ")
                 message_id = value.split("@")[0]
 
@@ -69,90 +81,273 @@ def get_message_id(pop3_connection, listing_msg):
     return message_id, msg_num
 
 
-def get_read_messages(mailbox_config):
-    return [
-        str(m.message_id)
-        for m in MailReadStatus.objects.filter(
-            mailbox=mailbox_config, status__in=[MailReadStatuses.READ, MailReadStatuses.UNPROCESSABLE]
-        )
-    ]
+def get_read_messages(mailbox_config: MailboxConfig, message_ids: Iterable[str]) -> Set[str]:
+    """
+    Returns the subset of the given Message-IDs that are already READ or UNPROCESSABLE in the mailbox.
 
+    Only the candidate ids are looked up so the cost doesn't grow with the mailbox history.
+    """
+    message_ids = {message_id for message_id in message_ids if message_id is not None}
+    if not message_ids:
+        return set()
 
-def get_message_iterator(pop3_connection: POP3_SSL, username: str) -> Iterator[Tuple[EmailMessageDto, Callable]]:
-    mails: list
-    _, mails, _ = pop3_connection.list()
-    mailbox_config, _ = MailboxConfig.objects.get_or_create(username=username)
+    return set(
+        MailReadStatus.objects.filter(
+            mailbox=mailbox_config,
+            message_id__in=message_ids,
+            status__in=[MailReadStatuses.READ, MailReadStatuses.UNPROCESSABLE],
+        ).values_list("message_id", flat=True)
+    )
+
+
+def get_uid_listing(pop3_connection: POP3_SSL) -> Optional[List[Tuple[str, str]]]:
+    """
+    Lists the mailbox using the pop3 UIDL command.
+
+    :return: a list of (message_num, uid) pairs in mailbox order, or None if the server doesn't support UIDL
+    """
+    try:
+        _, listing, _ = pop3_connection.uidl()
+    except error_proto as err:
+        logging.warning("UIDL command failed, falling back to LIST: %s", err)
+        return None
+
+    uid_listing = []
+    for line in listing:
+        message_num, uid = line.decode(settings.DEFAULT_ENCODING).split()[:2]
+        uid_listing.append((message_num, uid))
+
+    return uid_listing
+
+
+def find_watermark_position(uid_listing: List[Tuple[str, str]], mailbox_config: MailboxConfig) -> int:
+    """
+    Finds the position in the listing of the first message after the mailbox watermark.
+
+    As we never delete emails from these mailboxes the watermark message normally keeps its message number,
+    so that position is checked first before searching the listing for the uid.
+
+    :return: the index of the first unseen message, 0 if the watermark isn't present in the listing
+    """
+    last_seen_uid = mailbox_config.last_seen_uid
+    if not last_seen_uid:
+        return 0
+
+    last_seen_message_num = mailbox_config.last_seen_message_num
+    if last_seen_message_num:
+        index = last_seen_message_num - 1
+        if index < len(uid_listing) and uid_listing[index][1] == last_seen_uid:
+            return index + 1
+
+    for index, (_, uid) in enumerate(uid_listing):
+        if uid == last_seen_uid:
+            return index + 1
+
+    logging.warning(
+        "Watermark uid %s not found in %s, checking the latest messages instead", last_seen_uid, mailbox_config
+    )
+    return 0
+
+
+def get_unseen_listing(pop3_connection: POP3_SSL, mailbox_config: MailboxConfig) -> List[Tuple[str, Optional[str]]]:
+    """
+    Returns the (message_num, uid) pairs of the messages that still need to be checked.
+
+    Only messages after the mailbox watermark are returned, so a poll of a mailbox without
+    new messages costs a single UIDL exchange. If UIDL isn't supported we fall back to LIST,
+    in which case the uid of each message is None.
+    """
     incoming_email_check_limit = settings.INCOMING_EMAIL_CHECK_LIMIT
 
+    uid_listing = get_uid_listing(pop3_connection)
+    if uid_listing is None:
+        _, mails, _ = pop3_connection.list()
+        listing = [(m.decode(settings.DEFAULT_ENCODING).split()[0], None) for m in mails]
+        return listing[-incoming_email_check_limit:]
+
+    start = find_watermark_position(uid_listing, mailbox_config)
+
     # Check only the emails specified in the setting
-    # Since we don't delete emails from these mailboxes the total number can be very high over a perio
+    # Since we don't delete emails from these mailboxes the total number can be very high over a period
     # and increases the processing time.
-    # The mails is a list of message number and size - message number is an increasing value so the
-    # latest emails will always be at the end.
-    mail_message_ids = [
-        get_message_id(pop3_connection, m.decode(settings.DEFAULT_ENCODING))
-        for m in mails[-incoming_email_check_limit:]
-    ]
-
-    # these are mailbox message ids we've seen before
-    read_messages = get_read_messages(mailbox_config)
-    logging.info("Number of messages READ/UNPROCESSABLE in %s are %s", mailbox_config.username, len(read_messages))
-
-    for message_id, message_num in mail_message_ids:
+    # Message numbers are increasing values so the latest emails will always be at the end.
+    return uid_listing[start:][-incoming_email_check_limit:]
+
+
+def advance_watermark(mailbox_config: MailboxConfig, mail_message_ids: List[Tuple], read_messages: Set[str]) -> bool:
+    """
+    Moves the mailbox watermark past the leading messages that never need to be checked again.
+
+    These are messages that aren't from a valid sender (or have no Message-ID) and messages that
+    are already READ or UNPROCESSABLE. The watermark stops at the first message still to be
+    processed so that it is checked again on the next poll.
+
+    :return: whether the watermark was moved past all of the messages
+    """
+    watermark = None
+    passed_count = 0
+    for message_id, message_num, uid in mail_message_ids:
+        if uid is None or (message_id is not None and message_id not in read_messages):
+            break
+        watermark = (message_num, uid)
+        passed_count += 1
+
+    if watermark is None:
+        return not mail_message_ids
+
+    message_num, uid = watermark
+    logging.info("Moving watermark of %s to uid %s (message_num %s)", mailbox_config.username, uid, message_num)
+    mailbox_config.last_seen_uid = uid
+    mailbox_config.last_seen_message_num = int(message_num)
+    mailbox_config.save(update_fields=["last_seen_uid", "last_seen_message_num"])
+
+    return passed_count == len(mail_message_ids)
+
+
+def get_message_headers(pop3_connection: POP3_SSL, message_nums: List[str]) -> List[List[bytes]]:
+    """
+    Retrieves the header lines of each message, pipelining the TOP commands if the connection supports it.
+    """
+    # 0 indicates the number of lines of message to be retrieved after the header
+    if isinstance(pop3_connection, PipelinedPOP3_SSL):
+        responses = pop3_connection.top_many(message_nums, 0)
+        for response in responses:
+            if isinstance(response, error_proto):
+                raise response
+    else:
+        responses = [pop3_connection.top(message_num, 0) for message_num in message_nums]
+
+    return [response[1] for response in responses]
+
+
+def retrieve_messages(
+    pop3_connection: POP3_SSL, message_nums: List[str], number: Optional[int] = None
+) -> Iterator[PipelineResponse]:
+    """
+    Retrieves each message in order, pipelining the RETR commands in batches if the connection supports it.
+
+    A message that can't be retrieved is returned as the error_proto raised for it.
+
+    :param number: the number of messages the caller expects to use, no more than this are retrieved at a time
+    """
+    if isinstance(pop3_connection, PipelinedPOP3_SSL):
+        batch_size = min(pop3_connection.batch_size, number or pop3_connection.batch_size)
+        for start in range(0, len(message_nums), batch_size):
+            yield from pop3_connection.retr_many(message_nums[start : start + batch_size])
+        return
+
+    for message_num in message_nums:
+        try:
+            yield pop3_connection.retr(message_num)
+        except error_proto as err:
+            yield err
+
+
+def get_mark_status(read_status: MailReadStatus) -> Callable:
+    def mark_status(status):
+        """
+        :param status: A choice from `MailReadStatuses.choices`
+        """
+        logging.info(
+            "Marking message_id %s with message_num %s from %s as %s",
+            read_status.message_id,
+            read_status.message_num,
+            read_status.mailbox.username,
+            status,
+        )
+        read_status.status = status
+        read_status.save()
+
+    return mark_status
+
+
+def get_message_iterator(
+    pop3_connection: POP3_SSL, username: str, number: Optional[int] = None
+) -> Iterator[Tuple[EmailMessageDto, Callable]]:
+    """
+    Retrieves the messages in the mailbox that haven't been read yet, oldest first.
+
+    :param number: the number of messages the caller will take from the iterator. The messages are checked
+        and retrieved this many at a time, so that no more are fetched from the server than are needed.
+    """
+    mailbox_config, _ = MailboxConfig.objects.get_or_create(username=username)
+    listing = get_unseen_listing(pop3_connection, mailbox_config)
+
+    chunk_size = number or len(listing) or 1
+    watermark_blocked = False
+    for start in range(0, len(listing), chunk_size):
+        chunk = listing[start : start + chunk_size]
+        message_headers = get_message_headers(pop3_connection, [message_num for message_num, _ in chunk])
+        mail_message_ids = [
+            (*parse_message_id(message_num, header_lines), uid)
+            for (message_num, uid), header_lines in zip(chunk, message_headers)
+        ]
+
+        # these are mailbox message ids we've seen before
+        read_messages = get_read_messages(mailbox_config, (message_id for message_id, _, _ in mail_message_ids))
+        logging.info(
+            "Number of checked messages READ/UNPROCESSABLE in %s are %s", mailbox_config.username, len(read_messages)
+        )
+
+        # The watermark can only move past this chunk if it moved past all of the earlier ones
+        if not watermark_blocked:
+            watermark_blocked = not advance_watermark(mailbox_config, mail_message_ids, read_messages)
+
         # only return messages we haven't seen before
-        if message_id is not None and message_id not in read_messages:
-            read_status, _ = MailReadStatus.objects.get_or_create(
-                message_id=message_id, message_num=message_num, mailbox=mailbox_config
+        unread_message_ids = [
+            (message_id, message_num)
+            for message_id, message_num, _ in mail_message_ids
+            if message_id is not None and message_id not in read_messages
+        ]
+        yield from _retrieve_unread_messages(pop3_connection, mailbox_config, unread_message_ids, number)
+
+
+def _retrieve_unread_messages(
+    pop3_connection: POP3_SSL, mailbox_config: MailboxConfig, unread_message_ids: List[Tuple], number: Optional[int]
+) -> Iterator[Tuple[EmailMessageDto, Callable]]:
+    retrieved_messages = retrieve_messages(
+        pop3_connection, [message_num for _, message_num in unread_message_ids], number
+    )
+
+    for (message_id, message_num), m in zip(unread_message_ids, retrieved_messages):
+        read_status, _ = MailReadStatus.objects.get_or_create(
+            message_id=message_id, message_num=message_num, mailbox=mailbox_config
+        )
+        mark_status = get_mark_status(read_status)
+
+        if isinstance(m, error_proto):
+            logging.error(
+                "Unable to RETR message num %s with Message-ID %s in %s: %s",
+                message_num,
+                message_id,
+                mailbox_config,
+                m,
+                exc_info=m,
+            )
+            continue
+
+        logging.info(
+            "Retrieved message_id %s with message_num %s from %s",
+            message_id,
+            message_num,
+            read_status.mailbox.username,
+        )
+
+        try:
+            mail_message = to_mail_message_dto(m)
+        except ValueError as ve:
+            logging.error(
+                "Unable to convert message num %s with Message-Id %s to DTO in %s: %s",
+                message_num,
+                message_id,
+                mailbox_config,
+                ve,
+                exc_info=True,
             )
+            mark_status(MailReadStatuses.UNPROCESSABLE)
+            continue
 
-            def mark_status(status):
-                """
-                :param status: A choice from `MailReadStatuses.choices`
-                """
-                logging.info(
-                    "Marking message_id %s with message_num %s from %s as %s",
-                    message_id,
-                    message_num,
-                    read_status.mailbox.username,
-                    status,
-                )
-                read_status.status = status
-                read_status.save()
-
-            try:
-                m = pop3_connection.retr(message_num)
-                logging.info(
-                    "Retrieved message_id %s with message_num %s from %s",
-                    message_id,
-                    message_num,
-                    read_status.mailbox.username,
-                )
-            except error_proto as err:
-                logging.error(
-                    "Unable to RETR message num %s with Message-ID %s in %s: %s",
-                    message_num,
-                    message_id,
-                    mailbox_config,
-                    err,
-                    exc_info=True,
-                )
-                continue
-
-            try:
-                mail_message = to_mail_message_dto(m)
-            except ValueError as ve:
-                logging.error(
-                    "Unable to convert message num %s with Message-Id %s to DTO in %s: %s",
-                    message_num,
-                    message_id,
-                    mailbox_config,
-                    ve,
-                    exc_info=True,
-                )
-                mark_status(MailReadStatuses.UNPROCESSABLE)
-                continue
-
-            yield mail_message, mark_status
+        yield mail_message, mark_status
 
 
 def read_last_message(pop3_connection: POP3_SSL) -> EmailMessageDto:
@@ -195,7 +390,7 @@ def read_last_three_emails(pop3connection: POP3_SSL) -> list:
 
 def find_mail_of(extract_types: List[str], reception_status: str) -> Mail or None:
     try:
-        mail = Mail.objects.get(status=reception_status, extract_type__in=extract_types)
+        mail = Mail.objects.without_payloads().get(status=reception_status, extract_type__in=extract_types)
     except Mail.DoesNotExist:
         logging.warning("Can not find any mail in [%s] of extract type [%s]", reception_status, extract_types)
         return
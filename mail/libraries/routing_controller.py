@@ -1,8 +1,10 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from itertools import islice
 from typing import Callable, List, Optional, Tuple
 
 from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
@@ -45,6 +47,7 @@ def get_spire_to_dit_mailserver() -> MailServer:
         auth,
         hostname=settings.INCOMING_EMAIL_HOSTNAME,
         pop3_port=settings.INCOMING_EMAIL_POP3_PORT,
+        pipelined=settings.POP3_PIPELINING_ENABLED,
     )
 
 
@@ -65,6 +68,7 @@ def get_hmrc_to_dit_mailserver() -> MailServer:
         auth,
         hostname=settings.HMRC_TO_DIT_EMAIL_HOSTNAME,
         pop3_port=settings.HMRC_TO_DIT_EMAIL_POP3_PORT,
+        pipelined=settings.POP3_PIPELINING_ENABLED,
     )
 
 
@@ -82,20 +86,27 @@ def get_mock_hmrc_mailserver() -> MailServer:
 
 
 def check_and_route_emails():
+    from mail.celery_tasks import batch_send_emails
+
+    # Replies, usage data and rejection notices found in the same poll are sent together
+    with batch_send_emails():
+        _check_and_route_emails()
+
+
+def _check_and_route_emails():
     logger.info("Checking for emails")
     hmrc_to_dit_server = get_hmrc_to_dit_mailserver()
-    email_message_dtos = get_email_message_dtos(hmrc_to_dit_server, number=None)
-    email_message_dtos = sort_dtos_by_date(email_message_dtos)
-
     spire_to_dit_server = get_spire_to_dit_mailserver()
+
+    mailservers = [(hmrc_to_dit_server, None)]
     if hmrc_to_dit_server != spire_to_dit_server:
         # if the config for the return path is different to outgoing mail path
         # then check the return path otherwise don't bother as it will contain the
         # same emails.
-        reply_message_dtos = get_email_message_dtos(spire_to_dit_server)
-        reply_message_dtos = sort_dtos_by_date(reply_message_dtos)
+        mailservers.append((spire_to_dit_server, 3))
 
-        email_message_dtos.extend(reply_message_dtos)
+    email_message_dtos = get_email_message_dtos_concurrently(mailservers)
+    email_message_dtos = sort_dtos_by_date(email_message_dtos)
 
     if not email_message_dtos:
         pending_message = check_for_pending_messages()
@@ -177,7 +188,7 @@ def send(email_message_dto: EmailMessageDto):
 
 
 def _collect_and_send(mail: Mail):
-    from mail.celery_tasks import send_email_task, finalise_sending_spire_licence_details
+    from mail.celery_tasks import finalise_sending_spire_licence_details, queue_email_for_sending
 
     logger.info("Sending Mail [%s] of extract type %s", mail.id, mail.extract_type)
 
@@ -191,10 +202,7 @@ def _collect_and_send(mail: Mail):
         if message_to_send_dto.receiver != SourceEnum.LITE and message_to_send_dto.subject:
             message = build_email_message(message_to_send_dto)
             # Schedule a task to send email
-            send_email_task.apply_async(
-                args=(message,),
-                link=finalise_sending_spire_licence_details.si(mail.id, message_to_send_dto),
-            )
+            queue_email_for_sending(message, finalise_sending_spire_licence_details.si(mail.id, message_to_send_dto))
 
             logger.info(
                 "Scheduled sending of mail [%s] from [%s] to [%s] with subject %s",
@@ -209,7 +217,7 @@ def _collect_and_send(mail: Mail):
 
 def get_email_message_dtos(server: MailServer, number: Optional[int] = 3) -> List[Tuple[EmailMessageDto, Callable]]:
     pop3_connection = server.connect_to_pop3()
-    emails_iter = get_message_iterator(pop3_connection, server.user)
+    emails_iter = get_message_iterator(pop3_connection, server.user, number)
     if number:
         emails = list(islice(emails_iter, number))
     else:
@@ -219,6 +227,30 @@ def get_email_message_dtos(server: MailServer, number: Optional[int] = 3) -> Lis
     return emails
 
 
+def _get_email_message_dtos_in_thread(
+    server: MailServer, number: Optional[int]
+) -> List[Tuple[EmailMessageDto, Callable]]:
+    try:
+        return get_email_message_dtos(server, number=number)
+    finally:
+        # Database connections are per thread so close the one this thread may have opened
+        connection.close()
+
+
+def get_email_message_dtos_concurrently(
+    mailservers: List[Tuple[MailServer, Optional[int]]]
+) -> List[Tuple[EmailMessageDto, Callable]]:
+    """Reads the mailboxes in parallel so their connection and authentication round trips overlap
+
+    :param mailservers: (server, number) pairs, where number is the maximum number of emails to read from the server
+    :return: the emails from all of the mailboxes, in the order the mailservers are given
+    """
+    with ThreadPoolExecutor(max_workers=len(mailservers)) as executor:
+        futures = [executor.submit(_get_email_message_dtos_in_thread, server, number) for server, number in mailservers]
+
+        return [email for future in futures for email in future.result()]
+
+
 def check_and_notify_rejected_licences(mail):
     from mail.celery_tasks import notify_users_of_rejected_licences
 
@@ -1,84 +1,198 @@
 from collections import defaultdict
+from dataclasses import dataclass
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Set
 
 from mail.enums import LicenceStatusEnum, SourceEnum
-from mail.libraries.helpers import get_good_id, get_licence_id, get_licence_status
+from mail.libraries.chiefprotocol import FIELD_SEP, Line, tokenise
+from mail.libraries.helpers import get_licence_status, get_lite_good_ids, get_lite_licence_ids
 from mail.models import LicenceIdMapping, TransactionMapping, UsageData
 
 
-def split_edi_data_by_id(data, usage_data: UsageData = None) -> (list, list):
-    lines = data.split("\n")
+@dataclass
+class ParsedUsageFile:
+    """A usageData file split into the blocks for SPIRE and the blocks for LITE
+
+    `line_numbers` has the line number in the file of each licence line, by usage
+    transaction and then licence line number.
+    """
+
+    spire_blocks: List[list]
+    lite_blocks: List[list]
+    line_numbers: Dict[str, Dict[str, int]]
+
+
+def find_usage_file_blocks(lines: List[Line]) -> dict:
+    """Find the blocks for SPIRE and the blocks for LITE in the lines of a usageData file
+
+    Each block is returned as the [start, end) range of its lines, so the result is
+    small enough to keep alongside the file, along with the licence line numbers.
+    """
+    # Find the owner of every licence in the file up front, rather than one query per licence
+    lite_licence_references = get_lite_licence_references(
+        line.fields[4] for line in lines if line.record_type == "licenceUsage"
+    )
+
     spire_blocks = []
     lite_blocks = []
-    block = []
+    line_numbers = defaultdict(dict)
+    block_start = 0
     licence_owner = None
-    licence_id = None
     transaction_id = None
-    for line in lines:
-        line = line.strip()
-        if "licenceUsage" in line and "end" not in line:
-            licence_id = line.split("\\")[4]
-            licence_owner = id_owner(licence_id)
-            transaction_id = line.split("\\")[2]
-
-        data_line = line.split("\\", 1)[1]
-        block.append(data_line)
-
-        if usage_data:
-            if licence_owner == SourceEnum.LITE and "line" in data_line and "end" not in data_line:
-                line_number = int(data_line.split("\\")[1])
-                TransactionMapping.objects.get_or_create(
-                    line_number=line_number,
-                    usage_data=usage_data,
-                    licence_reference=licence_id,
-                    usage_transaction=transaction_id,
-                )
-
-            if (
-                licence_owner == SourceEnum.LITE
-                and not TransactionMapping.objects.filter(usage_transaction=transaction_id).exists()
-                and "end\\licenceUsage" in line
-            ):
-                TransactionMapping.objects.get_or_create(
-                    line_number=None,
-                    usage_data=usage_data,
-                    licence_reference=licence_id,
-                    usage_transaction=transaction_id,
-                )
-
-        if "fileTrailer" in line:
+    for index, line in enumerate(lines):
+        block = [block_start, index + 1]
+
+        if line.record_type == "licenceUsage":
+            licence_owner = SourceEnum.LITE if line.fields[4] in lite_licence_references else SourceEnum.SPIRE
+            transaction_id = line.fields[2]
+
+        elif line.record_type == "line" and transaction_id:
+            line_numbers[transaction_id][line.fields[2]] = line.lineno
+
+        elif line.record_type == "fileHeader":
             spire_blocks.append(block)
-            break
-        if "fileHeader" in line:
+            block_start = index + 1
+
+        elif line.record_type == "fileTrailer":
             spire_blocks.append(block)
-            block = []
+            break
 
-        if "licenceUsage" in line and "end" in line:
+        elif line.record_type == "end" and line.fields[2] == "licenceUsage":
             if licence_owner == SourceEnum.SPIRE:
                 spire_blocks.append(block)
             else:
                 lite_blocks.append(block)
-            block = []
+            block_start = index + 1
+            transaction_id = None
+
+    return {"spire_blocks": spire_blocks, "lite_blocks": lite_blocks, "line_numbers": dict(line_numbers)}
+
+
+def build_parsed_usage_file(lines: List[Line], usage_file_blocks: dict) -> ParsedUsageFile:
+    def get_block(start: int, end: int) -> list:
+        return [FIELD_SEP.join(line.fields[1:]) for line in lines[start:end]]
+
+    return ParsedUsageFile(
+        spire_blocks=[get_block(*block) for block in usage_file_blocks["spire_blocks"]],
+        lite_blocks=[get_block(*block) for block in usage_file_blocks["lite_blocks"]],
+        line_numbers=usage_file_blocks["line_numbers"],
+    )
+
+
+def parse_usage_file(data: str) -> ParsedUsageFile:
+    lines = list(tokenise(data))
+    return build_parsed_usage_file(lines, find_usage_file_blocks(lines))
+
+
+def get_parsed_usage_file(usage_data: UsageData) -> ParsedUsageFile:
+    """Return the parsed usage file of the usage data
+
+    The owner of each block is only looked up the first time it is needed. Only the
+    block ranges are stored, the blocks themselves are read from the file again.
+    """
+    lines = list(tokenise(usage_data.mail.edi_data))
+    if not usage_data.parsed_edi_data:
+        usage_data.parsed_edi_data = find_usage_file_blocks(lines)
+        usage_data.save(update_fields=["parsed_edi_data"])
+
+    return build_parsed_usage_file(lines, usage_data.parsed_edi_data)
+
+
+def split_edi_data_by_id(data, usage_data: UsageData = None) -> (list, list):
+    usage_file = parse_usage_file(data)
+
+    if usage_data:
+        create_transaction_mappings(usage_data, usage_file.lite_blocks)
+
+    return usage_file.spire_blocks, usage_file.lite_blocks
+
+
+def get_lite_licence_references(licence_references: Iterable[str]) -> Set[str]:
+    """Return the licence references that belong to LITE licences, in a single query"""
+    return set(
+        LicenceIdMapping.objects.filter(reference__in=set(licence_references)).values_list("reference", flat=True)
+    )
+
+
+def create_transaction_mappings(usage_data: UsageData, lite_blocks: List[list]) -> None:
+    """Create the TransactionMappings for the LITE licences in a usage file
+
+    Each line of a licence is mapped to its usage transaction, and a licence
+    without any lines mapped is mapped without a line number. Mappings that
+    already exist for the usage data are not created again, so this can run
+    more than once for the same usage data.
+    """
+    line_mappings = []
+    ended_transactions = []
+    for block in lite_blocks:
+        if not block[0].startswith("licenceUsage\\"):
+            continue
+
+        transaction_id, licence_id = block[0].split(FIELD_SEP)[1], block[0].split(FIELD_SEP)[3]
+        for data_line in block:
+            record_type, *fields = data_line.split(FIELD_SEP)
+            if record_type == "line":
+                line_mappings.append((transaction_id, licence_id, int(fields[0])))
+
+            elif record_type == "end" and fields[0] == "licenceUsage":
+                ended_transactions.append((transaction_id, licence_id))
+
+    fields = ("usage_transaction", "licence_reference", "line_number")
+    existing_mappings = set(TransactionMapping.objects.filter(usage_data=usage_data).values_list(*fields))
+    mapped_transactions = {usage_transaction for usage_transaction, _, _ in line_mappings}
+    mapped_transactions.update(
+        TransactionMapping.objects.filter(
+            usage_transaction__in={usage_transaction for usage_transaction, _ in ended_transactions}
+        ).values_list("usage_transaction", flat=True)
+    )
+
+    mappings = line_mappings + [
+        (usage_transaction, licence_reference, None)
+        for usage_transaction, licence_reference in ended_transactions
+        if usage_transaction not in mapped_transactions
+    ]
+
+    new_mappings = []
+    for mapping in mappings:
+        if mapping in existing_mappings:
+            continue
 
-    return spire_blocks, lite_blocks
+        existing_mappings.add(mapping)
+        new_mappings.append(TransactionMapping(usage_data=usage_data, **dict(zip(fields, mapping))))
+
+    TransactionMapping.objects.bulk_create(new_mappings)
+
+
+def iter_edifact_lines_from_data_blocks(data_blocks: list) -> Iterator[str]:
+    """Yield the lines of the data blocks renumbered from 1, without line separators"""
+    for i, line in enumerate(chain.from_iterable(data_blocks), start=1):
+        yield f"{i}\\{line}"
 
 
 def build_edifact_file_from_data_blocks(data_blocks: list) -> str:
-    spire_file = ""
-    i = 1
-    for block in data_blocks:
-        for line in block:
-            spire_file += str(i) + "\\" + line + "\n"
-            i += 1
+    return "\n".join(iter_edifact_lines_from_data_blocks(data_blocks))
 
-    spire_file = spire_file[:-1]
-    return spire_file
+
+def get_line_number(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except ValueError:
+        return None
 
 
 def build_json_payload_from_data_blocks(data_blocks: list) -> dict:
+    # The lines of the blocks have already been tokenised, so only split their fields
+    blocks = [[line.split(FIELD_SEP) for line in block] for block in data_blocks]
+
+    # Resolve the LITE ids of every licence and good up front, rather than one query per line
+    licence_references = {fields[3] for block in blocks for fields in block if fields[0] == "licenceUsage"}
+    licence_ids = get_lite_licence_ids(licence_references)
+    good_ids = get_lite_good_ids(licence_references)
+
     payload = defaultdict(list)
     licence_reference = None
 
-    for block in data_blocks:
+    for block in blocks:
         licence_payload = {
             "id": "",
             "action": "",
@@ -86,7 +200,7 @@ def build_json_payload_from_data_blocks(data_blocks: list) -> dict:
             "goods": [],
         }
 
-        for line in block:
+        for record_type, *fields in block:
             good_payload = {
                 "id": "",
                 "usage": "",
@@ -94,23 +208,22 @@ def build_json_payload_from_data_blocks(data_blocks: list) -> dict:
                 "currency": "",
             }
 
-            line_array = line.split("\\")
-            if "licenceUsage" in line and "end" not in line:
-                licence_reference = line_array[3]
-                licence_status_code = line_array[4]
+            if record_type == "licenceUsage":
+                licence_reference = fields[2]
+                licence_status_code = fields[3]
                 licence_payload["action"] = get_licence_status(licence_status_code)
 
                 # completion date is only include when licence is complete (i.e., not Open)
-                if licence_status_code != "O" and len(line_array) >= 6:
-                    licence_payload["completion_date"] = line_array[5]
-                licence_payload["id"] = get_licence_id(licence_reference)
-
-            if "line" == line_array[0]:
-                good_payload["id"] = get_good_id(line_number=line_array[1], licence_reference=licence_reference)
-                good_payload["usage"] = line_array[2]
-                good_payload["value"] = line_array[3]
-                if len(line_array) == 5:
-                    good_payload["currency"] = line_array[4]
+                if licence_status_code != "O" and len(fields) >= 5:
+                    licence_payload["completion_date"] = fields[4]
+                licence_payload["id"] = licence_ids.get(licence_reference)
+
+            if record_type == "line":
+                good_payload["id"] = good_ids.get((licence_reference, get_line_number(fields[0])))
+                good_payload["usage"] = fields[1]
+                good_payload["value"] = fields[2]
+                if len(fields) == 4:
+                    good_payload["currency"] = fields[3]
 
                 licence_payload["goods"].append(good_payload)
 
@@ -8,7 +8,7 @@ from django.utils import timezone
 
 from mail.chief.licence_reply import types
 from mail.enums import ReceptionStatusEnum
-from mail.libraries.chiefprotocol import FIELD_SEP, LINE_SEP
+from mail.libraries.chiefprotocol import FIELD_SEP, LINE_SEP, field_values
 from mail.models import LicenceData, LicencePayload, Mail
 
 
@@ -120,7 +120,7 @@ def get_rejected_transaction(lp: LicencePayload) -> list:
 
 def create_licence_reply_file(licence_reply_lines: List[dataclasses.dataclass]):
     return LINE_SEP.join(
-        format_line((line_no, line.record_type) + dataclasses.astuple(line))
+        format_line((line_no, line.record_type) + field_values(line))
         for line_no, line in enumerate(licence_reply_lines, start=1)
     )
 
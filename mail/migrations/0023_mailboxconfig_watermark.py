@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0022_alter_licencedata_licence_payloads"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailboxconfig",
+            name="last_seen_message_num",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Sequence number of the message identified by last_seen_uid when it was last listed",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailboxconfig",
+            name="last_seen_uid",
+            field=models.TextField(
+                blank=True,
+                help_text="UIDL of the last message in the mailbox that no longer needs to be checked",
+                null=True,
+            ),
+        ),
+    ]
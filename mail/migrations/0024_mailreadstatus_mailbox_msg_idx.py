@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0023_mailboxconfig_watermark"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mailreadstatus",
+            index=models.Index(fields=["mailbox", "message_id", "status"], name="mailreadstatus_mailbox_msg_idx"),
+        ),
+    ]
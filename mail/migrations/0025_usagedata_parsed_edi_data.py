@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0024_mailreadstatus_mailbox_msg_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usagedata",
+            name="parsed_edi_data",
+            field=models.JSONField(default=dict),
+        ),
+    ]
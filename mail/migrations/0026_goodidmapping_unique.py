@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:05
+
+from django.db import migrations
+from django.db.models import Min
+
+
+def remove_duplicate_good_id_mappings(apps, schema_editor):
+    GoodIdMapping = apps.get_model("mail", "GoodIdMapping")
+
+    first_ids = (
+        GoodIdMapping.objects.values("lite_id", "licence_reference", "line_number")
+        .annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    GoodIdMapping.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0025_usagedata_parsed_edi_data"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_good_id_mappings, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="goodidmapping",
+            unique_together={("lite_id", "licence_reference", "line_number")},
+        ),
+    ]
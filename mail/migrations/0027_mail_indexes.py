@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:06
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, which can't be done in a transaction
+    atomic = False
+
+    dependencies = [
+        ("mail", "0026_goodidmapping_unique"),
+    ]
+
+    operations = [
+        # Built without locking writes to mail, which is written to by every mail that is processed
+        AddIndexConcurrently(
+            model_name="mail",
+            index=models.Index(fields=["status", "extract_type", "created_at"], name="mail_status_type_created_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="mail",
+            index=models.Index(fields=["extract_type", "created_at"], name="mail_type_created_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="mail",
+            index=models.Index(
+                condition=models.Q(("status", "reply_sent"), _negated=True),
+                fields=["status", "created_at"],
+                name="mail_in_progress_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:07
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def create_licence_references(apps, schema_editor):
+    LicenceData = apps.get_model("mail", "LicenceData")
+    LicenceReference = apps.get_model("mail", "LicenceReference")
+
+    licence_references = []
+    for licence_data_id, licence_ids in LicenceData.objects.values_list("id", "licence_ids").iterator():
+        for reference in set(json.loads(licence_ids)) if licence_ids else set():
+            licence_references.append(LicenceReference(licence_data_id=licence_data_id, reference=reference))
+
+        if len(licence_references) >= BATCH_SIZE:
+            LicenceReference.objects.bulk_create(licence_references, ignore_conflicts=True)
+            licence_references = []
+
+    LicenceReference.objects.bulk_create(licence_references, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0027_mail_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LicenceReference",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("reference", models.CharField(max_length=35)),
+                (
+                    "licence_data",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="licence_references",
+                        to="mail.licencedata",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("reference", "licence_data")},
+            },
+        ),
+        migrations.RunPython(create_licence_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,144 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:09
+
+import json
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models, transaction
+from django.db.models import F
+
+BATCH_SIZE = 1000
+
+
+# Until the old column is dropped, every write to licence_ids is copied to the new column, so the
+# licence ids written by the old release while the migration runs aren't lost
+CREATE_COPY_TRIGGER = """
+CREATE FUNCTION mail_licencedata_copy_licence_ids() RETURNS trigger AS $$
+BEGIN
+    BEGIN
+        NEW.new_licence_ids := NULLIF(NEW.licence_ids, '')::jsonb;
+    EXCEPTION WHEN invalid_text_representation THEN
+        -- Keep any value that isn't JSON as it is
+        NEW.new_licence_ids := to_jsonb(NEW.licence_ids);
+    END;
+    -- The column isn't nullable, so a JSON null is stored as no licences
+    IF NEW.new_licence_ids IS NULL OR jsonb_typeof(NEW.new_licence_ids) = 'null' THEN
+        NEW.new_licence_ids := '[]'::jsonb;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER mail_licencedata_copy_licence_ids
+BEFORE INSERT OR UPDATE OF licence_ids ON mail_licencedata
+FOR EACH ROW EXECUTE PROCEDURE mail_licencedata_copy_licence_ids();
+"""
+
+DROP_COPY_TRIGGER = """
+DROP TRIGGER IF EXISTS mail_licencedata_copy_licence_ids ON mail_licencedata;
+DROP FUNCTION IF EXISTS mail_licencedata_copy_licence_ids();
+"""
+
+
+def copy_licence_ids(apps, schema_editor):
+    """Copy the JSON text of licence_ids to the new column, a batch at a time.
+
+    Setting licence_ids to itself runs the trigger, which does the copy, so each row is
+    read and written by the same statement. Each batch is committed on its own, so rows
+    are only locked while their batch is updated and the migration can be run again if
+    it is interrupted.
+    """
+    LicenceData = apps.get_model("mail", "LicenceData")
+
+    last_id = 0
+    while True:
+        ids = list(
+            LicenceData.objects.filter(id__gt=last_id, new_licence_ids__isnull=True)
+            .order_by("id")
+            .values_list("id", flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+
+        LicenceData.objects.filter(id__in=ids).update(licence_ids=F("licence_ids"))
+
+        last_id = ids[-1]
+
+
+def check_licence_ids_copied(apps, schema_editor):
+    """Stop before the old column is dropped if any licence ids haven't been copied."""
+    LicenceData = apps.get_model("mail", "LicenceData")
+
+    if LicenceData.objects.filter(new_licence_ids__isnull=True).exists():
+        raise RuntimeError("Not all licence ids have been copied to the new column, run the migration again")
+
+
+def copy_licence_ids_back(apps, schema_editor):
+    """Copy the licence ids back to the text column as JSON, a batch at a time."""
+    LicenceData = apps.get_model("mail", "LicenceData")
+
+    last_id = 0
+    while True:
+        batch = list(
+            LicenceData.objects.filter(id__gt=last_id, licence_ids__isnull=True)
+            .only("id", "new_licence_ids")
+            .order_by("id")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        for licence_data in batch:
+            licence_data.licence_ids = json.dumps(licence_data.new_licence_ids)
+
+        with transaction.atomic():
+            LicenceData.objects.bulk_update(batch, ["licence_ids"])
+
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    # The licence ids are copied in batches, each in its own transaction, and the index is built concurrently
+    atomic = False
+
+    dependencies = [
+        ("mail", "0028_licencereference"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="licencedata",
+            name="new_licence_ids",
+            field=models.JSONField(null=True),
+        ),
+        # So licence_ids can be added back empty and filled in when the migration is reversed
+        migrations.AlterField(
+            model_name="licencedata",
+            name="licence_ids",
+            field=models.TextField(null=True),
+        ),
+        migrations.RunSQL(CREATE_COPY_TRIGGER, DROP_COPY_TRIGGER),
+        migrations.RunPython(copy_licence_ids, copy_licence_ids_back),
+        migrations.RunPython(check_licence_ids_copied, migrations.RunPython.noop),
+        # Dropping the column drops the trigger along with it, so there is no gap for a write to be missed
+        migrations.RemoveField(
+            model_name="licencedata",
+            name="licence_ids",
+        ),
+        # Remove the function of the trigger
+        migrations.RunSQL(DROP_COPY_TRIGGER, migrations.RunSQL.noop),
+        migrations.RenameField(
+            model_name="licencedata",
+            old_name="new_licence_ids",
+            new_name="licence_ids",
+        ),
+        migrations.AlterField(
+            model_name="licencedata",
+            name="licence_ids",
+            field=models.JSONField(default=list),
+        ),
+        # Built without locking writes to the table, which needs the migration to be non-atomic
+        AddIndexConcurrently(
+            model_name="licencedata",
+            index=GinIndex(fields=["licence_ids"], name="licencedata_licence_ids_gin", opclasses=["jsonb_path_ops"]),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:15
+
+from django.db import migrations, models, transaction
+
+import mail.fields
+
+BATCH_SIZE = 100
+
+PAYLOAD_FIELDS = ["edi_data", "sent_data", "response_data", "sent_response_data", "raw_data"]
+
+# The previous release keeps writing the text columns while the payloads are copied, so a compressed
+# copy is cleared when its text changes and the row is copied again by the next pass
+CREATE_CLEAR_TRIGGER = """
+CREATE FUNCTION mail_clear_compressed_payloads() RETURNS trigger AS $$
+BEGIN
+{checks}
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER mail_clear_compressed_payloads
+BEFORE UPDATE ON mail
+FOR EACH ROW EXECUTE PROCEDURE mail_clear_compressed_payloads();
+""".format(
+    checks="\n".join(
+        f"    IF NEW.{field} IS DISTINCT FROM OLD.{field} THEN\n        NEW.new_{field} := NULL;\n    END IF;"
+        for field in PAYLOAD_FIELDS
+    )
+)
+
+DROP_CLEAR_TRIGGER = """
+DROP TRIGGER IF EXISTS mail_clear_compressed_payloads ON mail;
+DROP FUNCTION IF EXISTS mail_clear_compressed_payloads();
+"""
+
+
+def get_uncopied_mail(Mail, from_prefix, to_prefix):
+    uncopied = models.Q()
+    for field in PAYLOAD_FIELDS:
+        uncopied |= models.Q(**{f"{to_prefix}{field}__isnull": True, f"{from_prefix}{field}__isnull": False})
+    return Mail.objects.filter(uncopied)
+
+
+def copy_payloads(apps, schema_editor, from_prefix, to_prefix):
+    """Copy the payloads of the mail that hasn't been copied, a batch at a time.
+
+    The rows of a batch are locked while they are copied, so they can't change between
+    being read and written. Each batch is committed on its own and only the mail that
+    still needs copying is read, so this can be run again if it is interrupted.
+    """
+    Mail = apps.get_model("mail", "Mail")
+    from_fields = [f"{from_prefix}{field}" for field in PAYLOAD_FIELDS]
+    to_fields = [f"{to_prefix}{field}" for field in PAYLOAD_FIELDS]
+
+    uncopied = get_uncopied_mail(Mail, from_prefix, to_prefix).only("id", *from_fields).order_by("id")
+    last_id = None
+    while True:
+        with transaction.atomic():
+            batch = uncopied if last_id is None else uncopied.filter(id__gt=last_id)
+            batch = list(batch.select_for_update()[:BATCH_SIZE])
+            if not batch:
+                break
+
+            for mail in batch:
+                for from_field, to_field in zip(from_fields, to_fields):
+                    setattr(mail, to_field, getattr(mail, from_field))
+
+            Mail.objects.bulk_update(batch, to_fields)
+
+        last_id = batch[-1].id
+
+
+def compress_payloads(apps, schema_editor):
+    """Copy the payloads to the new columns, which compresses them."""
+    copy_payloads(apps, schema_editor, from_prefix="", to_prefix="new_")
+
+
+def decompress_payloads(apps, schema_editor):
+    copy_payloads(apps, schema_editor, from_prefix="new_", to_prefix="")
+
+
+class Migration(migrations.Migration):
+    """Adds compressed copies of the payloads, in new bytea columns, and fills them in.
+
+    The table isn't rewritten, so it can still be read and written while the payloads
+    are copied. 0031 copies anything written since and replaces the text columns.
+    """
+
+    # The payloads are copied in batches, each in its own transaction
+    atomic = False
+
+    dependencies = [
+        ("mail", "0029_licencedata_licence_ids_jsonb"),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name="mail",
+                name=f"new_{field}",
+                field=mail.fields.CompressedTextField(blank=True, null=True),
+            )
+            for field in PAYLOAD_FIELDS
+        ],
+        # So raw_data can be added back empty and filled in when 0031 is reversed
+        migrations.AlterField(
+            model_name="mail",
+            name="raw_data",
+            field=models.TextField(null=True),
+        ),
+        migrations.RunSQL(CREATE_CLEAR_TRIGGER, DROP_CLEAR_TRIGGER),
+        migrations.RunPython(compress_payloads, migrations.RunPython.noop),
+    ]
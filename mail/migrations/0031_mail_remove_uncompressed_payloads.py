@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:30
+
+from importlib import import_module
+
+from django.db import migrations
+
+import mail.fields
+
+compressed_payloads = import_module("mail.migrations.0030_mail_compressed_payloads")
+PAYLOAD_FIELDS = compressed_payloads.PAYLOAD_FIELDS
+
+
+def check_payloads_copied(apps, schema_editor):
+    """Stop before the text columns are dropped if any payload hasn't been compressed."""
+    Mail = apps.get_model("mail", "Mail")
+
+    if compressed_payloads.get_uncopied_mail(Mail, from_prefix="", to_prefix="new_").exists():
+        raise RuntimeError("Not all payloads have been compressed, run the migration again")
+
+
+class Migration(migrations.Migration):
+    """Replaces the text columns of the payloads with the compressed columns added by 0030.
+
+    Writes to mail are blocked from the final copy until the text columns are gone, so
+    nothing the previous release writes in the meantime is lost. Only the mail written
+    since 0030 is copied while they are blocked, reads carry on until the columns are
+    swapped.
+    """
+
+    dependencies = [
+        ("mail", "0030_mail_compressed_payloads"),
+    ]
+
+    operations = [
+        migrations.RunSQL("LOCK TABLE mail IN SHARE ROW EXCLUSIVE MODE", migrations.RunSQL.noop),
+        migrations.RunPython(compressed_payloads.compress_payloads, compressed_payloads.decompress_payloads),
+        migrations.RunPython(check_payloads_copied, migrations.RunPython.noop),
+        migrations.RunSQL(compressed_payloads.DROP_CLEAR_TRIGGER, migrations.RunSQL.noop),
+        *[
+            migrations.RemoveField(
+                model_name="mail",
+                name=field,
+            )
+            for field in PAYLOAD_FIELDS
+        ],
+        *[
+            migrations.RenameField(
+                model_name="mail",
+                old_name=f"new_{field}",
+                new_name=field,
+            )
+            for field in PAYLOAD_FIELDS
+        ],
+        migrations.AlterField(
+            model_name="mail",
+            name="raw_data",
+            field=mail.fields.CompressedTextField(),
+        ),
+    ]
@@ -5,6 +5,7 @@ from datetime import timedelta
 from typing import List
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
 from django.db import IntegrityError, models
 from django.utils import timezone
 from model_utils.models import TimeStampedModel
@@ -17,11 +18,22 @@ from mail.enums import (
     ReceptionStatusEnum,
     SourceEnum,
 )
+from mail.fields import CompressedTextField
 
 logger = logging.getLogger(__name__)
 
 
+class MailQuerySet(models.QuerySet):
+    def without_payloads(self):
+        """Leaves out the attachments, which are fetched from the database if they are used."""
+        return self.defer(*Mail.PAYLOAD_FIELDS)
+
+
 class Mail(models.Model):
+    # The attachments and the raw email, which can be large and aren't needed to follow the workflow.
+    # They are stored compressed, see CompressedTextField
+    PAYLOAD_FIELDS = ("edi_data", "sent_data", "response_data", "sent_response_data", "raw_data")
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
     # For licence_data / licence_reply emails they are saved on a single db record.
@@ -33,21 +45,21 @@ class Mail(models.Model):
 
     # licenceData fields
     edi_filename = models.TextField(null=True, blank=True)
-    edi_data = models.TextField(null=True, blank=True)
+    edi_data = CompressedTextField(null=True, blank=True)
     sent_filename = models.TextField(blank=True, null=True)
-    sent_data = models.TextField(blank=True, null=True)
+    sent_data = CompressedTextField(blank=True, null=True)
     sent_at = models.DateTimeField(blank=True, null=True)
 
     # licenceReply / Usage fields
     response_filename = models.TextField(blank=True, null=True)
-    response_data = models.TextField(blank=True, null=True)
+    response_data = CompressedTextField(blank=True, null=True)
     response_date = models.DateTimeField(blank=True, null=True)
     response_subject = models.TextField(null=True, blank=True)
 
     sent_response_filename = models.TextField(blank=True, null=True)
-    sent_response_data = models.TextField(blank=True, null=True)
+    sent_response_data = CompressedTextField(blank=True, null=True)
 
-    raw_data = models.TextField()
+    raw_data = CompressedTextField()
 
     created_at = models.DateTimeField(auto_now_add=True, blank=True)
     currently_processing_at = models.DateTimeField(null=True)
@@ -55,20 +67,37 @@ class Mail(models.Model):
 
     retry = models.BooleanField(default=False)
 
+    objects = MailQuerySet.as_manager()
+
     class Meta:
         db_table = "mail"
         ordering = ["created_at"]
+        indexes = [
+            # The mail in each state of the workflow, oldest first
+            models.Index(fields=["status", "extract_type", "created_at"], name="mail_status_type_created_idx"),
+            models.Index(fields=["extract_type", "created_at"], name="mail_type_created_idx"),
+            # Only the mail that is still in progress, which stays small as the table grows
+            models.Index(
+                fields=["status", "created_at"],
+                condition=~models.Q(status=ReceptionStatusEnum.REPLY_SENT),
+                name="mail_in_progress_idx",
+            ),
+        ]
 
     def __repr__(self):
         return f"id={self.id} status={self.status}"
 
     def save(self, *args, **kwargs):
-        if not self.edi_data or not self.edi_filename:
+        # Deferred fields aren't saved, so they are left out of the check rather than fetched for it
+        deferred_fields = self.get_deferred_fields()
+        edi_data = self.edi_data if "edi_data" not in deferred_fields else "deferred"
+        edi_filename = self.edi_filename if "edi_filename" not in deferred_fields else "deferred"
+        if not edi_data or not edi_filename:
             logger.error(
                 "Setting `edi_data` or `edi_filename` to null or blank: self=%s, edi_data=%s edi_filename=%s",
                 self,
-                self.edi_data,
-                self.edi_filename,
+                edi_data,
+                edi_filename,
                 exc_info=True,
             )
             raise IntegrityError("The field edi_filename or edi_data is empty which is not valid")
@@ -89,7 +118,7 @@ class Mail(models.Model):
 
 
 class LicenceData(models.Model):
-    licence_ids = models.TextField()
+    licence_ids = models.JSONField(default=list)  # The references of the licences in the file
     hmrc_run_number = models.IntegerField()
     source_run_number = models.IntegerField(null=True)
     source = models.CharField(choices=SourceEnum.choices, max_length=10)
@@ -100,6 +129,11 @@ class LicenceData(models.Model):
 
     class Meta:
         ordering = ["mail__created_at"]
+        indexes = [
+            # For containment queries, like licence_ids__contains=[reference], when looking into which files a
+            # licence was sent in. The Licence view looks licences up through LicenceReference instead
+            GinIndex(fields=["licence_ids"], opclasses=["jsonb_path_ops"], name="licencedata_licence_ids_gin"),
+        ]
 
     def __repr__(self):
         source = self.source
@@ -109,10 +143,28 @@ class LicenceData(models.Model):
         return f"hmrc_run_number={self.hmrc_run_number} source={source} status={self.mail.status}"
 
     def set_licence_ids(self, data: List):
-        self.licence_ids = json.dumps(data)
+        self.licence_ids = data
 
     def get_licence_ids(self):
-        return json.loads(self.licence_ids)
+        return self.licence_ids
+
+    def create_licence_references(self):
+        """Index the licences in this licence data by reference, so they can be found without searching `licence_ids`"""
+        references = set(self.get_licence_ids() or [])
+        LicenceReference.objects.bulk_create(
+            [LicenceReference(licence_data=self, reference=reference) for reference in references],
+            ignore_conflicts=True,
+        )
+
+
+class LicenceReference(models.Model):
+    """A licence in a LicenceData file, by its reference."""
+
+    reference = models.CharField(max_length=35)
+    licence_data = models.ForeignKey(LicenceData, on_delete=models.CASCADE, related_name="licence_references")
+
+    class Meta:
+        unique_together = [["reference", "licence_data"]]
 
 
 class UsageData(models.Model):
@@ -132,6 +184,7 @@ class UsageData(models.Model):
     lite_licences = models.JSONField(default=dict)
     spire_licences = models.JSONField(default=dict)
     lite_response = models.JSONField(default=dict)
+    parsed_edi_data = models.JSONField(default=dict)  # The line ranges of the SPIRE and LITE blocks of the usage file
 
     class Meta:
         ordering = ["mail__created_at"]
@@ -192,6 +245,9 @@ class GoodIdMapping(models.Model):
     licence_reference = models.CharField(null=False, blank=False, max_length=35, unique=False)
     line_number = models.PositiveIntegerField()
 
+    class Meta:
+        unique_together = [["lite_id", "licence_reference", "line_number"]]
+
 
 class TransactionMapping(models.Model):
     licence_reference = models.CharField(null=False, blank=False, max_length=35, unique=False)
@@ -202,6 +258,16 @@ class TransactionMapping(models.Model):
 
 class MailboxConfig(TimeStampedModel):
     username = models.TextField(null=False, blank=False, primary_key=True, help_text="Username of the POP3 mailbox")
+    last_seen_uid = models.TextField(
+        null=True,
+        blank=True,
+        help_text="UIDL of the last message in the mailbox that no longer needs to be checked",
+    )
+    last_seen_message_num = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Sequence number of the message identified by last_seen_uid when it was last listed",
+    )
 
 
 class MailReadStatus(TimeStampedModel):
@@ -218,5 +284,10 @@ class MailReadStatus(TimeStampedModel):
     status = models.TextField(choices=MailReadStatuses.choices, default=MailReadStatuses.UNREAD, db_index=True)
     mailbox = models.ForeignKey(MailboxConfig, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["mailbox", "message_id", "status"], name="mailreadstatus_mailbox_msg_idx"),
+        ]
+
     def __repr__(self):
         return f"message_id={self.message_id} status={self.status}"
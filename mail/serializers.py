@@ -1,6 +1,7 @@
 import json
 import logging
 from datetime import datetime
+from typing import List
 
 from rest_framework import serializers
 
@@ -24,10 +25,24 @@ class LicenceDataSerializer(serializers.ModelSerializer):
         exclude = ("licence_payloads",)
 
     def create(self, validated_data):
+        validated_data["licence_ids"] = json.loads(validated_data["licence_ids"])
         instance, _ = LicenceData.objects.get_or_create(**validated_data)
+        instance.create_licence_references()
         return instance
 
 
+def find_duplicate_mail(validated_data) -> List[Mail]:
+    """The mail that has already been saved with the same values, oldest first.
+
+    The payloads are compared once they have been read, rather than as the compressed
+    bytes in the database, which aren't always the same for the same text.
+    """
+    mails = Mail.objects.filter(
+        edi_filename=validated_data.get("edi_filename"), extract_type=validated_data.get("extract_type")
+    ).order_by("created_at")
+    return [mail for mail in mails if all(getattr(mail, field) == value for field, value in validated_data.items())]
+
+
 class LicenceDataMailSerializer(serializers.ModelSerializer):
     licence_data = LicenceDataSerializer(write_only=True)
 
@@ -46,13 +61,15 @@ class LicenceDataMailSerializer(serializers.ModelSerializer):
         licence_data = validated_data.pop("licence_data")
         # Mail object should not exist for licence_data, so we can create it here safely
 
-        dups = Mail.objects.filter(**validated_data)
+        dups = find_duplicate_mail(validated_data)
 
-        if dups and dups.first().response_data and "rejected" in dups.first().response_data:
+        if dups and dups[0].response_data and "rejected" in dups[0].response_data:
             validated_data["retry"] = True
             mail = Mail.objects.create(**validated_data)
+        elif dups:
+            mail = dups[0]
         else:
-            mail, _ = Mail.objects.get_or_create(**validated_data)
+            mail = Mail.objects.create(**validated_data)
 
         licence_data["mail"] = mail.id
 
@@ -127,7 +144,9 @@ class UsageDataMailSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         usage_data = validated_data.pop("usage_data")
-        mail, created = Mail.objects.get_or_create(**validated_data)
+        dups = find_duplicate_mail(validated_data)
+        created = not dups
+        mail = dups[0] if dups else Mail.objects.create(**validated_data)
 
         usage_data["mail"] = mail.id
 
@@ -1,12 +1,73 @@
 import logging
 import poplib
 import smtplib
-from contextlib import contextmanager
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import List, Optional, Tuple, Union
 
 from django.conf import settings
 
 from mail.auth import Authenticator
 
+PipelineResponse = Union[Tuple[bytes, List[bytes], int], poplib.error_proto]
+
+
+class PipelinedPOP3_SSL(poplib.POP3_SSL):
+    """pop3 connection that can send a batch of commands before reading any of the responses.
+
+    Commands are only pipelined when the server advertises the PIPELINING capability (RFC 2449),
+    otherwise they are sent one at a time. Either way the responses are returned in command order.
+    """
+
+    _supports_pipelining: Optional[bool] = None
+
+    def __init__(self, *args, batch_size: int = settings.POP3_PIPELINE_BATCH_SIZE, **kwargs):
+        self.batch_size = batch_size
+        super().__init__(*args, **kwargs)
+
+    def supports_pipelining(self) -> bool:
+        if self._supports_pipelining is None:
+            try:
+                self._supports_pipelining = "PIPELINING" in self.capa()
+            except poplib.error_proto:
+                self._supports_pipelining = False
+
+            logging.info("pop3 server supports pipelining: %s", self._supports_pipelining)
+
+        return self._supports_pipelining
+
+    def pipeline(self, commands: List[str]) -> List[PipelineResponse]:
+        """Runs multi-line commands (e.g. TOP/RETR) and returns their responses in order.
+
+        A command the server rejects doesn't stop the others, its error_proto is returned in its place.
+        """
+        if not self.supports_pipelining():
+            return [self._try_longcmd(command) for command in commands]
+
+        responses = []
+        for start in range(0, len(commands), self.batch_size):
+            batch = commands[start : start + self.batch_size]
+            self.sock.sendall(b"".join(bytes(command, self.encoding) + poplib.CRLF for command in batch))
+            for _ in batch:
+                try:
+                    responses.append(self._getlongresp())
+                except poplib.error_proto as err:
+                    responses.append(err)
+
+        return responses
+
+    def _try_longcmd(self, command: str) -> PipelineResponse:
+        try:
+            return self._longcmd(command)
+        except poplib.error_proto as err:
+            return err
+
+    def top_many(self, message_nums: List[str], howmuch: int) -> List[PipelineResponse]:
+        return self.pipeline([f"TOP {message_num} {howmuch}" for message_num in message_nums])
+
+    def retr_many(self, message_nums: List[str]) -> List[PipelineResponse]:
+        return self.pipeline([f"RETR {message_num}" for message_num in message_nums])
+
 
 class MailServer(object):
     def __init__(
@@ -14,10 +75,12 @@ class MailServer(object):
         auth: Authenticator,
         hostname: str = settings.EMAIL_HOSTNAME,
         pop3_port: int = settings.EMAIL_POP3_PORT,
+        pipelined: bool = False,
     ):
         self.auth = auth
         self.pop3_port = pop3_port
         self.hostname = hostname
+        self.pipelined = pipelined
         self.pop3_connection = None
 
     def __eq__(self, other):
@@ -28,7 +91,10 @@ class MailServer(object):
 
     def connect_to_pop3(self) -> poplib.POP3_SSL:
         logging.info("Establishing a pop3 connection to %s:%s", self.hostname, self.pop3_port)
-        self.pop3_connection = poplib.POP3_SSL(self.hostname, self.pop3_port, timeout=60)
+        if self.pipelined:
+            self.pop3_connection = PipelinedPOP3_SSL(self.hostname, self.pop3_port, timeout=60)
+        else:
+            self.pop3_connection = poplib.POP3_SSL(self.hostname, self.pop3_port, timeout=60)
         self.auth.authenticate(self.pop3_connection)
         logging.info("pop3 connection established")
         return self.pop3_connection
@@ -57,7 +123,37 @@ def get_smtp_connection():
         yield conn
 
 
+_smtp_session = threading.local()
+
+
+@contextmanager
+def smtp_session():
+    """Sends made with smtp_send inside this block share one SMTP connection.
+
+    The connection is opened by the first send and closed when the block exits, so
+    a batch of emails only does the TLS and LOGIN handshake once.
+    """
+    if getattr(_smtp_session, "stack", None) is not None:
+        # Already in a session, the outermost block closes the connection
+        yield
+        return
+
+    with ExitStack() as stack:
+        _smtp_session.stack = stack
+        _smtp_session.conn = None
+        try:
+            yield
+        finally:
+            _smtp_session.stack = _smtp_session.conn = None
+
+
 def smtp_send(message):
+    stack = getattr(_smtp_session, "stack", None)
+    if stack is not None:
+        if _smtp_session.conn is None:
+            _smtp_session.conn = stack.enter_context(get_smtp_connection())
+        return _smtp_session.conn.send_message(message)
+
     with get_smtp_connection() as conn:
         result = conn.send_message(message)
 
@@ -3,7 +3,7 @@ import pathlib
 import pytest
 
 from mail.chief.licence_reply import LicenceReplyProcessor
-from mail.chief.licence_reply.types import FileError, RejectedTransactionError
+from mail.chief.licence_reply.types import AcceptedTransaction, FileError, RejectedTransactionError
 from mail.enums import ExtractTypeEnum, ReceptionStatusEnum
 from mail.models import Mail
 
@@ -138,3 +138,51 @@ def test_is_valid_is_called():
         ValueError, match="Unable to get rejected_licences when file hasn't been validated or is invalid"
     ):
         _ = processor.rejected_licences
+
+
+def test_lazy_processor_streams_transactions(licence_reply_example):
+    processor = LicenceReplyProcessor(licence_reply_example, lazy=True)
+
+    transactions = processor.iter_transactions()
+    first = next(transactions)
+
+    assert first.transaction_ref == "ABC12345"
+    assert processor.accepted_count == 1
+    assert processor.file_trailer is None
+
+    transaction_refs = [first.transaction_ref] + [
+        t.transaction_ref if isinstance(t, AcceptedTransaction) else t.header.transaction_ref for t in transactions
+    ]
+    assert transaction_refs == ["ABC12345", "ABC12346", "ABC12347", "ABC12348"]
+    assert processor.accepted_count == 3
+    assert processor.rejected_count == 1
+    assert processor.file_valid()
+
+    with pytest.raises(
+        ValueError,
+        match="Unable to get accepted_licences when the file is loaded lazily, use iter_transactions instead",
+    ):
+        _ = processor.accepted_licences
+
+
+def test_lazy_processor_stops_on_file_error():
+    file_with_file_error = (
+        "1\\fileHeader\\CHIEF\\ILBDOTI\\licenceReply\\202209231140\\29236\n"
+        "2\\fileError\\18\\Record type 'fileHeader' not recognised\\99\n"
+        "3\\accepted\\ABC12348\n"
+        "4\\fileTrailer\\1\\0\\1\n"
+    )
+    processor = LicenceReplyProcessor(file_with_file_error, lazy=True)
+
+    assert list(processor.iter_transactions(stop_on_file_error=True)) == []
+    assert processor.file_errors == [
+        FileError(code="18", text="Record type 'fileHeader' not recognised", position="99")
+    ]
+    assert processor.file_trailer is None
+    assert not processor.file_trailer_valid()
+    assert not processor.file_valid()
+
+    # Without stopping the whole file is read
+    assert [t.transaction_ref for t in processor.iter_transactions()] == ["ABC12348"]
+    assert len(processor.file_errors) == 1
+    assert processor.file_trailer_valid()
@@ -1,6 +1,8 @@
+import dataclasses
 import typing
 import unittest
 
+from mail.chief.licence_reply.types import AcceptedTransaction
 from mail.libraries import chiefprotocol
 from mail.libraries.chieftypes import End, FileHeader, FileTrailer, Licence, LicenceDataLine, _Record
 
@@ -23,7 +25,7 @@ class ResolveLineNumbersTest(unittest.TestCase):
     def test_end_transaction_1(self):
         lines = [
             Licence(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
         ]
         result = chiefprotocol.resolve_line_numbers(lines)
 
@@ -40,7 +42,7 @@ class ResolveLineNumbersTest(unittest.TestCase):
             Licence(),
             LicenceDataLine(),
             LicenceDataLine(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
         ]
         result = chiefprotocol.resolve_line_numbers(lines)
 
@@ -53,10 +55,10 @@ class ResolveLineNumbersTest(unittest.TestCase):
             FileHeader(),
             Licence(),
             LicenceDataLine(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
             Licence(),
             LicenceDataLine(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
             FileTrailer(),
         ]
         result = chiefprotocol.resolve_line_numbers(lines)
@@ -74,6 +76,22 @@ class ResolveLineNumbersTest(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class IterLineNumbersTest(unittest.TestCase):
+    def test_lines_are_numbered_as_they_are_consumed(self):
+        def generate_lines():
+            yield Licence()
+            yield End(start_record_type=Licence.record_type)
+            # The previous lines were numbered before this one was requested.
+            self.assertEqual(resolved[-1], End(lineno=2, start_record_type="licence", record_count=2))
+            yield FileTrailer()
+
+        resolved = []
+        for line in chiefprotocol.iter_line_numbers(generate_lines()):
+            resolved.append(line)
+
+        self.assertEqual(resolved[-1], FileTrailer(lineno=3))
+
+
 class FormatLineTest(unittest.TestCase):
     def test_format_stringy_type(self):
         class Stringy:
@@ -98,7 +116,7 @@ class FormatLinesTest(unittest.TestCase):
         lines = [
             FileHeader(),
             Licence(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
         ]
         result = chiefprotocol.format_lines(lines)
 
@@ -120,11 +138,83 @@ class CountTransactionsTest(unittest.TestCase):
         lines = [
             FileHeader(),
             Licence(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
             Licence(),
-            End(start_record_type=Licence.type_),
+            End(start_record_type=Licence.record_type),
             FileTrailer(),
         ]
         result = chiefprotocol.count_transactions(lines)
 
         self.assertEqual(result, 2)
+
+
+class TokeniseTest(unittest.TestCase):
+    def test_tokenise_lines(self):
+        data = "1\\fileHeader\\SPIRE\\CHIEF\n2\\end\\licence\\2\n3\\fileTrailer\\1\n"
+        result = list(chiefprotocol.tokenise(data))
+
+        expected = [
+            chiefprotocol.Line(1, "fileHeader", ["1", "fileHeader", "SPIRE", "CHIEF"]),
+            chiefprotocol.Line(2, "end", ["2", "end", "licence", "2"]),
+            chiefprotocol.Line(3, "fileTrailer", ["3", "fileTrailer", "1"]),
+        ]
+        self.assertEqual(result, expected)
+
+    def test_tokenise_skips_blank_lines_and_keeps_their_position(self):
+        data = "1\\fileHeader\\SPIRE\r\n\r\n   \n2\\fileTrailer\\0\r\n"
+        result = list(chiefprotocol.tokenise(data))
+
+        expected = [
+            chiefprotocol.Line(1, "fileHeader", ["1", "fileHeader", "SPIRE"]),
+            chiefprotocol.Line(4, "fileTrailer", ["2", "fileTrailer", "0"]),
+        ]
+        self.assertEqual(result, expected)
+
+    def test_tokenise_line_without_record_type(self):
+        result = list(chiefprotocol.tokenise("not a chief line"))
+
+        self.assertEqual(result, [chiefprotocol.Line(1, "", ["not a chief line"])])
+
+    def test_tokenise_matches_record_types_exactly(self):
+        # A "line" appearing in another record's fields isn't a "line" record
+        data = "1\\end\\line\\3\n2\\line\\1\\pipeline\n"
+
+        record_types = [line.record_type for line in chiefprotocol.tokenise(data)]
+
+        self.assertEqual(record_types, ["end", "line"])
+
+
+class FieldValuesTest(unittest.TestCase):
+    def test_field_values(self):
+        line = End(lineno=3, start_record_type=Licence.record_type, record_count=2)
+
+        self.assertEqual(chiefprotocol.field_values(line), (3, "end", "licence", 2))
+
+    def test_field_values_of_a_single_field(self):
+        line = AcceptedTransaction(transaction_ref="ABC12345")
+
+        self.assertEqual(chiefprotocol.field_values(line), ("ABC12345",))
+
+
+class RecordTest(unittest.TestCase):
+    def test_records_have_slots(self):
+        line = Licence(transaction_ref="ABC12345")
+
+        self.assertFalse(hasattr(line, "__dict__"))
+        with self.assertRaises(AttributeError):
+            line.transaction_reference = "ABC12345"
+
+    def test_record_type_is_the_default_type(self):
+        self.assertEqual(Licence.record_type, "licence")
+        self.assertEqual(Licence().type_, "licence")
+        self.assertEqual(End().type_, End.record_type)
+
+    def test_records_are_dataclasses(self):
+        line = End(start_record_type=Licence.record_type)
+        line.record_count = 2
+
+        self.assertEqual(line, End(start_record_type="licence", record_count=2))
+        self.assertEqual(dataclasses.replace(line, lineno=4).lineno, 4)
+        self.assertEqual(
+            [field.name for field in dataclasses.fields(End)], ["lineno", "type_", "start_record_type", "record_count"]
+        )
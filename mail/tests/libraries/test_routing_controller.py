@@ -1,10 +1,12 @@
+import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from django.test import override_settings
 
 from mail.auth import BasicAuthentication, ModernAuthentication
 from mail.libraries.routing_controller import (
+    get_email_message_dtos_concurrently,
     get_hmrc_to_dit_mailserver,
     get_mock_hmrc_mailserver,
     get_spire_to_dit_mailserver,
@@ -21,6 +23,7 @@ class RoutingControllerTest(unittest.TestCase):
         INCOMING_EMAIL_USER="incoming.email.user@example.com",
         INCOMING_EMAIL_HOSTNAME="host.example.com",
         INCOMING_EMAIL_POP3_PORT="123",
+        POP3_PIPELINING_ENABLED=True,
         AZURE_AUTH_CLIENT_ID="azure-auth-client-id",
         AZURE_AUTH_CLIENT_SECRET="azure-auth-client-secret",
         AZURE_AUTH_TENANT_ID="azure-auth-tenant-id",
@@ -38,6 +41,7 @@ class RoutingControllerTest(unittest.TestCase):
             mock_ModernAuthentication(),
             hostname="host.example.com",
             pop3_port="123",
+            pipelined=True,
         )
 
         self.assertEqual(spire_to_dit_mailserver, mock_MailServer())
@@ -51,6 +55,7 @@ class RoutingControllerTest(unittest.TestCase):
         HMRC_TO_DIT_EMAIL_USER="hmrc.to.dit.email.user@example.com",
         HMRC_TO_DIT_EMAIL_HOSTNAME="host.example.com",
         HMRC_TO_DIT_EMAIL_POP3_PORT="123",
+        POP3_PIPELINING_ENABLED=True,
         AZURE_AUTH_CLIENT_ID="azure-auth-client-id",
         AZURE_AUTH_CLIENT_SECRET="azure-auth-client-secret",
         AZURE_AUTH_TENANT_ID="azure-auth-tenant-id",
@@ -68,6 +73,7 @@ class RoutingControllerTest(unittest.TestCase):
             mock_ModernAuthentication(),
             hostname="host.example.com",
             pop3_port="123",
+            pipelined=True,
         )
 
         self.assertEqual(hmrc_to_dit_mailserver, mock_MailServer())
@@ -97,3 +103,32 @@ class RoutingControllerTest(unittest.TestCase):
         )
 
         self.assertEqual(mock_hmrc_mailserver, mock_MailServer())
+
+
+class GetEmailMessageDtosConcurrentlyTest(unittest.TestCase):
+    @patch("mail.libraries.routing_controller.get_email_message_dtos")
+    def test_mailboxes_are_read_in_parallel(self, mock_get_email_message_dtos):
+        hmrc_to_dit_server = Mock()
+        spire_to_dit_server = Mock()
+        emails = {hmrc_to_dit_server: ["hmrc 1", "hmrc 2"], spire_to_dit_server: ["spire 1"]}
+        # Each read only completes once both mailboxes are being read at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        def get_email_message_dtos(server, number):
+            barrier.wait()
+            return emails[server]
+
+        mock_get_email_message_dtos.side_effect = get_email_message_dtos
+
+        result = get_email_message_dtos_concurrently([(hmrc_to_dit_server, None), (spire_to_dit_server, 3)])
+
+        self.assertEqual(result, ["hmrc 1", "hmrc 2", "spire 1"])
+        mock_get_email_message_dtos.assert_any_call(hmrc_to_dit_server, number=None)
+        mock_get_email_message_dtos.assert_any_call(spire_to_dit_server, number=3)
+
+    @patch("mail.libraries.routing_controller.get_email_message_dtos")
+    def test_error_reading_a_mailbox_is_raised(self, mock_get_email_message_dtos):
+        mock_get_email_message_dtos.side_effect = [[], ConnectionResetError()]
+
+        with self.assertRaises(ConnectionResetError):
+            get_email_message_dtos_concurrently([(Mock(), None), (Mock(), 3)])
@@ -1,11 +1,12 @@
 import base64
 import uuid
-from poplib import POP3_SSL
+from poplib import POP3_SSL, error_proto
 from unittest.mock import MagicMock, call, patch
 
-from django.test import SimpleTestCase
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
 
-from mail.auth import AuthenticationError, BasicAuthentication, ModernAuthentication
+from mail.auth import ACCESS_TOKEN_EXPIRY_MARGIN, AuthenticationError, BasicAuthentication, ModernAuthentication
 
 
 class BasicAuthenticationTests(SimpleTestCase):
@@ -31,7 +32,12 @@ class BasicAuthenticationTests(SimpleTestCase):
         self.assertNotEqual(auth, equal_auth)
 
 
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
 class ModernAuthenticationTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
     def test_authenticates_connection_with_silent_acquisition(self):
         pop3conn = MagicMock(spec=POP3_SSL)
         mock_conn = pop3conn()
@@ -167,6 +173,65 @@ class ModernAuthenticationTests(SimpleTestCase):
                 cm.output,
             )
 
+    def test_access_token_is_shared_between_instances(self):
+        pop3conn = MagicMock(spec=POP3_SSL)
+        mock_conn = pop3conn()
+
+        with patch("mail.auth.msal") as mock_msal:
+            mock_ConfidentialClientApplication = mock_msal.ConfidentialClientApplication()
+            mock_ConfidentialClientApplication.acquire_token_silent.return_value = None
+            mock_ConfidentialClientApplication.acquire_token_for_client.return_value = {
+                "access_token": "access_token",
+                "expires_in": 3599,
+            }
+            mock_msal.ConfidentialClientApplication.reset_mock()
+
+            ModernAuthentication("username", "client_id", "client_secret", "tenant_id").authenticate(mock_conn)
+            ModernAuthentication("other_username", "client_id", "client_secret", "tenant_id").authenticate(mock_conn)
+
+        # The second instance reuses the token without creating an msal application
+        mock_msal.ConfidentialClientApplication.assert_called_once()
+        mock_ConfidentialClientApplication.acquire_token_for_client.assert_called_once()
+        access_string = base64.b64encode("user=other_username\x01auth=Bearer access_token\x01\x01".encode()).decode()
+        mock_conn._shortcmd.assert_called_with(access_string)
+
+    def test_rejected_access_token_is_removed_from_cache(self):
+        pop3conn = MagicMock(spec=POP3_SSL)
+        mock_conn = pop3conn()
+        mock_conn._shortcmd.side_effect = [
+            b"+",
+            error_proto(b"-ERR Authentication failure: unknown user name or bad password."),
+        ]
+        cache_key = "modern-authentication-access-token:tenant_id:client_id:https://outlook.office.com/.default"
+        cache.set(cache_key, "access_token")
+
+        with patch("mail.auth.msal") as mock_msal:
+            with self.assertRaises(error_proto):
+                ModernAuthentication("username", "client_id", "client_secret", "tenant_id").authenticate(mock_conn)
+
+        mock_msal.ConfidentialClientApplication.assert_not_called()
+        self.assertIsNone(cache.get(cache_key))
+
+    def test_access_token_is_refreshed_before_expiry(self):
+        pop3conn = MagicMock(spec=POP3_SSL)
+        mock_conn = pop3conn()
+
+        with patch("mail.auth.msal") as mock_msal, patch("mail.auth.cache") as mock_cache:
+            mock_cache.get.return_value = None
+            mock_ConfidentialClientApplication = mock_msal.ConfidentialClientApplication()
+            mock_ConfidentialClientApplication.acquire_token_silent.return_value = {
+                "access_token": "access_token",
+                "expires_in": 3599,
+            }
+
+            ModernAuthentication("username", "client_id", "client_secret", "tenant_id").authenticate(mock_conn)
+
+        mock_cache.set.assert_called_once_with(
+            "modern-authentication-access-token:tenant_id:client_id:https://outlook.office.com/.default",
+            "access_token",
+            timeout=3599 - ACCESS_TOKEN_EXPIRY_MARGIN,
+        )
+
     def test_equal(self):
         username = "username"
         client_id = "client_id"
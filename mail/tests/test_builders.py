@@ -11,7 +11,7 @@ from mail.enums import ChiefSystemEnum, LicenceActionEnum, LicenceTypeEnum, Sour
 from mail.libraries import builders
 from mail.libraries.email_message_dto import EmailMessageDto
 from mail.libraries.helpers import read_file
-from mail.models import LicencePayload
+from mail.models import LicencePayload, LicenceReference
 
 
 class BuildEmailMessageTest(testcases.TestCase):
@@ -420,3 +420,7 @@ class TestBuildUnidecodeMessage(testcases.TestCase):
             + "16\\fileTrailer\\1\n\n"
             + "--===============8537751789001939036==--\n",
         )
+        self.assertEqual(
+            list(LicenceReference.objects.filter(licence_data__mail=mail).values_list("reference", flat=True)),
+            ["GBSIEL/2024/0001234/P"],
+        )
@@ -13,9 +13,12 @@ from parameterized import parameterized
 
 from mail.celery_tasks import (
     MAX_RETRIES,
+    batch_send_emails,
     get_lite_api_url,
     manage_inbox,
     notify_users_of_rejected_licences,
+    queue_email_for_sending,
+    send_email_batch_task,
     send_email_task,
 )
 from mail.enums import ExtractTypeEnum, ReceptionStatusEnum, SourceEnum
@@ -294,6 +297,74 @@ class SendEmailTestTests(TestCase):
         )
         mock_cache.lock.assert_called_with("global_send_email_lock", timeout=600)
 
+    @mock.patch("mail.celery_tasks.cache")
+    @mock.patch("mail.servers.smtplib.SMTP")
+    def test_sends_email_batch_under_one_lock(self, mock_SMTP, mock_cache):
+        mock_conn = mock_SMTP().__enter__()
+        mock_SMTP.reset_mock()
+        messages = [{"From": "from@example.com", "To": f"to{i}@example.com"} for i in range(3)]
+        callbacks = [MagicMock(), None, MagicMock()]
+
+        send_email_batch_task.apply(args=[list(zip(messages, callbacks))])
+
+        mock_cache.lock.assert_called_once_with("global_send_email_lock", timeout=600)
+        mock_SMTP.assert_called_once()
+        mock_conn.login.assert_called_once()
+        self.assertEqual([c.args[0] for c in mock_conn.send_message.call_args_list], messages)
+        callbacks[0].apply_async.assert_called_once()
+        callbacks[2].apply_async.assert_called_once()
+
+    @mock.patch("mail.celery_tasks.cache")
+    @mock.patch("mail.servers.smtplib.SMTP")
+    def test_sends_email_batch_retries_unsent_messages(self, mock_SMTP, mock_cache):
+        mock_conn = mock_SMTP().__enter__()
+        messages = [{"From": "from@example.com", "To": f"to{i}@example.com"} for i in range(3)]
+        callbacks = [MagicMock(), MagicMock(), MagicMock()]
+        mock_conn.send_message.side_effect = [None, SMTPException(), None, None]
+
+        with mock.patch("mail.celery_tasks.get_exponential_backoff_interval", return_value=0):
+            send_email_batch_task.apply(args=[list(zip(messages, callbacks))])
+
+        self.assertEqual(
+            [c.args[0] for c in mock_conn.send_message.call_args_list],
+            [messages[0], messages[1], messages[1], messages[2]],
+        )
+        for callback in callbacks:
+            callback.apply_async.assert_called_once()
+
+    @mock.patch("mail.celery_tasks.cache")
+    @mock.patch("mail.servers.smtplib.SMTP")
+    def test_sends_email_batch_retries_failed_connection(self, mock_SMTP, mock_cache):
+        mock_conn = mock_SMTP().__enter__()
+        mock_conn.login.side_effect = [SMTPException(), None]
+        messages = [{"From": "from@example.com", "To": f"to{i}@example.com"} for i in range(2)]
+
+        with mock.patch("mail.celery_tasks.get_exponential_backoff_interval", return_value=0):
+            send_email_batch_task.apply(args=[[(message, None) for message in messages]])
+
+        self.assertEqual([c.args[0] for c in mock_conn.send_message.call_args_list], messages)
+
+    @mock.patch("mail.celery_tasks.send_email_task")
+    @mock.patch("mail.celery_tasks.send_email_batch_task")
+    def test_batch_send_emails_collects_queued_emails(self, mock_send_email_batch_task, mock_send_email_task):
+        callback = MagicMock()
+
+        with batch_send_emails():
+            queue_email_for_sending("message 1", callback)
+            with batch_send_emails():
+                queue_email_for_sending("message 2")
+
+            mock_send_email_batch_task.apply_async.assert_not_called()
+
+        mock_send_email_batch_task.apply_async.assert_called_once_with(
+            args=([("message 1", callback), ("message 2", None)],)
+        )
+        mock_send_email_task.apply_async.assert_not_called()
+
+        queue_email_for_sending("message 3", callback)
+
+        mock_send_email_task.apply_async.assert_called_once_with(args=("message 3",), link=callback)
+
     @mock.patch("mail.servers.get_smtp_connection")
     def test_locking(self, mock_get_smtp_connection):
         results = []
@@ -111,3 +111,55 @@ class CombiningUsageDataReplies(LiteHMRCTestClient):
         result = combine_lite_and_spire_usage_responses(mail=mail)
 
         self.assertEqual(result, expected_response)
+
+    def test_combine_responses_with_constant_number_of_queries(self):
+        edi_data = "1\\fileHeader\\CHIEF\\SPIRE\\usageData\\201901130300\\49543\\\n"
+        accepted = []
+        mail = Mail.objects.create(edi_filename="filename", edi_data=edi_data, response_data=None)
+        usage_data = UsageData.objects.create(spire_run_number=12345, hmrc_run_number=54321, mail=mail)
+        for i in range(1, 4):
+            licence_id = f"00000000-0000-0000-0000-00000000000{i}"
+            reference = f"GBSIEL/2020/000000{i}/P"
+            LicenceIdMapping.objects.create(lite_id=licence_id, reference=reference)
+            GoodIdMapping.objects.create(
+                lite_id=f"00000000-0000-0000-0000-0000000000{i}1", licence_reference=reference, line_number=1
+            )
+            TransactionMapping.objects.create(
+                usage_transaction=f"LU04148/0000{i}", line_number=1, licence_reference=reference, usage_data=usage_data
+            )
+            accepted.append(
+                {"id": licence_id, "goods": [{"id": f"00000000-0000-0000-0000-0000000000{i}1", "usage": 10}]}
+            )
+        usage_data.lite_response = {"licences": {"accepted": accepted, "rejected": []}}
+        usage_data.save()
+        mail.response_data = "1\\fileHeader\\SPIRE\\CHIEF\\usageReply\\201901130300\\49543\\\n2\\fileTrailer\\0\\0\\0"
+
+        # One query for the usage data and one for each type of mapping
+        with self.assertNumQueries(4):
+            result = combine_lite_and_spire_usage_responses(mail=mail)
+
+        self.assertEqual(
+            result,
+            "1\\fileHeader\\SPIRE\\CHIEF\\usageReply\\201901130300\\49543\\\n"
+            "2\\accepted\\LU04148/00001\n"
+            "3\\accepted\\LU04148/00002\n"
+            "4\\accepted\\LU04148/00003\n"
+            "5\\fileTrailer\\3\\0\\0",
+        )
+
+    def test_combine_responses_without_transaction_mapping(self):
+        mail = Mail.objects.create(edi_filename="filename", edi_data="1\\fileHeader\\", response_data="1\\fileHeader\\")
+        UsageData.objects.create(
+            lite_response={
+                "licences": {"accepted": [{"id": "00000000-0000-0000-0000-000000000001", "goods": []}], "rejected": []}
+            },
+            spire_run_number=12345,
+            hmrc_run_number=54321,
+            mail=mail,
+        )
+        LicenceIdMapping.objects.create(
+            lite_id="00000000-0000-0000-0000-000000000001", reference="GBSIEL/2020/0000001/P"
+        )
+
+        with self.assertRaises(TransactionMapping.DoesNotExist):
+            combine_lite_and_spire_usage_responses(mail=mail)
@@ -0,0 +1,80 @@
+from django.db import connection
+from django.test import TestCase
+
+from mail.anonymisers import from_bytea, sanitize_edi_data, sanitize_raw_data
+from mail.enums import ExtractTypeEnum
+from mail.fields import compress, is_compressed
+from mail.models import Mail
+from mail.serializers import find_duplicate_mail
+
+EDI_DATA = "1\\fileHeader\\SPIRE\\CHIEF\\licenceData\\202001010000\\1\\N\n2\\fileTrailer\\0"
+
+
+class CompressedPayloadTests(TestCase):
+    def get_mail(self, **values):
+        values = {"edi_filename": "filename", "edi_data": EDI_DATA, "raw_data": "raw data", **values}
+        return Mail.objects.create(**values)
+
+    def get_stored_value(self, mail, field):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {field} FROM mail WHERE id = %s", [mail.id])
+            return bytes(cursor.fetchone()[0])
+
+    def store_uncompressed(self, mail, field, value):
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE mail SET {field} = %s WHERE id = %s", [value.encode("utf-8"), mail.id])
+
+    def test_payloads_are_stored_compressed(self):
+        mail = self.get_mail(sent_data="sent data")
+
+        self.assertEqual(self.get_stored_value(mail, "edi_data"), compress(EDI_DATA))
+        self.assertTrue(is_compressed(self.get_stored_value(mail, "raw_data")))
+        self.assertTrue(is_compressed(self.get_stored_value(mail, "sent_data")))
+
+        mail.refresh_from_db()
+        self.assertEqual(mail.edi_data, EDI_DATA)
+        self.assertEqual(mail.raw_data, "raw data")
+        self.assertEqual(mail.sent_data, "sent data")
+        self.assertIsNone(mail.response_data)
+
+    def test_filter_by_payload(self):
+        mail = self.get_mail()
+        self.get_mail(edi_data="1\\fileHeader\\")
+
+        self.assertQuerysetEqual(Mail.objects.filter(edi_data=EDI_DATA, raw_data="raw data"), [mail])
+        self.assertQuerysetEqual(Mail.objects.filter(response_data__isnull=True), Mail.objects.all(), ordered=False)
+
+    def test_uncompressed_payloads_are_read(self):
+        mail = self.get_mail()
+        self.store_uncompressed(mail, "edi_data", EDI_DATA)
+
+        mail.refresh_from_db()
+
+        self.assertEqual(mail.edi_data, EDI_DATA)
+
+    def test_find_duplicate_of_uncompressed_mail(self):
+        mail = self.get_mail(extract_type=ExtractTypeEnum.LICENCE_DATA)
+        self.store_uncompressed(mail, "edi_data", EDI_DATA)
+        self.store_uncompressed(mail, "raw_data", "raw data")
+        self.get_mail(extract_type=ExtractTypeEnum.LICENCE_DATA, raw_data="other raw data")
+
+        dups = find_duplicate_mail(
+            {
+                "edi_filename": "filename",
+                "edi_data": EDI_DATA,
+                "extract_type": ExtractTypeEnum.LICENCE_DATA,
+                "raw_data": "raw data",
+            }
+        )
+
+        self.assertEqual(dups, [mail])
+
+
+class AnonymiserTests(TestCase):
+    def test_sanitize_edi_data(self):
+        dumped = "\\x" + compress(EDI_DATA).hex()
+
+        self.assertEqual(from_bytea(sanitize_edi_data(dumped)), EDI_DATA)
+
+    def test_sanitize_raw_data(self):
+        self.assertIn("raw_data contents anonymised", from_bytea(sanitize_raw_data("\\x" + compress("raw").hex())))
@@ -100,5 +100,6 @@ class TestGetEmailMessagesDTOs(SimpleTestCase):
         mock_get_message_iterator.assert_called_once_with(
             mock_mail_server.connect_to_pop3(),
             mock_mail_server.user,
+            3,
         )
         mock_mail_server.quit_pop3_connection.assert_called_once_with()
@@ -4,7 +4,7 @@ from django.test import override_settings
 from parameterized import parameterized
 
 from mail.enums import ChiefSystemEnum
-from mail.libraries import edifact_validator
+from mail.libraries import chiefprotocol, chieftypes, edifact_validator
 
 
 class LicenceToEdifactValidationTests(unittest.TestCase):
@@ -168,3 +168,119 @@ class LicenceToEdifactValidationTests(unittest.TestCase):
     def test_file_trailer_validation(self, line, num_errors):
         errors = edifact_validator.validate_file_trailer(line)
         self.assertEqual(len(errors), num_errors)
+
+
+class LicenceRecordValidationTests(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                chieftypes.FileHeader(
+                    lineno=1,
+                    source_system="SPIRE",
+                    destination_system="CHIEF",
+                    data_id="licenceData",
+                    reset_run_num="N",
+                ),
+                0,
+            ),
+            (
+                chieftypes.FileHeader(
+                    lineno=2,
+                    source_system="SPIRE",
+                    destination_system="SPIRE",
+                    data_id="licenceUpdate",
+                    reset_run_num="T",
+                ),
+                4,
+            ),
+            (chieftypes.Licence(lineno=2, action="insert", licence_type="SIE", usage="E"), 0),
+            (chieftypes.Licence(lineno=2, action="add", licence_type="SIEL", usage="I"), 3),
+            (
+                chieftypes.Trader(
+                    lineno=3,
+                    rpa_trader_id="GB123456789000",
+                    name="ABC Test",
+                    address1="Test Location",
+                    postcode="AB1 2BD",
+                ),
+                0,
+            ),
+            (chieftypes.Trader(lineno=3, name="ABC Test", postcode="INVALID POSTCODE"), 3),
+            (chieftypes.Country(lineno=4, code="AU", use="D"), 0),
+            (chieftypes.Country(lineno=4, code="AU", group="G012", use="T"), 2),
+            (chieftypes.ForeignTrader(lineno=5, name="Test party", address1="1234", country="AU"), 0),
+            (
+                chieftypes.ForeignTrader(
+                    lineno=5, name="Test party", address1="1234", postcode="123456789", country="GBR"
+                ),
+                2,
+            ),
+            (chieftypes.Restrictions(lineno=6, text="Provisos may apply please see licence"), 0),
+            (
+                chieftypes.LicenceDataLine(
+                    lineno=7,
+                    line_num=1,
+                    goods_description="Rifle",
+                    controlled_by="Q",
+                    quantity_unit="030",
+                    quantity_issued=4,
+                ),
+                0,
+            ),
+            (chieftypes.LicenceDataLine(lineno=7, line_num=1, controlled_by="T", quantity_unit="30"), 3),
+            (chieftypes.LicenceDataLine(lineno=7, line_num=1, controlled_by="O"), 0),
+            (chieftypes.End(lineno=8, start_record_type="licence", record_count=7), 0),
+            (chieftypes.FileTrailer(lineno=9, transaction_count=1), 0),
+        ]
+    )
+    def test_record_validation(self, record, num_errors):
+        errors = edifact_validator.validate_edifact_record("licenceData", record)
+        self.assertEqual(len(errors), num_errors, errors)
+
+    @parameterized.expand(
+        [
+            chieftypes.Restrictions(lineno=6, text="Provisos may apply\\please see licence"),
+            chieftypes.Restrictions(lineno=6, text="Provisos may apply\nplease see licence"),
+        ]
+    )
+    def test_record_validation_with_separator_in_value(self, record):
+        errors = edifact_validator.validate_edifact_record("licenceData", record)
+        self.assertEqual(len(errors), 1)
+
+    def test_record_validation_matches_line_validation(self):
+        record = chieftypes.ForeignTrader(
+            lineno=5, name="Test party", address1="A very long address line of more than 35 chars", country="AU"
+        )
+
+        self.assertEqual(
+            edifact_validator.validate_edifact_record("licenceData", record),
+            edifact_validator.validate_edifact_line("licenceData", chiefprotocol.format_line(record)),
+        )
+
+
+class RecordSchemaTests(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("fileHeader", 8),
+            ("licence", 9),
+            ("trader", 13),
+            ("country", 5),
+            ("foreignTrader", 10),
+            ("restrictions", 3),
+            ("line", 19),
+            ("end", 4),
+            ("fileTrailer", 3),
+        ]
+    )
+    def test_number_of_fields_from_record_type(self, record_type, num_fields):
+        self.assertEqual(edifact_validator.LICENCE_DATA_SCHEMAS[record_type].num_fields, num_fields)
+
+    def test_field_checks_use_position_in_line(self):
+        schema = edifact_validator.RecordSchema(
+            chieftypes.Country,
+            {"group": edifact_validator.FieldSpec("Invalid group {value} in {record_type}", max_length=3)},
+        )
+
+        errors = schema.validate_line("licenceData", "4\\country\\AUS\\G012\\D")
+
+        self.assertEqual(errors, [{"country": "Invalid group G012 in country"}])
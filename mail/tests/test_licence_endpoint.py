@@ -0,0 +1,78 @@
+import json
+
+from django.urls import reverse
+from rest_framework import status
+
+from mail.enums import ExtractTypeEnum, ReceptionStatusEnum, SourceEnum
+from mail.models import LicenceData, LicenceReference, Mail
+from mail.serializers import LicenceDataSerializer
+from mail.tests.libraries.client import LiteHMRCTestClient
+
+
+class LicenceEndpointTests(LiteHMRCTestClient):
+    url = reverse("mail:licence")
+
+    def create_licence_data(self, references, hmrc_run_number=1):
+        mail = Mail.objects.create(
+            edi_filename=f"CHIEF_LIVE_SPIRE_licenceData_{hmrc_run_number}_201902080025",
+            edi_data="1\\fileHeader\\",
+            extract_type=ExtractTypeEnum.LICENCE_DATA,
+            raw_data="See Licence Payload",
+        )
+        licence_data = LicenceData.objects.create(
+            mail=mail, hmrc_run_number=hmrc_run_number, source=SourceEnum.SPIRE, licence_ids=references
+        )
+        licence_data.create_licence_references()
+
+        return licence_data
+
+    def test_get_licence(self):
+        self.create_licence_data(["GBSIEL/2020/0000001/P", "GBSIEL/2020/0000002/P"])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"id": "GBSIEL/2020/0000002/P"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"status": ReceptionStatusEnum.PENDING})
+
+    def test_get_licence_not_found(self):
+        self.create_licence_data(["GBSIEL/2020/0000001/P"])
+
+        response = self.client.get(self.url, {"id": "GBSIEL/2020/0000003/P"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_licence_does_not_match_part_of_a_reference(self):
+        self.create_licence_data(["GBSIEL/2020/0000001/P/A"])
+
+        response = self.client.get(self.url, {"id": "GBSIEL/2020/0000001/P"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_licence_in_more_than_one_file(self):
+        self.create_licence_data(["GBSIEL/2020/0000001/P"], hmrc_run_number=1)
+        self.create_licence_data(["GBSIEL/2020/0000001/P"], hmrc_run_number=2)
+
+        response = self.client.get(self.url, {"id": "GBSIEL/2020/0000001/P"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_licence_data_serializer_creates_licence_references(self):
+        mail = Mail.objects.create(edi_filename="filename", edi_data="1\\fileHeader\\", raw_data="raw data")
+        serializer = LicenceDataSerializer(
+            data={
+                "mail": mail.id,
+                "hmrc_run_number": 1,
+                "source_run_number": 1,
+                "source": SourceEnum.SPIRE,
+                "licence_ids": json.dumps(["GBSIEL/2020/0000001/P", "GBSIEL/2020/0000002/P"]),
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+
+        licence_data = serializer.save()
+
+        self.assertEqual(
+            set(LicenceReference.objects.filter(licence_data=licence_data).values_list("reference", flat=True)),
+            {"GBSIEL/2020/0000001/P", "GBSIEL/2020/0000002/P"},
+        )
@@ -1,5 +1,10 @@
+import io
 from unittest import mock
 
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from parameterized import parameterized
 
@@ -12,6 +17,7 @@ from mail.libraries.lite_to_edifact_converter import (
     generate_lines_for_licence,
     get_transaction_reference,
     licences_to_edifact,
+    write_licences_edifact,
 )
 from mail.models import GoodIdMapping, LicencePayload, Mail
 from mail.tests.libraries.client import LiteHMRCTestClient
@@ -245,6 +251,96 @@ class StandardLicenceToEdifactTests(LiteHMRCTestClient):
 
         self.assertEqual(result, expected)
 
+    def test_write_licences_edifact_streams_to_sink(self):
+        sink = io.StringIO()
+        when = timezone.now()
+
+        write_licences_edifact(LicencePayload.objects.filter(is_processed=False), 1234, "FOO", sink, when)
+
+        self.assertEqual(sink.getvalue(), licences_to_edifact(LicencePayload.objects.all(), 1234, "FOO", when))
+
+    def test_write_licences_edifact_writes_file_before_raising_on_errors(self):
+        licence = LicencePayload.objects.get()
+        licence.data["type"] = "INVALID_TYPE"
+        licence.save()
+        sink = io.StringIO()
+
+        with self.assertRaises(EdifactValidationError):
+            write_licences_edifact(LicencePayload.objects.filter(is_processed=False), 1234, "FOO", sink)
+
+        self.assertTrue(sink.getvalue().endswith("\\fileTrailer\\1\n"))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_licence_lines_are_cached_between_files(self):
+        cache.clear()
+        when = timezone.now()
+
+        with mock.patch(
+            "mail.libraries.lite_to_edifact_converter.generate_lines_for_licence", wraps=generate_lines_for_licence
+        ) as mock_generate_lines:
+            first_file = licences_to_edifact(LicencePayload.objects.all(), 1234, "FOO", when)
+            second_file = licences_to_edifact(LicencePayload.objects.all(), 1235, "FOO", when)
+
+        mock_generate_lines.assert_called_once()
+        self.assertEqual(second_file, first_file.replace("\\1234\\N\n", "\\1235\\N\n", 1))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_licence_lines_are_generated_again_when_the_payload_changes(self):
+        cache.clear()
+        licence = LicencePayload.objects.get()
+
+        with mock.patch(
+            "mail.libraries.lite_to_edifact_converter.generate_lines_for_licence", wraps=generate_lines_for_licence
+        ) as mock_generate_lines:
+            licences_to_edifact(LicencePayload.objects.all(), 1234, "FOO")
+            licence.data["end_date"] = "2023-06-02"
+            licence.save()
+            result = licences_to_edifact(LicencePayload.objects.all(), 1235, "FOO")
+
+        self.assertEqual(mock_generate_lines.call_count, 2)
+        self.assertIn("\\20200602\\20230602\n", result)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_good_id_mappings_are_created_for_cached_licence_lines(self):
+        cache.clear()
+        licence = LicencePayload.objects.get()
+        licence.data["type"] = "siel"
+        licence.save()
+        licences_to_edifact(LicencePayload.objects.all(), 1234, "FOO")
+        GoodIdMapping.objects.all().delete()
+
+        licences_to_edifact(LicencePayload.objects.all(), 1235, "FOO")
+
+        self.assertEqual(
+            GoodIdMapping.objects.filter(licence_reference=licence.reference).count(), len(licence.data["goods"])
+        )
+
+    def test_good_id_mappings_are_created_in_one_query(self):
+        licence = LicencePayload.objects.get()
+        licence.data["type"] = "siel"
+        licence.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            licences_to_edifact(LicencePayload.objects.all(), 1234, "FOO")
+        licences_to_edifact(LicencePayload.objects.all(), 1235, "FOO")
+
+        good_id_mapping_queries = [query for query in queries if "mail_goodidmapping" in query["sql"]]
+        self.assertEqual(len(good_id_mapping_queries), 1)
+        self.assertEqual(
+            GoodIdMapping.objects.filter(licence_reference=licence.reference).count(), len(licence.data["goods"])
+        )
+
+    def test_good_id_mappings_are_not_created_for_an_invalid_file(self):
+        licence = LicencePayload.objects.get()
+        licence.data["type"] = "siel"
+        licence.data["organisation"]["name"] = "x" * 81
+        licence.save()
+
+        with self.assertRaises(EdifactValidationError):
+            licences_to_edifact(LicencePayload.objects.all(), 1234, "FOO")
+
+        self.assertFalse(GoodIdMapping.objects.exists())
+
     def test_edifact_gen_raises_exception_on_errors(self):
         licence = LicencePayload.objects.get()
         licence.data["type"] = "INVALID_TYPE"
@@ -0,0 +1,100 @@
+import datetime
+import unittest
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from mail.enums import ExtractTypeEnum, ReceptionStatusEnum
+from mail.models import LicenceData, Mail
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Query plans are only checked on Postgres")
+class IndexTestCase(TestCase):
+    """Checks that queries use an index rather than scanning the whole table.
+
+    With only a few rows Postgres prefers a sequential scan, so sequential scans
+    are turned off to find out whether the query can use an index at all.
+    """
+
+    def get_plan(self, queryset) -> str:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain()
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = self.get_plan(queryset)
+
+        self.assertTrue(any(index_name in plan for index_name in index_names), plan)
+        self.assertNotIn("Seq Scan", plan)
+
+
+class MailIndexTests(IndexTestCase):
+    """The queries that poll the mail workflow use an index."""
+
+    def test_mail_by_status(self):
+        # select_email_for_sending and check_for_pending_messages
+        for status in [
+            ReceptionStatusEnum.REPLY_RECEIVED,
+            ReceptionStatusEnum.REPLY_PENDING,
+            ReceptionStatusEnum.PENDING,
+        ]:
+            with self.subTest(status=status):
+                self.assertUsesIndex(
+                    Mail.objects.filter(status=status).order_by("created_at")[:1], "mail_in_progress_idx"
+                )
+
+    def test_mail_by_status_and_extract_type(self):
+        # check_for_pending_messages and send_licence_data_to_icms
+        self.assertUsesIndex(
+            Mail.objects.filter(extract_type=ExtractTypeEnum.LICENCE_DATA, status=ReceptionStatusEnum.PENDING),
+            "mail_status_type_created_idx",
+            # Either index can be used, the partial index is preferred while there is little mail
+            "mail_in_progress_idx",
+        )
+
+    def test_sent_mail_by_status_and_extract_type(self):
+        # Mail that has been sent is left out of the partial index
+        self.assertUsesIndex(
+            Mail.objects.filter(
+                status=ReceptionStatusEnum.REPLY_SENT,
+                extract_type__in=[ExtractTypeEnum.LICENCE_DATA, ExtractTypeEnum.LICENCE_REPLY],
+            ),
+            "mail_status_type_created_idx",
+        )
+
+    def test_mail_in_progress(self):
+        # send_licence_details_to_hmrc
+        self.assertUsesIndex(
+            Mail.objects.exclude(status=ReceptionStatusEnum.REPLY_SENT).values("pk")[:1], "mail_in_progress_idx"
+        )
+
+    def test_mail_awaiting_reply(self):
+        # PendingMailHealthCheck
+        sent_before = timezone.now() - datetime.timedelta(hours=1)
+
+        self.assertUsesIndex(
+            Mail.objects.exclude(status=ReceptionStatusEnum.REPLY_SENT).filter(sent_at__lte=sent_before),
+            "mail_in_progress_idx",
+        )
+
+    def test_latest_mail_by_extract_type(self):
+        # get_licence_data_status and get_usage_data_status
+        self.assertUsesIndex(
+            Mail.objects.filter(extract_type=ExtractTypeEnum.USAGE_DATA).order_by("-created_at")[:1],
+            "mail_type_created_idx",
+        )
+
+
+class LicenceDataIndexTests(IndexTestCase):
+    def test_licence_data_containing_a_licence(self):
+        self.assertUsesIndex(
+            LicenceData.objects.filter(licence_ids__contains=["GBSIEL/2020/0000001/P"]), "licencedata_licence_ids_gin"
+        )
+
+    def test_licence_data_by_licence_reference(self):
+        self.assertUsesIndex(
+            LicenceData.objects.filter(licence_references__reference="GBSIEL/2020/0000001/P"),
+            "mail_licencereference_reference_licence_data_id",
+        )
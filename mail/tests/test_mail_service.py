@@ -1,13 +1,21 @@
 from collections import OrderedDict
-from poplib import POP3_SSL
+from itertools import islice
+from poplib import POP3_SSL, error_proto
 from unittest.mock import MagicMock, Mock, patch
 
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, override_settings
 from parameterized import parameterized
 
 from mail.auth import Authenticator
-from mail.libraries.mailbox_service import read_last_message, read_last_three_emails
-from mail.servers import MailServer
+from mail.enums import MailReadStatuses
+from mail.libraries.mailbox_service import (
+    get_message_iterator,
+    get_read_messages,
+    read_last_message,
+    read_last_three_emails,
+)
+from mail.models import MailboxConfig, MailReadStatus
+from mail.servers import MailServer, PipelinedPOP3_SSL
 from mail.tests.libraries.client import LiteHMRCTestClient
 
 
@@ -125,6 +133,175 @@ class MailServiceTests(LiteHMRCTestClient):
             self.assertEqual(f"Subject: {message.subject}".encode("utf-8"), retr_item[1][0])
 
 
+@override_settings(SPIRE_FROM_ADDRESS="spire@example.com", INCOMING_EMAIL_CHECK_LIMIT=100)  # /PS-IGNORE
+@patch("mail.libraries.mailbox_service.to_mail_message_dto", side_effect=lambda m: m)
+class MessageIteratorTests(LiteHMRCTestClient):
+    def get_pop3conn(self, message_nums):
+        pop3conn = MagicMock(spec=POP3_SSL)
+        pop3conn.uidl.return_value = (None, [f"{num} uid-{num}".encode() for num in message_nums], None)
+        pop3conn.top.side_effect = lambda num, _: (
+            b"OK",
+            [b"From: spire@example.com", f"Message-ID: <message-{num}@example.com>".encode()],  # /PS-IGNORE
+            None,
+        )
+        pop3conn.retr.side_effect = lambda num: f"message {num}"
+        return pop3conn
+
+    def test_first_poll_checks_all_messages_and_sets_watermark(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2", "3"])
+        MailReadStatus.objects.create(
+            message_id="message-1",
+            message_num="1",
+            status=MailReadStatuses.READ,
+            mailbox=MailboxConfig.objects.create(username="spire"),
+        )
+
+        messages = [message for message, _ in get_message_iterator(pop3conn, "spire")]
+
+        self.assertEqual(messages, ["message 2", "message 3"])
+        self.assertEqual(pop3conn.top.call_count, 3)
+        pop3conn.list.assert_not_called()
+        mailbox_config = MailboxConfig.objects.get(username="spire")
+        self.assertEqual(mailbox_config.last_seen_uid, "uid-1")
+        self.assertEqual(mailbox_config.last_seen_message_num, 1)
+
+    def test_poll_without_new_messages_only_lists_mailbox(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2"])
+        MailboxConfig.objects.create(username="spire", last_seen_uid="uid-2", last_seen_message_num=2)
+
+        messages = list(get_message_iterator(pop3conn, "spire"))
+
+        self.assertEqual(messages, [])
+        pop3conn.uidl.assert_called_once()
+        pop3conn.top.assert_not_called()
+        pop3conn.retr.assert_not_called()
+
+    def test_poll_only_checks_messages_after_watermark(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2", "3", "4"])
+        MailboxConfig.objects.create(username="spire", last_seen_uid="uid-2", last_seen_message_num=2)
+
+        messages = [message for message, _ in get_message_iterator(pop3conn, "spire")]
+
+        self.assertEqual(messages, ["message 3", "message 4"])
+        self.assertEqual([c.args[0] for c in pop3conn.top.call_args_list], ["3", "4"])
+
+    def test_watermark_found_when_message_numbers_change(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2", "3"])
+        pop3conn.uidl.return_value = (None, [b"1 uid-2", b"2 uid-3", b"3 uid-4"], None)
+        MailboxConfig.objects.create(username="spire", last_seen_uid="uid-3", last_seen_message_num=3)
+
+        messages = [message for message, _ in get_message_iterator(pop3conn, "spire")]
+
+        self.assertEqual(messages, ["message 3"])
+
+    def test_missing_watermark_checks_latest_messages(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2", "3"])
+        MailboxConfig.objects.create(username="spire", last_seen_uid="uid-deleted", last_seen_message_num=7)
+
+        with override_settings(INCOMING_EMAIL_CHECK_LIMIT=2):
+            messages = [message for message, _ in get_message_iterator(pop3conn, "spire")]
+
+        self.assertEqual(messages, ["message 2", "message 3"])
+
+    def test_falls_back_to_list_without_uidl_support(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2"])
+        pop3conn.uidl.side_effect = error_proto("-ERR unsupported")
+        pop3conn.list.return_value = (None, [b"1 1234", b"2 4321"], None)
+
+        messages = [message for message, _ in get_message_iterator(pop3conn, "spire")]
+
+        self.assertEqual(messages, ["message 1", "message 2"])
+        self.assertIsNone(MailboxConfig.objects.get(username="spire").last_seen_uid)
+
+    def test_pipelined_connection_batches_commands(self, mock_to_dto):
+        pop3conn = MagicMock(spec=PipelinedPOP3_SSL)
+        pop3conn.batch_size = 2
+        pop3conn.uidl.return_value = (None, [b"1 uid-1", b"2 uid-2", b"3 uid-3"], None)
+        pop3conn.top_many.side_effect = lambda nums, _: [
+            (
+                b"OK",
+                [b"From: spire@example.com", f"Message-ID: <message-{num}@example.com>".encode()],
+                None,
+            )  # /PS-IGNORE
+            for num in nums
+        ]
+        pop3conn.retr_many.side_effect = lambda nums: [
+            error_proto(b"-ERR") if num == "2" else f"message {num}" for num in nums
+        ]
+
+        messages = [message for message, _ in get_message_iterator(pop3conn, "spire")]
+
+        self.assertEqual(messages, ["message 1", "message 3"])
+        pop3conn.top_many.assert_called_once_with(["1", "2", "3"], 0)
+        self.assertEqual([c.args[0] for c in pop3conn.retr_many.call_args_list], [["1", "2"], ["3"]])
+        pop3conn.top.assert_not_called()
+        pop3conn.retr.assert_not_called()
+
+    def test_pipelined_connection_only_fetches_the_messages_needed(self, mock_to_dto):
+        pop3conn = MagicMock(spec=PipelinedPOP3_SSL)
+        pop3conn.batch_size = 20
+        pop3conn.uidl.return_value = (None, [f"{num} uid-{num}".encode() for num in range(1, 6)], None)
+        pop3conn.top_many.side_effect = lambda nums, _: [
+            (
+                b"OK",
+                [b"From: spire@example.com", f"Message-ID: <message-{num}@example.com>".encode()],
+                None,
+            )  # /PS-IGNORE
+            for num in nums
+        ]
+        pop3conn.retr_many.side_effect = lambda nums: [f"message {num}" for num in nums]
+        MailReadStatus.objects.create(
+            message_id="message-1",
+            message_num="1",
+            status=MailReadStatuses.READ,
+            mailbox=MailboxConfig.objects.create(username="spire"),
+        )
+
+        messages = [message for message, _ in islice(get_message_iterator(pop3conn, "spire", 2), 2)]
+
+        self.assertEqual(messages, ["message 2", "message 3"])
+        self.assertEqual([c.args[0] for c in pop3conn.top_many.call_args_list], [["1", "2"], ["3", "4"]])
+        self.assertEqual([c.args[0] for c in pop3conn.retr_many.call_args_list], [["2"], ["3", "4"]])
+        self.assertEqual(MailboxConfig.objects.get(username="spire").last_seen_uid, "uid-1")
+
+    def test_mark_status_updates_its_own_message(self, mock_to_dto):
+        pop3conn = self.get_pop3conn(["1", "2"])
+
+        emails = list(get_message_iterator(pop3conn, "spire"))
+        _, mark_first_status = emails[0]
+        mark_first_status(MailReadStatuses.READ)
+
+        self.assertEqual(MailReadStatus.objects.get(message_id="message-1").status, MailReadStatuses.READ)
+        self.assertEqual(MailReadStatus.objects.get(message_id="message-2").status, MailReadStatuses.UNREAD)
+
+
+class ReadMessagesTests(LiteHMRCTestClient):
+    def test_get_read_messages_only_returns_seen_candidates(self):
+        mailbox_config = MailboxConfig.objects.create(username="spire")
+        other_mailbox_config = MailboxConfig.objects.create(username="hmrc")
+        for message_id, status, mailbox in [
+            ("read", MailReadStatuses.READ, mailbox_config),
+            ("unprocessable", MailReadStatuses.UNPROCESSABLE, mailbox_config),
+            ("unread", MailReadStatuses.UNREAD, mailbox_config),
+            ("other-mailbox", MailReadStatuses.READ, other_mailbox_config),
+            ("not-a-candidate", MailReadStatuses.READ, mailbox_config),
+        ]:
+            MailReadStatus.objects.create(message_id=message_id, status=status, mailbox=mailbox)
+
+        with self.assertNumQueries(1):
+            read_messages = get_read_messages(
+                mailbox_config, ["read", "unprocessable", "unread", "other-mailbox", "new", None]
+            )
+
+        self.assertEqual(read_messages, {"read", "unprocessable"})
+
+    def test_get_read_messages_without_candidates(self):
+        mailbox_config = MailboxConfig.objects.create(username="spire")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_read_messages(mailbox_config, [None]), set())
+
+
 class MailServerTests(SimpleTestCase):
     def test_mail_server_equal(self):
         auth = Mock(spec=Authenticator)
@@ -175,6 +352,17 @@ class MailServerTests(SimpleTestCase):
         mock_connection = pop3conn()
         auth.authenticate.assert_called_with(mock_connection)
 
+    def test_mail_server_connect_to_pop3_pipelined(self):
+        auth = Mock(spec=Authenticator)
+
+        with patch("mail.servers.PipelinedPOP3_SSL") as mock_PipelinedPOP3_SSL:
+            mail_server = MailServer(auth, hostname="host", pop3_port=1, pipelined=True)
+            connection = mail_server.connect_to_pop3()
+
+        mock_PipelinedPOP3_SSL.assert_called_with("host", 1, timeout=60)
+        self.assertEqual(connection, mock_PipelinedPOP3_SSL())
+        auth.authenticate.assert_called_with(connection)
+
     def test_mail_server_quit_pop3_connection(self):
         hostname = "host"
         pop3_port = 1
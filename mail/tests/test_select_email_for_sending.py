@@ -102,6 +102,32 @@ class EmailSelectTests(LiteHMRCTestClient):
 
         self.assertEqual(mail, mail_1)
 
+    def test_selected_email_payloads_are_fetched_when_used(self):
+        self.get_mail(status=ReceptionStatusEnum.PENDING, raw_data="raw data")
+
+        with self.assertNumQueries(3):
+            mail = select_email_for_sending()
+        self.assertEqual(mail.get_deferred_fields(), set(Mail.PAYLOAD_FIELDS))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(mail.edi_data, "1\\fileHeader\\CHIEF\\SPIRE\\")
+
+    def test_email_with_deferred_payloads_is_saved_without_them(self):
+        self.get_mail(status=ReceptionStatusEnum.PENDING, raw_data="raw data", response_data="response")
+        mail = select_email_for_sending()
+
+        mail.status = ReceptionStatusEnum.REPLY_PENDING
+        mail.sent_data = "sent data"
+        with self.assertNumQueries(1):
+            mail.save()
+
+        mail.refresh_from_db(fields=[*Mail.PAYLOAD_FIELDS, "status"])
+        self.assertEqual(mail.status, ReceptionStatusEnum.REPLY_PENDING)
+        self.assertEqual(mail.edi_data, "1\\fileHeader\\CHIEF\\SPIRE\\")
+        self.assertEqual(mail.sent_data, "sent data")
+        self.assertEqual(mail.response_data, "response")
+        self.assertEqual(mail.raw_data, "raw data")
+
     @mock.patch("mail.libraries.routing_controller.get_spire_to_dit_mailserver")
     @mock.patch("mail.libraries.routing_controller.get_hmrc_to_dit_mailserver")
     @mock.patch("mail.celery_tasks.smtp_send")
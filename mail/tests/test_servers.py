@@ -1,8 +1,10 @@
+import io
+import poplib
 from unittest.mock import MagicMock, patch
 
 from django.test import SimpleTestCase, override_settings
 
-from mail.servers import smtp_send
+from mail.servers import PipelinedPOP3_SSL, smtp_send, smtp_session
 
 
 @override_settings(
@@ -103,3 +105,97 @@ class SmtpSendTests(SimpleTestCase):
         )
         mock_conn.starttls.assert_called()
         mock_conn.login.assert_called()
+
+    def test_smtp_send_in_session_shares_connection(self, mock_SMTP):
+        mock_conn = MagicMock()
+        mock_SMTP.return_value.__enter__.return_value = mock_conn
+
+        with smtp_session():
+            with smtp_session():
+                smtp_send(MagicMock())
+            smtp_send(MagicMock())
+
+            mock_SMTP.return_value.__exit__.assert_not_called()
+
+        mock_SMTP.assert_called_once_with("test.hostname", "1234", timeout=60)
+        mock_conn.login.assert_called_once()
+        self.assertEqual(mock_conn.send_message.call_count, 2)
+        mock_SMTP.return_value.__exit__.assert_called_once()
+
+    def test_smtp_session_without_sends_does_not_connect(self, mock_SMTP):
+        with smtp_session():
+            pass
+
+        mock_SMTP.assert_not_called()
+
+
+class PipelinedPOP3Tests(SimpleTestCase):
+    def get_connection(self, server_output: bytes, batch_size: int = 20):
+        # Skip connecting to a server, the connection only needs a socket to write to and a file to read from
+        connection = PipelinedPOP3_SSL.__new__(PipelinedPOP3_SSL)
+        connection._debugging = 0
+        connection.encoding = "UTF-8"
+        connection.batch_size = batch_size
+        connection.sock = MagicMock()
+        connection.file = io.BytesIO(server_output)
+        return connection
+
+    def test_pipeline_sends_batch_before_reading_responses(self):
+        connection = self.get_connection(
+            b"".join(
+                [
+                    b"+OK\r\nPIPELINING\r\nUIDL\r\n.\r\n",
+                    b"+OK message follows\r\nSubject: one\r\n.\r\n",
+                    b"-ERR no such message\r\n",
+                    b"+OK message follows\r\nSubject: three\r\n..dot\r\n.\r\n",
+                ]
+            )
+        )
+
+        responses = connection.top_many(["1", "2", "3"], 0)
+
+        connection.sock.sendall.assert_called_with(b"TOP 1 0\r\nTOP 2 0\r\nTOP 3 0\r\n")
+        self.assertEqual(responses[0][1], [b"Subject: one"])
+        self.assertIsInstance(responses[1], poplib.error_proto)
+        self.assertEqual(responses[2][1], [b"Subject: three", b".dot"])
+
+    def test_pipeline_splits_commands_into_batches(self):
+        connection = self.get_connection(
+            b"".join(
+                [
+                    b"+OK\r\nPIPELINING\r\n.\r\n",
+                    b"+OK\r\none\r\n.\r\n",
+                    b"+OK\r\ntwo\r\n.\r\n",
+                    b"+OK\r\nthree\r\n.\r\n",
+                ]
+            ),
+            batch_size=2,
+        )
+
+        responses = connection.retr_many(["1", "2", "3"])
+
+        self.assertEqual([response[1] for response in responses], [[b"one"], [b"two"], [b"three"]])
+        self.assertEqual(
+            [call.args[0] for call in connection.sock.sendall.call_args_list],
+            [b"CAPA\r\n", b"RETR 1\r\nRETR 2\r\n", b"RETR 3\r\n"],
+        )
+
+    def test_pipeline_sends_one_command_at_a_time_without_server_support(self):
+        connection = self.get_connection(
+            b"".join(
+                [
+                    b"+OK\r\nUIDL\r\n.\r\n",
+                    b"+OK\r\none\r\n.\r\n",
+                    b"-ERR no such message\r\n",
+                ]
+            )
+        )
+
+        responses = connection.retr_many(["1", "2"])
+
+        self.assertEqual(responses[0][1], [b"one"])
+        self.assertIsInstance(responses[1], poplib.error_proto)
+        self.assertEqual(
+            [call.args[0] for call in connection.sock.sendall.call_args_list],
+            [b"CAPA\r\n", b"RETR 1\r\n", b"RETR 2\r\n"],
+        )
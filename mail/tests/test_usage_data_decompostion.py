@@ -5,6 +5,7 @@ from mail.libraries.helpers import get_good_id, read_file
 from mail.libraries.usage_data_decomposition import (
     build_edifact_file_from_data_blocks,
     build_json_payload_from_data_blocks,
+    get_parsed_usage_file,
     id_owner,
     split_edi_data_by_id,
 )
@@ -312,10 +313,36 @@ class FileDeconstruction(LiteHMRCTestClient):
         self.assertEqual(spire_data, spire_data_expected)
         self.assertEqual(lite_data, lite_data_expected)
 
+    def test_parsed_usage_file_is_stored_on_usage_data(self):
+        mail = Mail.objects.create(edi_filename="filename", edi_data=self.licence_usage_file_body.decode("utf-8"))
+        usage_data = UsageData.objects.create(mail=mail, spire_run_number=1, hmrc_run_number=1)
+
+        usage_file = get_parsed_usage_file(usage_data)
+
+        self.assertEqual(len(usage_file.spire_blocks), 8)
+        self.assertEqual(
+            [block[0] for block in usage_file.lite_blocks],
+            ["licenceUsage\\LU04148/00006\\insert\\GBSIEL/2020/0000001/P\\O\\"],
+        )
+        self.assertEqual(usage_file.line_numbers["LU04148/00007"], {"1": 36})
+
+        # Only the line ranges of the blocks are stored, not another copy of the file
+        self.assertEqual(usage_data.parsed_edi_data["lite_blocks"], [[29, 34]])
+        self.assertEqual(len(usage_data.parsed_edi_data["spire_blocks"]), 8)
+
+        # Later stages read the stored blocks rather than looking up the licence owners again
+        usage_data = UsageData.objects.select_related("mail").get(id=usage_data.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_parsed_usage_file(usage_data), usage_file)
+
     def test_spire_file_rebuild(self):
         spire_file = build_edifact_file_from_data_blocks(self.spire_data_expected)
         self.assertEqual(spire_file, self.expected_file_for_spire)
 
+    def test_spire_file_rebuild_without_blocks(self):
+        self.assertEqual(build_edifact_file_from_data_blocks([]), "")
+        self.assertEqual(build_edifact_file_from_data_blocks([[], ["fileTrailer\\0"]]), "1\\fileTrailer\\0")
+
     def test_lite_json_payload_create(self):
         LicencePayload.objects.create(reference="GBOGE2011/56789", lite_id="00000000-0000-0000-0000-000000000001")
         LicencePayload.objects.create(reference="GBOGE2017/98765", lite_id="00000000-0000-0000-0000-000000000002")
@@ -374,6 +401,42 @@ class FileDeconstruction(LiteHMRCTestClient):
 
         self.assertEqual(lite_payload, expected_lite_json_payload)
 
+    def test_lite_json_payload_resolves_ids_with_constant_number_of_queries(self):
+        for i, reference in enumerate(["GBSIEL/2020/0000008/P", "GBSIEL/2020/0000009/P"], start=1):
+            LicenceIdMapping.objects.create(lite_id=f"00000000-0000-0000-0000-00000000000{i}", reference=reference)
+            for line_number in [1, 2]:
+                GoodIdMapping.objects.create(
+                    lite_id=f"00000000-0000-0000-0000-0000000000{i}{line_number}",
+                    licence_reference=reference,
+                    line_number=line_number,
+                )
+        lite_data = [
+            [
+                f"licenceUsage\\LU04148/0000{i}\\insert\\{reference}\\O\\",
+                "line\\1\\17\\0\\",
+                "line\\2\\3\\0\\",
+                "line\\3\\1\\0\\",
+            ]
+            for i, reference in enumerate(["GBSIEL/2020/0000008/P", "GBSIEL/2020/0000009/P"], start=1)
+        ]
+
+        with self.assertNumQueries(2):
+            lite_payload = build_json_payload_from_data_blocks(lite_data)
+
+        self.assertEqual(
+            [(licence["id"], [good["id"] for good in licence["goods"]]) for licence in lite_payload["licences"]],
+            [
+                (
+                    "00000000-0000-0000-0000-000000000001",
+                    ["00000000-0000-0000-0000-000000000011", "00000000-0000-0000-0000-000000000012", None],
+                ),
+                (
+                    "00000000-0000-0000-0000-000000000002",
+                    ["00000000-0000-0000-0000-000000000021", "00000000-0000-0000-0000-000000000022", None],
+                ),
+            ],
+        )
+
     def test_de_mapping_goods(self):
         licence_reference = "GB2020/00001/SIE/P"
         lite_good_id = "00000000-0000-0000-0000-000000000001"
@@ -395,23 +458,75 @@ class FileDeconstruction(LiteHMRCTestClient):
 
         self.assertEqual(TransactionMapping.objects.count(), 2)
 
+    def test_create_transaction_mappings_with_constant_number_of_queries(self):
+        mail = Mail.objects.create(edi_filename="filename", edi_data="1\\fileHeader\\CHIEF\\SPIRE\\")
+        usage_data = UsageData.objects.create(mail=mail, spire_run_number=1, hmrc_run_number=1)
+        usage_file = self.licence_usage_file_body.decode("utf-8")
+        for i, reference in enumerate(["GBOGE2011/56789", "GBSIEL/2020/0000002/P", "GBOGE2018/34567"], start=1):
+            LicenceIdMapping.objects.create(lite_id=f"00000000-0000-0000-0000-00000000000{i}", reference=reference)
+
+        # One query each for the licence owners, the existing mappings, the mapped
+        # transactions and creating the new mappings
+        with self.assertNumQueries(4):
+            split_edi_data_by_id(usage_file, usage_data)
+
+        self.assertEqual(
+            set(TransactionMapping.objects.values_list("usage_transaction", "licence_reference", "line_number")),
+            {
+                ("LU04148/00003", "GBOGE2018/34567", 1),
+                ("LU04148/00005", "GBOGE2011/56789", 1),
+                ("LU04148/00006", "GBSIEL/2020/0000001/P", 1),
+                ("LU04148/00007", "GBSIEL/2020/0000002/P", 1),
+            },
+        )
+
+    def test_create_transaction_mappings_for_licence_without_lines(self):
+        mail = Mail.objects.create(edi_filename="filename", edi_data="1\\fileHeader\\CHIEF\\SPIRE\\")
+        usage_data = UsageData.objects.create(mail=mail, spire_run_number=1, hmrc_run_number=1)
+        usage_file = "\n".join(
+            [
+                "1\\fileHeader\\CHIEF\\SPIRE\\usageData\\201901130300\\49543\\",
+                "2\\licenceUsage\\LU04148/00006\\insert\\GBSIEL/2020/0000001/P\\O\\",
+                "3\\end\\licenceUsage\\2",
+                "4\\fileTrailer\\1",
+            ]
+        )
+
+        split_edi_data_by_id(usage_file, usage_data)
+        split_edi_data_by_id(usage_file, usage_data)
+
+        self.assertEqual(
+            list(TransactionMapping.objects.values_list("usage_transaction", "licence_reference", "line_number")),
+            [("LU04148/00006", "GBSIEL/2020/0000001/P", None)],
+        )
+
+    def test_create_transaction_mappings_is_idempotent(self):
+        mail = Mail.objects.create(edi_filename="filename", edi_data="1\\fileHeader\\CHIEF\\SPIRE\\")
+        usage_data = UsageData.objects.create(mail=mail, spire_run_number=1, hmrc_run_number=1)
+        usage_file = self.licence_usage_file_body.decode("utf-8")
+
+        split_edi_data_by_id(usage_file, usage_data)
+        split_edi_data_by_id(usage_file, usage_data)
+
+        self.assertEqual(TransactionMapping.objects.count(), 1)
+
     def test_lite_usage_only_open_licences_are_processed(self):
         usage_data_from_hmrc = [
             [
                 "licenceUsage\\LU05234/00318\\insert\\GBSIEL/2021/0000088/P\\C\\20210218",
-                "line\1\\3\\0\\",
+                "line\\1\\3\\0\\",
                 "end\\line\\2",
-                "line\\2\12\\0\\",
+                "line\\2\\12\\0\\",
                 "end\\line\\2",
                 "end\\licenceUsage\\6",
             ],
             [
                 "licenceUsage\\LU05235/00318\\insert\\GBSIEL/2021/0000090/P\\E\\20210821",
-                "line\1\\3\\0\\",
+                "line\\1\\3\\0\\",
                 "end\\line\\2",
-                "line\\2\12\\0\\",
+                "line\\2\\12\\0\\",
                 "end\\line\\2",
-                "line\\3\10\\0\\",
+                "line\\3\\10\\0\\",
                 "end\\line\\3",
                 "end\\licenceUsage\\8",
             ],
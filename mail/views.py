@@ -118,8 +118,11 @@ class Licence(APIView):
         """Fetch existing licence"""
         license_ref = request.GET.get("id", "")
 
-        matching_licences = LicenceData.objects.filter(licence_ids__contains=license_ref)
-        matching_licences_count = matching_licences.count()
+        # Fetching two is enough to know whether the reference matches more than one file
+        matching_licences = list(
+            LicenceData.objects.filter(licence_references__reference=license_ref).select_related("mail")[:2]
+        )
+        matching_licences_count = len(matching_licences)
 
         if matching_licences_count > 1:
             logger.warning("Too many matches for licence '%s'", license_ref)
@@ -130,7 +133,7 @@ class Licence(APIView):
             return JsonResponse({}, status=status.HTTP_404_NOT_FOUND)
 
         # Return single matching licence
-        mail = matching_licences.first().mail
+        mail = matching_licences[0].mail
         serializer = MailSerializer(mail)
 
         return JsonResponse(serializer.data)